@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import statistics
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import pandas as pd
+from src.metrics import (
+    calculate_bleu,
+    contiguous_regions,
+    get_contiguous_match_indices,
+    contiguous_ngram_match,
+    contiguous_fuzzy_match,
+    get_weighted_ngram_score,
+    get_weighted_ngram_score_hashed,
+)
+from src.corpus import TokenizedCorpus
+
+parser = argparse.ArgumentParser(
+    description="""Micro-benchmarks of the matching functions in src/metrics.py on synthetic Swedish-like texts.
+    Reports time and peak memory (tracemalloc) per function and saves the results as JSON,
+    so that runs on different commits can be compared with --compare."""
+)
+parser.add_argument("--speech_words", type=int, nargs="+", default=[100, 500, 2000], help="Speech lengths in words.")
+parser.add_argument("--debate_words", type=int, nargs="+", default=[2000, 10000, 40000], help="Debate lengths in words.")
+parser.add_argument("--edit_rate", type=float, nargs="+", default=[0.05, 0.2], help="Share of words edited in the speech.")
+parser.add_argument("--noise_rate", type=float, default=0.05, help="Share of random words inserted in the debate.")
+parser.add_argument("--functions", type=str, nargs="+", default=None, help="Subset of functions to benchmark.")
+parser.add_argument("--repeats", type=int, default=3)
+parser.add_argument(
+    "--max_reference_words",
+    type=int,
+    default=10000,
+    help="Skip the (slow) reference implementation get_weighted_ngram_score for longer debates.",
+)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", type=str, default=None, help="Output JSON (default: data/benchmarks/metrics_<commit>.json).")
+parser.add_argument("--compare", type=str, default=None, help="Earlier benchmark JSON to compare against.")
+
+
+CONSONANTS = ["b", "d", "f", "g", "h", "j", "k", "l", "m", "n", "p", "r", "s", "t", "v", "sk", "st", "tj", "sj", "kr"]
+VOWELS = ["a", "e", "i", "o", "u", "y", "å", "ä", "ö"]
+ENDINGS = ["", "", "en", "et", "na", "ar", "er", "or", "de", "ning", "het", "lig", "are"]
+
+
+def generate_vocabulary(rng, size=20000):
+    """
+    Generate a vocabulary of Swedish-like words from random syllables.
+
+    Args:
+        rng (np.random.Generator): Random number generator.
+        size (int): Number of unique words.
+
+    Returns:
+        np.array: Array of unique words.
+    """
+
+    vocab = set()
+    while len(vocab) < size:
+        nr_syllables = rng.integers(1, 4)
+        word = "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(nr_syllables))
+        vocab.add(word + rng.choice(ENDINGS))
+
+    return np.array(sorted(vocab))
+
+
+def generate_words(rng, vocab, nr_words):
+    """
+    Sample nr_words words from vocab with Zipf-like word frequencies.
+    """
+    ranks = np.arange(1, len(vocab) + 1)
+    probabilities = 1 / ranks
+    probabilities /= probabilities.sum()
+    return list(rng.choice(vocab, size=nr_words, p=probabilities))
+
+
+def perturb_words(rng, words, vocab, edit_rate):
+    """
+    Simulate transcription errors. A share edit_rate of the words are either
+    substituted, deleted, split in two or get a character level typo.
+    """
+
+    perturbed = []
+    for word in words:
+        if rng.random() >= edit_rate:
+            perturbed.append(word)
+            continue
+
+        edit = rng.integers(4)
+        if edit == 0:
+            perturbed.append(rng.choice(vocab))
+        elif edit == 1:
+            continue
+        elif edit == 2 and len(word) > 3:
+            split = rng.integers(1, len(word) - 1)
+            perturbed.extend([word[:split], word[split:]])
+        else:
+            position = rng.integers(len(word))
+            perturbed.append(word[:position] + rng.choice(VOWELS) + word[position + 1 :])
+
+    return perturbed
+
+
+def generate_speech_debate(rng, vocab, speech_words, debate_words, edit_rate, noise_rate):
+    """
+    Generate an official speech text and a "transcribed" debate text that contains a
+    perturbed version of the speech somewhere in the middle.
+
+    Args:
+        rng (np.random.Generator): Random number generator.
+        vocab (np.array): Vocabulary, via generate_vocabulary().
+        speech_words (int): Length of the speech in words.
+        debate_words (int): Length of the debate in words (at least speech_words).
+        edit_rate (float): Share of the speech words that are perturbed in the debate.
+        noise_rate (float): Share of random words inserted in the debate version of the speech.
+
+    Returns:
+        tuple: Speech text (like anftext_normalized) and debate text (like anftext_inference).
+    """
+
+    speech = generate_words(rng, vocab, speech_words)
+    transcribed = perturb_words(rng, speech, vocab, edit_rate)
+
+    # Insertion noise (hesitations, words missing from the official text)
+    nr_insertions = int(len(transcribed) * noise_rate)
+    positions = np.sort(rng.integers(0, len(transcribed) + 1, size=nr_insertions))[::-1]
+    for position, word in zip(positions, generate_words(rng, vocab, nr_insertions)):
+        transcribed.insert(position, word)
+
+    nr_context = max(debate_words - len(transcribed), 0)
+    nr_before = nr_context // 2
+    context = generate_words(rng, vocab, nr_context)
+    debate = context[:nr_before] + transcribed + context[nr_before:]
+
+    return " ".join(speech), " ".join(debate)
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+def measure(function, args, repeats=3):
+    """
+    Time function(*args) repeats times and measure its peak memory with tracemalloc
+    in one separate call (tracemalloc slows down the timed runs otherwise).
+
+    Returns:
+        dict: Minimum and median time in seconds and peak memory in bytes.
+    """
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(*args)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"time_min": min(times), "time_median": statistics.median(times), "peak_memory": peak_memory}
+
+
+def get_benchmarks(speech, debate, corpus):
+    """
+    Functions to benchmark with their arguments for one speech/debate pair.
+    """
+
+    scores = get_weighted_ngram_score_hashed(speech, debate, n=6, corpus=corpus)
+    return {
+        "contiguous_ngram_match": (contiguous_ngram_match, (speech, debate, 6, 1.3, 8, 30)),
+        "contiguous_ngram_match_corpus": (contiguous_ngram_match, (speech, debate, 6, 1.3, 8, 30, corpus)),
+        "contiguous_fuzzy_match": (contiguous_fuzzy_match, (speech, debate, 55)),
+        "get_weighted_ngram_score": (get_weighted_ngram_score, (speech, debate, 6)),
+        "get_weighted_ngram_score_hashed": (get_weighted_ngram_score_hashed, (speech, debate, 6, corpus)),
+        "contiguous_regions": (contiguous_regions, (scores > 1.3,)),
+        "get_contiguous_match_indices": (get_contiguous_match_indices, (scores, 1.3, 8, 30)),
+        "calculate_bleu": (calculate_bleu, (speech, debate)),
+    }
+
+
+def compare(results, previous_results):
+    """
+    Print time and memory ratios (current / previous) for benchmarks present in both runs.
+    """
+
+    def key(result):
+        return (result["function"], result["speech_words"], result["debate_words"], result["edit_rate"])
+
+    previous = {key(result): result for result in previous_results}
+    rows = []
+    for result in results:
+        if key(result) not in previous:
+            continue
+        old = previous[key(result)]
+        rows.append(
+            [
+                *key(result),
+                old["time_min"],
+                result["time_min"],
+                result["time_min"] / old["time_min"],
+                result["peak_memory"] / max(old["peak_memory"], 1),
+            ]
+        )
+
+    columns = ["function", "speech", "debate", "edit_rate", "old_s", "new_s", "time_ratio", "memory_ratio"]
+    print(pd.DataFrame(rows, columns=columns).to_string(index=False, float_format="{:.4g}".format))
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    vocab = generate_vocabulary(rng)
+
+    results = []
+    for debate_words in args.debate_words:
+        for speech_words in args.speech_words:
+            if speech_words > debate_words:
+                continue
+            for edit_rate in args.edit_rate:
+                speech, debate = generate_speech_debate(
+                    rng, vocab, speech_words, debate_words, edit_rate, args.noise_rate
+                )
+                corpus = TokenizedCorpus.from_texts([speech, debate])
+
+                for name, (function, function_args) in get_benchmarks(speech, debate, corpus).items():
+                    if args.functions is not None and name not in args.functions:
+                        continue
+                    if name == "get_weighted_ngram_score" and debate_words > args.max_reference_words:
+                        continue
+
+                    result = {
+                        "function": name,
+                        "speech_words": speech_words,
+                        "debate_words": debate_words,
+                        "edit_rate": edit_rate,
+                        "noise_rate": args.noise_rate,
+                        **measure(function, function_args, repeats=args.repeats),
+                    }
+                    results.append(result)
+                    print(
+                        f"{name:<32} speech={speech_words:<6} debate={debate_words:<6} edit_rate={edit_rate:<5} "
+                        f"time={result['time_min']:.4f}s peak_memory={result['peak_memory'] / 2**20:.1f}MiB"
+                    )
+
+    commit = get_commit()
+    output = args.output or f"data/benchmarks/metrics_{commit}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "processor": platform.processor(),
+                "args": vars(args),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Saved benchmark results to {output}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
@@ -1,4 +1,6 @@
 import multiprocessing as mp
+import sys
+from pathlib import Path
 
 import librosa
 import pandas as pd
@@ -8,7 +10,11 @@ from pyannote.audio import Pipeline
 from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 
-df = pd.read_parquet("data/df_audio_metadata.parquet").reset_index(drop=True)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.schema import read_metadata, write_metadata
+
+df = read_metadata("data/df_audio_metadata.parquet", compact=False)
 # df["filename_anforande_mp3"] = df["filename_anforande_audio"].str[:-3] + "mp3"
 
 
@@ -46,4 +52,4 @@ with mp.Pool(26) as p:
 
 df["valid_audio"] = valid_audio
 df["valid_audio"] = df["valid_audio"].str[0]
-df.to_parquet("data/df_audio_metadata.parquet")
+write_metadata(df, "data/df_audio_metadata.parquet")
@@ -1,13 +1,25 @@
+import os
+import sys
 import pandas as pd
 from pathlib import Path
 from tqdm import tqdm
 
-df = pd.read_parquet("data/df_audio_metadata.parquet")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-# If you chunked your processing in speech_finder.py, concatenate the rsults together
-# to a single dataframe (df_timestamp.parquet and df_speaker_debate.parquet)
-df_timestamp = pd.read_parquet("data/df_timestamp.parquet")
-df_diarization = pd.read_parquet("data/df_speakers_debate.parquet")
+from src.checkpoint import merge_checkpoints
+from src.schema import read_metadata, write_metadata
+
+df = read_metadata("data/df_audio_metadata.parquet", compact=False)
+
+# Merge the results of all runs of speech_finder.py from its checkpoints
+# to single dataframes (df_timestamp.parquet and df_speakers_debate.parquet)
+checkpoint_dir = "data/checkpoints/speech_finder"
+if os.path.exists(checkpoint_dir):
+    df_timestamp = merge_checkpoints(checkpoint_dir, "timestamp", "data/df_timestamp.parquet")
+    df_diarization = merge_checkpoints(checkpoint_dir, "diarization", "data/df_speakers_debate.parquet")
+else:
+    df_timestamp = pd.read_parquet("data/df_timestamp.parquet")
+    df_diarization = pd.read_parquet("data/df_speakers_debate.parquet")
 
 # Left join the columns dokid, anforance_nummer, debatedate from df in to df_timestamp
 df_timestamp = df_timestamp.merge(
@@ -137,7 +149,7 @@ df = df.merge(
     how="left",
 )
 
-df.to_parquet("data/df_audio_metadata_final.parquet", index=False)
+write_metadata(df, "data/df_audio_metadata_final.parquet")
 
 # df = pd.read_parquet("data/df_audio_metadata_final.parquet")
 df = df[~df["start_segment"].isna()].reset_index(drop=True)
@@ -171,4 +183,4 @@ df["debateurl_timestamp"] = (
 )
 
 # Filtered version
-df.to_parquet("data/df_metadata.parquet", index=False)
+write_metadata(df, "data/df_metadata.parquet")
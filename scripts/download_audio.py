@@ -1,14 +1,13 @@
-import multiprocessing as mp
 import pandas as pd
 import sys
 import argparse
-from tqdm.contrib.concurrent import process_map
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from src.api import get_audio_file
+from src.async_api import fetch_audio_files
 from src.data import audio_to_dokid_folder, audiofile_exists
+from src.schema import read_metadata, write_metadata
 
 parser = argparse.ArgumentParser(
     description="""Read json files of riksdagens anföranden, save relevant metadata fields to file."""
@@ -18,7 +17,7 @@ parser.add_argument("-f", "--folder", type=str, default="data/audio")
 args = parser.parse_args()
 
 # Read data
-df = pd.read_parquet("data/df_audio_metadata.parquet")
+df = read_metadata("data/df_audio_metadata.parquet", compact=False)
 
 # Subset only speeches which we haven't already downloaded audio for
 df["audiofile_exists"] = df[["dokid", "audiofileurl"]].apply(
@@ -30,7 +29,7 @@ df_undownloaded = df[df["audiofile_exists"] == False].reset_index(drop=True)
 audio_download_urls = df_undownloaded["audiofileurl"].unique().tolist()
 
 # Download audio files
-process_map(get_audio_file, audio_download_urls, max_workers=mp.cpu_count(), chunksize=5)
+fetch_audio_files(audio_download_urls, folder="data/audio", concurrency=16)
 
 # Move audio files to folder named after dokid
 audio_to_dokid_folder(df)
@@ -40,4 +39,4 @@ df["filename"] = df.apply(lambda x: x["dokid"] + "/" + x["audiofileurl"].rsplit(
 df = df.drop(columns=["audiofile_exists"])
 
 # Save updated df with audio filepaths
-df.to_parquet("data/df_audio_metadata.parquet", index=False)
+write_metadata(df, "data/df_audio_metadata.parquet")
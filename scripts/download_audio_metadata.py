@@ -1,16 +1,31 @@
-import multiprocessing as mp
 import pandas as pd
-import locale
 import sys
+import argparse
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from src.api import get_audio_metadata
-from src.data import coalesce_columns
-from tqdm.contrib.concurrent import process_map  # multiprocessing from tqdm
+from src.async_api import CACHE_MODES, fetch_audio_metadata
+from src.cache import ResponseCache
+from src.data import coalesce_columns, preprocess_audio_metadata_batch
+from src.schema import write_metadata
 
-locale.setlocale(locale.LC_ALL, "sv_SE.UTF-8")  # Swedish date format
+parser = argparse.ArgumentParser(
+    description="""Download the mhs-vodapi metadata of the debates of the speeches in df_anforanden_metadata.parquet
+    and save the preprocessed audio metadata to df_audio_metadata.parquet. The raw responses are cached, so a rerun
+    (e.g. after changing the preprocessing) only downloads responses that aren't cached yet."""
+)
+parser.add_argument("--cache_folder", type=str, default="data/cache/mhs-vodapi")
+parser.add_argument(
+    "--cache_mode",
+    type=str,
+    default="use",
+    choices=CACHE_MODES,
+    help="""use: only download responses missing from the cache. revalidate: check cached responses with the server
+    (ETag/Last-Modified) and download changed ones. offline: only use cached responses.""",
+)
+parser.add_argument("--no_cache", action="store_true", help="Download all responses and don't cache them.")
+args = parser.parse_args()
 
 df = pd.read_parquet("data/df_anforanden_metadata.parquet")
 df = df[~pd.isna(df["rel_dok_id"])].reset_index(drop=True)
@@ -20,16 +35,14 @@ first_rel_dok_id = df[df["rel_dok_id"].str.contains(",")]["rel_dok_id"].str.extr
 df.loc[df["rel_dok_id"].str.contains(","), "rel_dok_id"] = first_rel_dok_id.iloc[:, 0].tolist()
 
 # Downlaod audio metadata from unique rel_dok_ids (debates)
-df_list = process_map(
-    get_audio_metadata,
-    df["rel_dok_id"].unique().tolist(),
-    max_workers=mp.cpu_count(),
-    chunksize=20,
-)
+rel_dok_ids = df["rel_dok_id"].unique().tolist()
+cache = None if args.no_cache else ResponseCache(args.cache_folder)
+cache_mode = "use" if args.no_cache else args.cache_mode
+responses = fetch_audio_metadata(rel_dok_ids, concurrency=32, cache=cache, cache_mode=cache_mode)
 
-df_audiometa = pd.concat(df_list, axis=0)
-df_audiometa = df_audiometa.reset_index(drop=True)
-df_audiometa["debatedate"] = pd.to_datetime(df_audiometa["debatedate"], format="%d %B %Y")
+# Flatten all responses to one table, clean the texts and parse the (Swedish) debate dates in one go
+responses = {rel_dok_id: response for rel_dok_id, response in zip(rel_dok_ids, responses) if isinstance(response, dict)}
+df_audiometa = preprocess_audio_metadata_batch(list(responses.values()), rel_dok_ids=list(responses))
 df_audiometa.loc[df_audiometa["anftext"] == "", "anftext"] = None
 
 # # Add direct timestamped link to webb-tv to start video where a speech begins
@@ -64,4 +77,4 @@ df_audiometa = df_audiometa[~df_audiometa.duplicated(keep="first")].reset_index(
 # Drop speeches with no text
 df_audiometa = df_audiometa[~df_audiometa["anftext"].isna()].reset_index(drop=True)
 
-df_audiometa.to_parquet("data/df_audio_metadata.parquet", index=False)
+write_metadata(df_audiometa, "data/df_audio_metadata.parquet")
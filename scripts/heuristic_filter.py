@@ -10,10 +10,11 @@ from tqdm import tqdm
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from src.audio import split_audio_by_speech
+from src.schema import read_metadata, write_metadata
 
 pd.set_option("display.max_colwidth", 110)
 
-df = pd.read_parquet("data/df_metadata.parquet")
+df = read_metadata("data/df_metadata.parquet", compact=False)
 
 df["start_diff"] = df["start_segment"] - df["start"]
 df["end_diff"] = df["end_segment"] - df["end"]
@@ -79,7 +80,7 @@ for filename in tqdm(df["filename_anforande_audio"].unique()):
         shutil.move((Path("data/audio2") / Path(filename)), (Path("data/audio") / Path(filename)))
 
 
-df.to_parquet("data/df_final_metadata.parquet", index=False)
+write_metadata(df, "data/df_final_metadata.parquet", partitioned=False)
 
 ####
 # GR01JUU18 klipptes inte rätt. Del av Peter Althins tal (164) klipptes bort.
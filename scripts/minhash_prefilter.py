@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd
+from src.minhash import MinHashSignatures, get_prefilter_recall
+
+parser = argparse.ArgumentParser(
+    description="""Compute MinHash signatures of text pairs and report the recall of the MinHash prefilter
+    (src/minhash.py) against the results of the full matchers, for several similarity thresholds.
+    Pass the chosen threshold as min_similarity to contiguous_ngram_indices()/contiguous_fuzzy_indices()."""
+)
+parser.add_argument("--input", type=str, default="data/df_inference_bleu_eval_2016_2023.parquet")
+parser.add_argument("--column_in", type=str, default="anftext_normalized")
+parser.add_argument("--column_out", type=str, default="anftext_inference")
+parser.add_argument(
+    "--match_columns",
+    type=str,
+    nargs="+",
+    default=["start_align_i"],
+    help="Start index columns of the full matchers (run on column_in -> column_out) in the input. "
+    "text_matcher.py gives the word alignment (start_align_i).",
+)
+parser.add_argument("--measure", type=str, default="containment", choices=["containment", "jaccard"])
+parser.add_argument("--thresholds", type=float, nargs="+", default=[0.05, 0.1, 0.2, 0.3, 0.4])
+parser.add_argument("--num_perm", type=int, default=128)
+parser.add_argument("--shingle_size", type=int, default=3)
+parser.add_argument("--signature_dir", type=str, default="data/minhash")
+parser.add_argument("--output", type=str, default="data/minhash/prefilter_recall.json")
+args = parser.parse_args()
+
+df = pd.read_parquet(args.input, columns=[args.column_in, args.column_out, *args.match_columns])
+df = df.astype({args.column_in: object, args.column_out: object}).where(df.notna(), None)
+
+# Reuse stored signatures if they were computed with the same parameters
+if os.path.exists(os.path.join(args.signature_dir, "signatures.parquet")):
+    minhash = MinHashSignatures.load(args.signature_dir)
+    if (minhash.num_perm, minhash.shingle_size) != (args.num_perm, args.shingle_size):
+        minhash = MinHashSignatures(num_perm=args.num_perm, shingle_size=args.shingle_size)
+else:
+    minhash = MinHashSignatures(num_perm=args.num_perm, shingle_size=args.shingle_size)
+
+texts_in = df[args.column_in].tolist()
+texts_out = df[args.column_out].tolist()
+if args.measure == "containment":
+    similarity = minhash.estimate_containment(texts_in, texts_out)
+else:
+    similarity = minhash.estimate_jaccard(texts_in, texts_out)
+minhash.save(args.signature_dir)
+
+report = []
+for match_column in args.match_columns:
+    matches = [(None if pd.isna(start) else start,) for start in df[match_column]]
+    for min_similarity in args.thresholds:
+        recall = get_prefilter_recall(similarity >= min_similarity, matches)
+        report.append(
+            {"match_column": match_column, "measure": args.measure, "min_similarity": min_similarity, **recall}
+        )
+
+df_report = pd.DataFrame(report)
+print(df_report.to_string(index=False))
+
+os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+with open(args.output, "w") as f:
+    json.dump(report, f, indent=2)
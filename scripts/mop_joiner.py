@@ -5,21 +5,14 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from src.data import coalesce_columns
+from src.speakers import read_person_records, join_person_records, fill_with_speaker_mode
+from src.schema import read_metadata, write_metadata
 
-df = pd.read_parquet("data/df_audio_metadata.parquet")
-df_person = pd.read_csv("person.csv")
+df = read_metadata("data/df_audio_metadata.parquet", compact=False)
+df_person = read_person_records("person.csv")
 
-df_person["From"] = pd.to_datetime(df_person["From"])
-df_person["Tom"] = pd.to_datetime(df_person["Tom"])
-
-df_person = df_person.groupby("Id").first().reset_index()
-
-df = df.merge(
-    df_person[["Id", "Förnamn", "Efternamn", "Parti", "Kön", "Född", "Valkrets"]],
-    left_on="intressent_id",
-    right_on="Id",
-    how="left",
-)
+# Party, electoral district etc. of the speaker at the date of the speech
+df = join_person_records(df, df_person, id_column="intressent_id", date_column="debatedate")
 
 df["speaker"] = df["Förnamn"] + " " + df["Efternamn"]
 
@@ -48,14 +41,10 @@ df.loc[df["Kön"] == "man", "gender"] = "male"
 df.loc[df["Kön"] == "kvinna", "gender"] = "female"
 
 df = df.rename(columns={"Valkrets": "electoral_district", "Född": "birth_year", "Parti": "party"})
-df = df.drop(columns=["Förnamn", "Efternamn", "Kön", "Id"])
+df = df.drop(columns=["Förnamn", "Efternamn", "Kön"])
 
 
-df[["speaker", "intressent_id", "gender", "electoral_district", "birth_year"]] = (
-    df[["speaker", "intressent_id", "gender", "electoral_district", "birth_year"]]
-    .groupby("speaker", group_keys=False)
-    .apply(lambda x: x.fillna(x.mode().iloc[0]))
-    .reset_index(drop=True)
-)
+# Fill missing values with the most common value of the speaker
+df = fill_with_speaker_mode(df, ["intressent_id", "gender", "electoral_district", "birth_year"], by="speaker")
 
-df.to_parquet("df_audio_metadata.parquet", index=False)
+write_metadata(df, "df_audio_metadata.parquet")
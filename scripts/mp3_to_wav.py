@@ -8,16 +8,17 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 import pandas as pd
 from tqdm import tqdm
 from src.audio import convert_mp3_to_wav
+from src.schema import read_metadata
 
 
-df = pd.read_parquet("data/df_audio_metadata.parquet")
+df = read_metadata("data/df_audio_metadata.parquet", columns=["filename"])
 
 # Convert mp3 to wav using multiprocessing library mp.Pool
 # Track progress with tqdm
 with mp.Pool(16) as pool:
     pool.map(
         convert_mp3_to_wav,
-        tqdm(df["filename"].unique(), total=len(df["filename"].unique())),
+        tqdm(df["filename"].unique().tolist(), total=df["filename"].nunique()),
         chunksize=2,
     )
 
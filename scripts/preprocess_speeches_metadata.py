@@ -1,46 +1,183 @@
 import sys
 import pandas as pd
 import argparse
-import json
 import os
+import shutil
+import multiprocessing as mp
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from tqdm import tqdm
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from src.data import preprocess_text
+from src.data import TextCleaner, iter_zip_speeches, iter_json_speeches, iter_speech_batches
 
 parser = argparse.ArgumentParser(
-    description="""Read json files of riksdagens anföranden, save relevant metadata fields to file."""
+    description="""Read json files of riksdagens anföranden, save relevant metadata fields to file.
+    The json files are read directly from the zip archives downloaded by download_text_anforanden.sh.
+    Each archive (or riksmöte folder, or chunk of unzipped files) is read and cleaned in its own worker process."""
 )
 parser.add_argument("-f", "--folder", type=str, default="data/json")
 parser.add_argument("-d", "--dest_folder", type=str, default="data")
+parser.add_argument("-p", "--processes", type=int, default=None, help="Number of processes. Default: all available.")
+parser.add_argument(
+    "--files_per_chunk",
+    type=int,
+    default=5000,
+    help="Number of json files per task for json files directly in --folder (not in a riksmöte subfolder).",
+)
+parser.add_argument("--batch_size", type=int, default=10000, help="Number of speeches per record batch.")
 args = parser.parse_args()
 
-json_files = [
-    os.path.join(args.folder, filename) for filename in os.listdir(args.folder) if filename.endswith(".json")
-]
 
-json_speeches = []
+def get_sources(folder, files_per_chunk=5000):
+    """
+    Split the speeches into units of work: one per .json.zip archive in folder, one per
+    riksmöte subfolder of unzipped json files, plus chunks of files_per_chunk files for
+    json files placed directly in folder.
+
+    Returns:
+        list: Paths to zip archives and lists of json file paths.
+    """
+
+    sources = []
+    loose_files = []
+    for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+        if entry.is_dir():
+            files = sorted(os.path.join(entry.path, name) for name in os.listdir(entry.path) if name.endswith(".json"))
+            if len(files) > 0:
+                sources.append(files)
+        elif entry.name.endswith(".json.zip"):
+            sources.append(entry.path)
+        elif entry.name.endswith(".json"):
+            loose_files.append(entry.path)
+
+    for i in range(0, len(loose_files), files_per_chunk):
+        sources.append(loose_files[i : i + files_per_chunk])
+
+    return sources
+
+
+def iter_speeches(source):
+    if isinstance(source, str):
+        return iter_zip_speeches(source)
+    return iter_json_speeches(source)
+
+
+def count_headers(source):
+    """
+    Number of speeches per header (avsnittsrubrik) in a source, and the fields of its
+    speeches in order of appearance.
+    """
+
+    headers = []
+    fields = {}
+    for speech in iter_speeches(source):
+        headers.append(speech.get("avsnittsrubrik"))
+        for field in speech:
+            fields.setdefault(field, None)
+
+    df = pd.DataFrame(headers, columns=["avsnittsrubrik"])
+    return df.groupby("avsnittsrubrik").size(), list(fields)
+
+
+# Set in worker processes by init_worker_cleaner()
+_worker_cleaner = None
+
+
+def init_worker_cleaner(headers):
+    """
+    Pool initializer that builds the TextCleaner once per worker process.
+    """
+    global _worker_cleaner
+    _worker_cleaner = TextCleaner(headers)
 
-for file in tqdm(json_files):
-    with open(os.path.join(file), "r", encoding="utf-8-sig") as f:
-        json_speeches.append(json.load(f)["anforande"])
 
-print("Normalizing json to dataframe...")
-df = pd.json_normalize(json_speeches)
-# df = df.drop(columns=["anforandetext"])
-df["anforande_nummer"] = df["anforande_nummer"].astype(int)
+def preprocess_source(job):
+    """
+    Read, clean and sort the speeches of one unit of work in record batches and save them
+    to a parquet part.
 
-# Headers to clean up when next script is run (download_audio_metadata.py)
-headers = df.groupby("avsnittsrubrik").size().sort_values(ascending=False).head(1000)
+    Args:
+        job (tuple): Index of the part, source (see get_sources()), schema of the speeches,
+            number of speeches per batch and folder of the parts.
+
+    Returns:
+        str: Path of the parquet part, or None if there were no speeches.
+    """
+
+    i, source, schema, batch_size, parts_folder = job
+
+    batches = []
+    for batch in iter_speech_batches(iter_speeches(source), schema, batch_size):
+        texts = batch.column("anforandetext").to_pylist()
+        cleaned = pa.array([None if text is None else _worker_cleaner.clean(text) for text in texts], pa.string())
+        batches.append(batch.set_column(schema.get_field_index("anforandetext"), "anforandetext", cleaned))
+
+    if len(batches) == 0:
+        return None
+
+    table = pa.Table.from_batches(batches, schema)
+    table = table.set_column(
+        schema.get_field_index("anforande_nummer"), "anforande_nummer", pc.cast(table["anforande_nummer"], pa.int64())
+    )
+    rel_dok_id = table["rel_dok_id"]
+    table = table.set_column(
+        schema.get_field_index("rel_dok_id"),
+        "rel_dok_id",
+        pc.if_else(pc.equal(rel_dok_id, ""), pa.scalar(None, pa.string()), rel_dok_id),
+    )
+    table = table.sort_by([("dok_id", "ascending"), ("anforande_nummer", "ascending")])
+
+    part_path = os.path.join(parts_folder, f"part-{i:05d}.parquet")
+    pq.write_table(table, part_path)
+    return part_path
+
+
+def merge_parts(part_paths, output_path):
+    """
+    Write the parquet parts (which share one schema) to a single parquet file, one row
+    group at a time.
+    """
+
+    schema = pq.read_schema(part_paths[0])
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for path in tqdm(part_paths):
+            part = pq.ParquetFile(path)
+            for j in range(part.num_row_groups):
+                writer.write_table(part.read_row_group(j))
+
+
+sources = get_sources(args.folder, args.files_per_chunk)
+
+# Headers to clean up in preprocess_text (also when download_audio_metadata.py is run)
+print("Counting headers...")
+with mp.Pool(args.processes) as pool:
+    results = list(tqdm(pool.imap(count_headers, sources), total=len(sources)))
+header_counts = [counts for counts, _ in results]
+
+# All fields of the speeches, in order of appearance. The json values are all strings.
+fields = {field: None for _, source_fields in results for field in source_fields}
+schema = pa.schema([(field, pa.string()) for field in fields])
+
+# Merged per-file counts, sorted by header like a groupby over all speeches
+headers = pd.concat(header_counts).groupby(level=0).sum()
+headers.index.name = "avsnittsrubrik"
+headers = headers.sort_values(ascending=False).head(1000)
 headers.reset_index().rename(columns={0: "count"}).to_csv("data/headers.csv", index=False)
+# Read back like preprocess_text() does, so the headers are formatted the same way
+headers = pd.read_csv("data/headers.csv")["avsnittsrubrik"].tolist()
 
 print("Preprocessing text...")
-df = preprocess_text(df, textcol="anforandetext")
-
-df = df.sort_values(["dok_id", "anforande_nummer"]).reset_index(drop=True)
-df.loc[df["rel_dok_id"] == "", "rel_dok_id"] = None
+parts_folder = os.path.join(args.dest_folder, "df_anforanden_metadata_parts")
+os.makedirs(parts_folder, exist_ok=True)
+jobs = [(i, source, schema, args.batch_size, parts_folder) for i, source in enumerate(sources)]
+with mp.Pool(args.processes, initializer=init_worker_cleaner, initargs=(headers,)) as pool:
+    part_paths = list(tqdm(pool.imap(preprocess_source, jobs), total=len(jobs)))
 
-print(f"Saving file to {os.path.join(args.dest_folder, 'df_anforanden_metadata.parquet')}")
-df.to_parquet(os.path.join(args.dest_folder, "df_anforanden_metadata.parquet"))
+output_path = os.path.join(args.dest_folder, "df_anforanden_metadata.parquet")
+print(f"Saving file to {output_path}")
+merge_parts([path for path in part_paths if path is not None], output_path)
+shutil.rmtree(parts_folder)
@@ -1,19 +1,37 @@
+import sys
 import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.schema import read_metadata, write_metadata
 
 pd.set_option("display.max_colwidth", 95)
 
 df = pd.read_parquet("data/df_inference_bleu_eval.parquet")
-df_meta = pd.read_parquet("data/df_final_metadata.parquet")
+df_meta = read_metadata("data/df_final_metadata.parquet", compact=False)
 
 df = df_meta.merge(
-    df[["dokid", "anforande_nummer", "contiguous_fuzzy_match", "anftext_normalized", "bleu_score"]],
+    df[
+        [
+            "dokid",
+            "anforande_nummer",
+            "start_fuzzy_a",
+            "end_fuzzy_a",
+            "fuzzy_score_a",
+            "anftext_normalized",
+            "bleu_score",
+        ]
+    ],
     on=["dokid", "anforande_nummer"],
     how="left",
 )
 
-df["fuzzy_score_speech"] = df["contiguous_fuzzy_match"].apply(lambda x: x[2])
-df["start_fuzzy_speech"] = df["contiguous_fuzzy_match"].apply(lambda x: int(x[0]))
-df["end_fuzzy_speech"] = df["contiguous_fuzzy_match"].apply(lambda x: int(x[1]))
+# Fuzzy match of anftext_inference in anftext_normalized (indices in anftext_normalized)
+df["fuzzy_score_speech"] = df["fuzzy_score_a"]
+df["start_fuzzy_speech"] = df["start_fuzzy_a"]
+df["end_fuzzy_speech"] = df["end_fuzzy_a"]
+df = df.drop(columns=["start_fuzzy_a", "end_fuzzy_a", "fuzzy_score_a"])
 
 # Count the number of words in anftext_inference
 df["nr_words_inference"] = df["anftext_normalized"].str.split().str.len()
@@ -50,4 +68,4 @@ df = df[
     )
 ].reset_index(drop=True)
 
-df.to_parquet("data/df_final_riksvox.parquet", index=False)
+write_metadata(df, "data/df_final_riksvox.parquet", partitioned=False)
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 import re
 import multiprocessing as mp
@@ -6,7 +7,11 @@ import pandas as pd
 from pydub import AudioSegment
 from tqdm import tqdm
 
-df = pd.read_parquet("data/df_final_riksvox.parquet")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.schema import read_metadata
+
+df = read_metadata("data/df_final_riksvox.parquet", compact=False)
 df["filename_anforande_json"] = df["filename_anforande_audio"].str.extract(r"(.+?)\.") + ".json"
 # df = df[78000:].reset_index(drop=True)
 
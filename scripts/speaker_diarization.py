@@ -12,10 +12,14 @@ from tqdm import tqdm
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from src.dataset import DiarizationDataset
+from src.schema import read_metadata, get_filters
 
-df = pd.read_parquet("data/df_audio_metadata.parquet").reset_index(drop=True)
+df = read_metadata(
+    "data/df_audio_metadata.parquet",
+    columns=["dokid", "anforande_nummer", "filename", "filename_anforande_audio", "valid_audio", "debatedate"],
+    filters=get_filters(min_date="2019-01-01", max_date="2023-01-01"),
+)
 df = df[df["valid_audio"]].reset_index(drop=True)
-df = df[(df["debatedate"].dt.year >= 2019) & (df["debatedate"].dt.year <= 2022)].reset_index(drop=True)
 
 
 def custom_collate_fn(data):
@@ -1,5 +1,6 @@
 import os
 import sys
+import argparse
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -9,41 +10,79 @@ from torch.utils.data import DataLoader
 from transformers import pipeline
 from tqdm import tqdm
 from src.metrics import (
+    MatchPool,
     contiguous_ngram_indices,
     contiguous_fuzzy_indices,
 )
 from src.data import normalize_text
+from src.corpus import TokenizedCorpus
+from src.checkpoint import run_checkpointed, merge_checkpoints
+from src.schema import read_metadata, get_filters
 from src.dataset import DiarizationDataset
 from src.audio import diarize, transcribe
 from pyannote.audio import Pipeline
 
-# Read df_audiometa.parquet
-df_audiometa = pd.read_parquet("data/df_audio_metadata.parquet")
+parser = argparse.ArgumentParser(
+    description="""Transcribe debates, find timestamps of speeches with fuzzy matching and diarize debates.
+    Results are checkpointed per batch of debates, so an interrupted run resumes where it stopped."""
+)
+parser.add_argument("--min_date", type=str, default=None)
+parser.add_argument("--max_date", type=str, default="2017-01-01")
+parser.add_argument("--suffix", type=str, default="2003_2016", help="Suffix of the merged output files.")
+parser.add_argument("--checkpoint_dir", type=str, default="data/checkpoints/speech_finder")
+parser.add_argument("--batch_size", type=int, default=10, help="Number of debates per checkpoint.")
+parser.add_argument("--processes", type=int, default=24, help="Number of processes for the text matching.")
+parser.add_argument(
+    "--windowed",
+    action="store_true",
+    help="""Only search a time window around the start and duration of each speech in the metadata for
+    its fuzzy match (faster). The first window with a match scoring above the threshold is used,
+    which isn't always the best match of the full search used by default.""",
+)
+args = parser.parse_args()
+
+# Read df_audiometa.parquet, only the years between min_date and max_date
+df_audiometa = read_metadata(
+    "data/df_audio_metadata.parquet", filters=get_filters(args.min_date, args.max_date), compact=False
+)
 
 pipe = pipeline(model="KBLab/wav2vec2-large-voxrex-swedish", device=0)
 
 df_debates = df_audiometa.groupby("dokid").first().reset_index()
-df_debates = df_debates[df_debates["debatedate"] < "2017-01-01"]
+df_debates = df_debates[df_debates["debatedate"] < args.max_date]
+if args.min_date is not None:
+    df_debates = df_debates[df_debates["debatedate"] >= args.min_date]
+df_debates = df_debates.reset_index(drop=True)
+if len(df_debates) == 0:
+    sys.exit(f"No debates with audio between --min_date {args.min_date} and --max_date {args.max_date}.")
 
 
 #### TRANSCRIBE ####
-df_inference = transcribe(
-    df_debates,
-    pipe,
-    folder="data/audio",
-    chunk_length_s=50,
-    stride_length_s=7,
-    return_timestamps="word",
-    full_debate=True,
+def transcribe_debates(df_batch):
+    df_inference = transcribe(
+        df_batch,
+        pipe,
+        folder="data/audio",
+        chunk_length_s=50,
+        stride_length_s=7,
+        return_timestamps="word",
+        full_debate=True,
+    )
+
+    df_inference = df_inference.rename(columns={"text": "anftext_inference"})
+    df_inference.loc[df_inference["anftext_inference"] == "", "anftext_inference"] = None
+    return df_inference
+
+
+run_checkpointed(df_debates, transcribe_debates, args.checkpoint_dir, "transcription", batch_size=args.batch_size)
+# Only merge the debates between --min_date and --max_date, the checkpoints may also hold those of other runs
+merge_checkpoints(
+    args.checkpoint_dir, "transcription", f"data/df_finder_{args.suffix}.parquet", dokids=df_debates["dokid"]
 )
 
-df_inference = df_inference.rename(columns={"text": "anftext_inference"})
-df_inference.loc[df_inference["anftext_inference"] == "", "anftext_inference"] = None
-df_inference.to_parquet("data/df_finder_2003_2016.parquet", index=False)
-
 
 #### Fuzzy Timestamps ####
-df_inference = pd.read_parquet("data/df_finder_2003_2016.parquet")
+df_inference = pd.read_parquet(f"data/df_finder_{args.suffix}.parquet")
 # Wav2vec2 inference should already be normalized, but sometimes contains multiple spaces
 df_inference = normalize_text(df_inference, column_in="anftext_inference", column_out="anftext_inference")
 
@@ -54,24 +93,14 @@ df = df.merge(df_inference[["dokid", "anftext_inference", "chunks"]], on=["dokid
 
 df = normalize_text(df, column_in="anftext", column_out="anftext_normalized")
 
-df["match_indices_fuzzy"] = contiguous_fuzzy_indices(
-    df, column_in="anftext_normalized", column_out="anftext_inference", threshold=55
-)
-
-df["match_indices_ngram"] = contiguous_ngram_indices(
-    df,
-    column_in="anftext_normalized",
-    column_out="anftext_inference",
-    n=6,
-    threshold=1.8,
-    min_continuous_match=13,
-    max_gap=60,
-    processes=24,
-)
-
-df["start_word_index"] = df["match_indices_fuzzy"].apply(lambda x: x[0]).astype("Int64")
-df["end_word_index"] = df["match_indices_fuzzy"].apply(lambda x: x[1]).astype("Int64")
-df["fuzzy_score"] = df["match_indices_fuzzy"].apply(lambda x: x[2])
+# Tokenize each text once. data/corpus is shared by all pipeline stages (text_matcher.py,
+# rixvox_filter.py): texts already tokenized by earlier runs are loaded, only new ones are added.
+corpus = TokenizedCorpus.load("data/corpus", missing_ok=True)
+corpus.add_texts(df_inference["anftext_inference"])
+corpus.add_texts(df["anftext_normalized"])
+corpus.save("data/corpus")
+# The match pool only needs the texts of this run, not the whole shared corpus
+corpus = corpus.subset(pd.concat([df_inference["anftext_inference"], df["anftext_normalized"]]))
 
 
 def get_text_time(row, start=True):
@@ -90,33 +119,72 @@ def get_text_time(row, start=True):
             return None
 
 
-df["start_text_time"] = df[["start_word_index", "chunks"]].apply(lambda x: get_text_time(x, start=True), axis=1)
-df["end_text_time"] = df[["end_word_index", "chunks"]].apply(lambda x: get_text_time(x, start=False), axis=1)
-
-df["end"] = df["start"] + df["duration"]
-df["start_diff"] = df["start_text_time"] - df["start"]
-df["end_diff"] = df["end_text_time"] - df["end"]
-
-df[
-    [
-        "dokid",
-        "anforande_nummer",
-        "start",
-        "end",
-        "duration",
-        "start_word_index",
-        "end_word_index",
-        "fuzzy_score",
-        "start_text_time",
-        "end_text_time",
-        "start_diff",
-        "end_diff",
+def timestamp_debates(df_batch):
+    df_batch["match_indices_fuzzy"] = contiguous_fuzzy_indices(
+        df_batch,
+        column_in="anftext_normalized",
+        column_out="anftext_inference",
+        threshold=55,
+        windowed=args.windowed,
+        executor="shared_memory",
+        pool=match_pool,
+    )
+
+    df_batch["match_indices_ngram"] = contiguous_ngram_indices(
+        df_batch,
+        column_in="anftext_normalized",
+        column_out="anftext_inference",
+        n=6,
+        threshold=1.8,
+        min_continuous_match=13,
+        max_gap=60,
+        executor="shared_memory",
+        pool=match_pool,
+    )
+
+    df_batch["start_word_index"] = df_batch["match_indices_fuzzy"].apply(lambda x: x[0]).astype("Int64")
+    df_batch["end_word_index"] = df_batch["match_indices_fuzzy"].apply(lambda x: x[1]).astype("Int64")
+    df_batch["fuzzy_score"] = df_batch["match_indices_fuzzy"].apply(lambda x: x[2])
+
+    df_batch["start_text_time"] = df_batch[["start_word_index", "chunks"]].apply(
+        lambda x: get_text_time(x, start=True), axis=1
+    )
+    df_batch["end_text_time"] = df_batch[["end_word_index", "chunks"]].apply(
+        lambda x: get_text_time(x, start=False), axis=1
+    )
+
+    df_batch["end"] = df_batch["start"] + df_batch["duration"]
+    df_batch["start_diff"] = df_batch["start_text_time"] - df_batch["start"]
+    df_batch["end_diff"] = df_batch["end_text_time"] - df_batch["end"]
+
+    return df_batch[
+        [
+            "dokid",
+            "anforande_nummer",
+            "start",
+            "end",
+            "duration",
+            "start_word_index",
+            "end_word_index",
+            "fuzzy_score",
+            "start_text_time",
+            "end_text_time",
+            "start_diff",
+            "end_diff",
+        ]
     ]
-].to_parquet("data/df_timestamp_2003_2016.parquet", index=False)
+
+
+# One pool for all checkpoint batches, so the workers and the corpus are only set up once
+with MatchPool(processes=args.processes, corpus=corpus) as match_pool:
+    run_checkpointed(df, timestamp_debates, args.checkpoint_dir, "timestamp", batch_size=args.batch_size)
+merge_checkpoints(
+    args.checkpoint_dir, "timestamp", f"data/df_timestamp_{args.suffix}.parquet", dokids=df_debates["dokid"]
+)
 
 
 #### Diarization ####
-df_timestamp = pd.read_parquet("data/df_timestamp_2003_2016.parquet")
+df_timestamp = pd.read_parquet(f"data/df_timestamp_{args.suffix}.parquet")
 
 # Left join the columns dokid, anforance_nummer, filename from df in to df_timestamp
 df_timestamp = df_timestamp.merge(
@@ -134,8 +202,12 @@ df_timestamp.loc[df_timestamp["valid_audio"].isna(), "valid_audio"] = False
 df_timestamp = df_timestamp[(df_timestamp["valid_wav"])].reset_index(drop=True)
 
 
-diarization = DiarizationDataset(df_timestamp, full_debate=True, folder="data/audio")
+def diarize_debates(df_batch):
+    diarization = DiarizationDataset(df_batch, full_debate=True, folder="data/audio")
+    return diarize(pipe=pipe, diarization_dataset=diarization)
 
 
-df_speakers = diarize(pipe=pipe, diarization_dataset=diarization)
-df_speakers.to_parquet("data/df_speakers_debate_2003_2016.parquet", index=False)
+run_checkpointed(df_timestamp, diarize_debates, args.checkpoint_dir, "diarization", batch_size=args.batch_size)
+merge_checkpoints(
+    args.checkpoint_dir, "diarization", f"data/df_speakers_debate_{args.suffix}.parquet", dokids=df_debates["dokid"]
+)
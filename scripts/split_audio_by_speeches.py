@@ -9,15 +9,19 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from tqdm import tqdm
 
 from src.audio import split_audio_by_speech
+from src.schema import read_metadata
 
-df = pd.read_parquet("data/df_audio_metadata_final.parquet")
+df = read_metadata(
+    "data/df_audio_metadata_final.parquet",
+    columns=["dokid", "anforande_nummer", "filename", "start", "duration", "start_segment", "end_segment"],
+)
 
 # Riksdagen's embedded player only takes into account seconds, (i.e. it floors the start and end times).
 # We add some margins to the start and end times to ensure
 df["start_adjusted"] = (df["start_segment"] - 0.1).round(1)
 df["end_adjusted"] = (df["end_segment"] + 0.4).round(1)
 
-df_groups = df.groupby("dokid")
+df_groups = df.groupby("dokid", observed=True)
 df_groups = df_groups[["dokid", "anforande_nummer", "filename", "start", "duration", "start_adjusted", "end_adjusted"]]
 df_list = [df_groups.get_group(x) for x in df_groups.groups]  # list of dfs, one for each dokid
 
@@ -7,8 +7,9 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from tqdm import tqdm
 from src.audio import split_text_by_speech
+from src.schema import read_metadata, write_metadata
 
-df = pd.read_parquet("data/df_final_riksvox.parquet")
+df = read_metadata("data/df_final_riksvox.parquet", compact=False)
 df_groups = df.groupby("dokid")
 df_list = [df_groups.get_group(x).copy() for x in df_groups.groups]  # list of dfs, one for each dokid
 
@@ -20,7 +21,7 @@ df = pd.concat(df_dokids)
 df["filename_anforande_text"] = df["filename_anforande_text"].apply(lambda x: str(x))
 
 
-df.to_parquet("data/df_final_riksvox.parquet", index=False)
+write_metadata(df, "data/df_final_riksvox.parquet", partitioned=False)
 df[["filename_anforande_audio", "filename_anforande_text"]].to_csv(
     r"data/speeches_files_aeneas.txt", sep=" ", index=None, mode="a", header=None
 )  # For aeneas
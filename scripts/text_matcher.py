@@ -1,15 +1,15 @@
 import sys
 import pandas as pd
-import multiprocessing as mp
 from pathlib import Path
-from tqdm import tqdm
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from src.metrics import calculate_bleu, contiguous_ngram_match_star, contiguous_fuzzy_match_star
+from src.metrics import match_texts
 from src.data import normalize_text
+from src.corpus import TokenizedCorpus
+from src.schema import read_metadata
 
-df = pd.read_parquet("data/df_final_metadata.parquet")
+df = read_metadata("data/df_final_metadata.parquet", compact=False)
 df_inference = pd.read_parquet("data/df_inference_eval_2016_2023.parquet")
 
 df = pd.merge(df, df_inference, on=["dokid", "anforande_nummer", "filename_anforande_audio"], how="inner")
@@ -18,108 +18,42 @@ df = normalize_text(df, column_in="anftext", column_out="anftext_normalized")
 # Wav2vec2 inference should already be normalized, but sometimes contains multiple spaces
 df = normalize_text(df, column_in="anftext_inference", column_out="anftext_inference")
 
-df["bleu_score"] = df[["anftext_normalized", "anftext_inference"]].apply(
-    lambda x: calculate_bleu(x.anftext_normalized, x.anftext_inference), axis=1
-)
+# Tokenize each text once, shared by all metrics below. Extends the corpus of the earlier
+# pipeline stages (speech_finder.py), so texts already in it aren't tokenized again.
+corpus = TokenizedCorpus.load("data/corpus", missing_ok=True)
+corpus.add_texts(df["anftext_normalized"])
+corpus.add_texts(df["anftext_inference"])
+corpus.save("data/corpus")
+
+
+def nr_words(text):
+    return len(corpus.get_token_ids(text)) if isinstance(text, str) else None
+
 
 # filter out those anftext_inference that are shorter than 8 words
 df = df[
-    (df["anftext_inference"].str.split().str.len() >= 8) & (df["anftext_normalized"].str.split().str.len() >= 8)
+    (df["anftext_inference"].apply(nr_words) >= 8) & (df["anftext_normalized"].apply(nr_words) >= 8)
 ].reset_index(drop=True)
 
 df = df[~df["anftext_normalized"].isna()].reset_index(drop=True)
 
-
-def contiguous_text_indices_ngram(
+# Word alignment, fuzzy match and BLEU in a single pass.
+# The word alignment gives the matched region in both texts (start_align_i/_a, end_align_i/_a,
+# suffix "_i" for indices in anftext_inference and "_a" for indices in anftext_normalized)
+# and the share of aligned words that agree (align_agreement). align_band_exceeded flags
+# alignments that reach the edge of the band and may be incomplete.
+# Only the backward fuzzy match (start_fuzzy_a, end_fuzzy_a, fuzzy_score_a: the match of
+# anftext_inference in anftext_normalized) is computed, it's what rixvox_filter.py reads.
+df_match = match_texts(
     df,
-    column_in,
-    column_out,
-    n=6,
-    threshold=1.3,
-    min_continuous_match=8,
-    max_gap=30,
-    processes=None,
-):
-    """
-    Find and return the indices of the contiguous text in column_out that
-    matches text in column_in.
-
-    Args:
-        df (pd.DataFrame): DataFrame containing column_in and column_out.
-        column_in (str): Column name of text to match against.
-        column_out (str): Column name of text we get matching indices for.
-            n (int): N-gram sizes 1 to n.
-        threshold (float): Threshold score for contiguous n-gram match to be considered a match.
-        min_continous_match (int): Minimum continuous word matches for the region to
-            be considered contiguous.
-        max_gap (int): Maximum gap (in words) between contiguous region and the next/previous
-            region for it to be seen as the start/end index of a larger joined together contiguous
-            region.
-        processes (int | NoneType): Number of processes to use for multiprocessing.
-            If None, use all available processes.
-    """
-
-    with mp.Pool(processes) as pool:
-        args = [
-            (text1, text2, n, threshold, min_continuous_match, max_gap)
-            for text1, text2 in zip(df[column_in], df[column_out])
-        ]
-        df["contiguous_ngram_match"] = list(
-            tqdm(
-                pool.imap(
-                    contiguous_ngram_match_star,
-                    args,
-                    chunksize=1,
-                ),
-                total=len(df),
-            )
-        )
-
-    return df
-
-
-def contiguous_text_indices_fuzzy(
-    df,
-    column_in,
-    column_out,
+    column_in="anftext_normalized",
+    column_out="anftext_inference",
+    metrics=("fuzzy", "bleu", "alignment"),
+    directions=("backward",),
     threshold_fuzzy=55,
-    processes=None,
-):
-    """
-    Find and return the indices of the contiguous text in column_out that
-    matches text in column_in.
-
-    Args:
-        df (pd.DataFrame): DataFrame containing column_in and column_out.
-        column_in (str): Column name of text to match against.
-        column_out (str): Column name of text we get matching indices for.
-            n (int): N-gram sizes 1 to n.
-        max_non_match (int): Maximum number of contigous indices below threshold score to allow
-            for matching regions to no longer be considered contiguous.
-        processes (int | NoneType): Number of processes to use for multiprocessing.
-            If None, use all available processes.
-    """
-
-    with mp.Pool(processes) as pool:
-        args = [(text1, text2, threshold_fuzzy) for text1, text2 in zip(df[column_in], df[column_out])]
-        df["contiguous_fuzzy_match"] = list(
-            tqdm(
-                pool.imap(
-                    contiguous_fuzzy_match_star,
-                    args,
-                    chunksize=1,
-                ),
-                total=len(df),
-            )
-        )
-
-    return df
-
-
-df_inference_bleu = contiguous_text_indices_ngram(df, "anftext_normalized", "anftext_inference")
-df_inference_bleu = contiguous_text_indices_fuzzy(df, "anftext_normalized", "anftext_inference")
-df_anftext_bleu = contiguous_text_indices_ngram(df, "anftext_inference", "anftext_normalized")
-df_anftext_bleu = contiguous_text_indices_fuzzy(df, "anftext_inference", "anftext_normalized")
+    band=50,
+    corpus=corpus.subset(pd.concat([df["anftext_normalized"], df["anftext_inference"]])),
+)
+df = pd.concat([df, df_match], axis=1)
 
-df_inference_bleu.to_parquet("data/df_inference_bleu_eval_2016_2023.parquet")
-df_anftext_bleu.to_parquet("data/df_anftext_bleu_eval_2016_2023.parquet")
+df.to_parquet("data/df_inference_bleu_eval_2016_2023.parquet")
@@ -8,9 +8,9 @@ from tqdm import tqdm
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from src.audio import transcribe
+from src.schema import read_metadata, get_filters
 
-df = pd.read_parquet("data/df_final_metadata.parquet")
-df = df[df["debatedate"] < "2016-01-01"]
+df = read_metadata("data/df_final_metadata.parquet", filters=get_filters(max_date="2016-01-01"), compact=False)
 
 pipe = pipeline(model="KBLab/wav2vec2-large-voxrex-swedish", device=0)
 
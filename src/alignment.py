@@ -0,0 +1,294 @@
+from bisect import bisect_left
+
+import numpy as np
+
+# Score of cells outside the band. Far from the int32 limits so adding scores can't overflow.
+NEG_SCORE = -(2**30)
+
+
+def get_token_ids(text_a, text_b, corpus=None):
+    """
+    Token ids of the words of two texts, in a shared vocabulary.
+
+    Args:
+        text_a (str): First text.
+        text_b (str): Second text.
+        corpus (TokenizedCorpus | NoneType): If given, token ids are read from the corpus.
+
+    Returns:
+        tuple: Two int64 arrays of token ids.
+    """
+
+    if corpus is not None:
+        return corpus.get_token_ids(text_a).astype(np.int64), corpus.get_token_ids(text_b).astype(np.int64)
+
+    vocab = {}
+    tokens_a = np.array([vocab.setdefault(word, len(vocab)) for word in text_a.split()], dtype=np.int64)
+    tokens_b = np.array([vocab.setdefault(word, len(vocab)) for word in text_b.split()], dtype=np.int64)
+    return tokens_a, tokens_b
+
+
+def get_kgram_hashes(tokens, k):
+    """
+    Hash of the k-gram starting at every position of tokens (uint64, wrapping).
+    """
+
+    hashes = np.zeros(len(tokens) - k + 1, dtype=np.uint64)
+    for t in range(k):
+        hashes = hashes * np.uint64(1000003) + tokens[t : len(tokens) - k + 1 + t].astype(np.uint64)
+    return hashes
+
+
+def get_seed_anchors(tokens_a, tokens_b, k=4):
+    """
+    Anchors for the band: positions (i, j) where a k-gram occurs exactly once in both
+    sequences, reduced to the longest chain that is increasing in both i and j, so
+    that repeated phrases and hash collisions don't pull the band off the alignment.
+
+    Returns:
+        tuple: Two int64 arrays with the positions in tokens_a and tokens_b of the
+            anchors, sorted. Empty if the sequences share no unique k-gram.
+    """
+
+    if len(tokens_a) < k or len(tokens_b) < k:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    hashes_a, index_a, counts_a = np.unique(get_kgram_hashes(tokens_a, k), return_index=True, return_counts=True)
+    hashes_b, index_b, counts_b = np.unique(get_kgram_hashes(tokens_b, k), return_index=True, return_counts=True)
+    _, shared_a, shared_b = np.intersect1d(
+        hashes_a[counts_a == 1], hashes_b[counts_b == 1], assume_unique=True, return_indices=True
+    )
+    anchors_a = index_a[counts_a == 1][shared_a]
+    anchors_b = index_b[counts_b == 1][shared_b]
+    order = np.argsort(anchors_a)
+    anchors_a, anchors_b = anchors_a[order], anchors_b[order]
+
+    # Longest strictly increasing subsequence of anchors_b (patience sorting)
+    tails, tail_indices = [], []
+    previous = np.full(len(anchors_b), -1, dtype=np.int64)
+    for index, j in enumerate(anchors_b.tolist()):
+        position = bisect_left(tails, j)
+        if position > 0:
+            previous[index] = tail_indices[position - 1]
+        if position == len(tails):
+            tails.append(j)
+            tail_indices.append(index)
+        else:
+            tails[position] = j
+            tail_indices[position] = index
+
+    chain = []
+    index = tail_indices[-1] if len(tail_indices) > 0 else -1
+    while index >= 0:
+        chain.append(index)
+        index = previous[index]
+    chain = np.array(chain[::-1], dtype=np.int64)
+
+    return anchors_a[chain].astype(np.int64), anchors_b[chain].astype(np.int64)
+
+
+def get_band_offsets(n, m, band, anchors=None):
+    """
+    Band of the dynamic programming matrix of two sequences of length n and m.
+
+    Row i covers the columns lo[i] to lo[i] + width - 1, with width = 2 * band + 1,
+    centered on a line through the anchors (see get_seed_anchors()). Between anchors the
+    center is interpolated and before the first/after the last anchor it follows the
+    diagonal, so the band follows the alignment also when one sequence is a shifted
+    (e.g. extra words before/after) copy of the other. Without anchors the band is
+    centered on the diagonal from (0, 0) to (n, m).
+
+    Args:
+        n, m (int): Lengths of the sequences.
+        band (int): Half width of the band.
+        anchors (tuple | NoneType): Positions in both sequences, see get_seed_anchors().
+
+    Returns:
+        tuple: Array lo of the first column of every row, and the band width.
+    """
+
+    rows = np.arange(n + 1)
+    if anchors is not None and len(anchors[0]) > 0:
+        anchors_a, anchors_b = anchors
+        center = rows + np.interp(rows, anchors_a, anchors_b - anchors_a)
+    else:
+        center = rows * (m / n if n > 0 else 0)
+
+    lo = np.round(center).astype(np.int64) - band
+    return lo, 2 * band + 1
+
+
+def fill_banded_matrix(tokens_a, tokens_b, band=50, match=1, mismatch=-1, gap=-1, anchors=None):
+    """
+    Fill the banded Smith-Waterman (local alignment) matrix of two token sequences in
+    O(len(tokens_a) * band) time and memory.
+
+    Rows are filled one at a time with vectorized NumPy operations. Within a row, the
+    horizontal gap recurrence H[j] = max(T[j], H[j - 1] + gap) is solved with a running
+    maximum: H[j] = max over k <= j of (T[k] - gap * k) + gap * j.
+
+    Args:
+        tokens_a (np.array): Token ids of the first sequence (rows).
+        tokens_b (np.array): Token ids of the second sequence (columns).
+        band (int): Half width of the band, in words, around the (widened) diagonal.
+        match (int): Score of aligning two equal tokens.
+        mismatch (int): Score of aligning two different tokens.
+        gap (int): Score of a word only present in one of the sequences (negative).
+        anchors (tuple | NoneType): Anchors of the band, see get_band_offsets().
+
+    Returns:
+        tuple: int32 matrix H of shape (n + 1, width) where H[i, c] is the score of the
+            cell (i, lo[i] + c), and the band offsets lo.
+    """
+
+    n, m = len(tokens_a), len(tokens_b)
+    lo, width = get_band_offsets(n, m, band, anchors)
+    columns = np.arange(width)
+
+    H = np.full((n + 1, width), NEG_SCORE, dtype=np.int32)
+    j = lo[0] + columns
+    H[0, (j >= 0) & (j <= m)] = 0
+
+    for i in range(1, n + 1):
+        j = lo[i] + columns
+        valid = (j >= 0) & (j <= m)
+        previous = H[i - 1]
+
+        # Cell (i - 1, j) is at column c + shift of the previous row, (i - 1, j - 1) one to the left
+        up_index = columns + (lo[i] - lo[i - 1])
+        diag_index = up_index - 1
+        up = np.where((up_index >= 0) & (up_index < width), previous[np.clip(up_index, 0, width - 1)], NEG_SCORE)
+        diag = np.where(
+            (diag_index >= 0) & (diag_index < width), previous[np.clip(diag_index, 0, width - 1)], NEG_SCORE
+        )
+        scores = np.where(tokens_b[np.clip(j - 1, 0, m - 1)] == tokens_a[i - 1], match, mismatch)
+
+        row = np.maximum(np.maximum(diag + scores, up + gap), 0)
+        row[j == 0] = 0
+        row[~valid] = NEG_SCORE
+
+        # Horizontal gaps
+        row = np.maximum.accumulate(row - gap * columns) + gap * columns
+        row[~valid] = NEG_SCORE
+        H[i] = row
+
+    return H, lo
+
+
+def traceback_alignment(H, lo, tokens_a, tokens_b, match=1, mismatch=-1, gap=-1):
+    """
+    Trace back the best local alignment from the matrix of fill_banded_matrix().
+
+    Returns:
+        tuple: Score of the alignment, its path, an int64 array of shape (k, 2) with one
+            (index in tokens_a, index in tokens_b) row per alignment column (words only
+            present in one sequence have index -1 for the other), and whether the path
+            touches the edge of the band. If it does, the best alignment may leave the
+            band and the result is only the best alignment within it.
+    """
+
+    width = H.shape[1]
+    m = len(tokens_b)
+
+    def cell(i, j):
+        c = j - lo[i]
+        return int(H[i, c]) if 0 <= c < width else NEG_SCORE
+
+    def on_edge(i, j):
+        # The first/last column of the band, unless it's the first/last column of the matrix
+        c = j - lo[i]
+        return (c == 0 and j > 0) or (c == width - 1 and j < m)
+
+    i, c = np.unravel_index(np.argmax(H), H.shape)
+    score = int(H[i, c])
+    j = lo[i] + c
+
+    band_exceeded = False
+    path = []
+    while i > 0 and j > 0 and cell(i, j) > 0:
+        band_exceeded = band_exceeded or on_edge(i, j)
+        value = cell(i, j)
+        if value == cell(i - 1, j - 1) + (match if tokens_a[i - 1] == tokens_b[j - 1] else mismatch):
+            path.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif value == cell(i - 1, j) + gap:
+            path.append((i - 1, -1))
+            i -= 1
+        else:
+            path.append((-1, j - 1))
+            j -= 1
+
+    path = np.array(path[::-1], dtype=np.int64).reshape(-1, 2)
+    return score, path, band_exceeded
+
+
+def align_words(text_a, text_b, band=50, match=1, mismatch=-1, gap=-1, min_score=8, corpus=None):
+    """
+    Word level local alignment of two texts (e.g. anftext_normalized and anftext_inference)
+    with a banded Smith-Waterman over token ids, in O(len(text_a) * band) time and memory
+    (plus O(len(text_a) + len(text_b)) to find the band, see get_band_offsets()).
+
+    Unlike contiguous_ngram_match() and contiguous_fuzzy_match() in src/metrics.py, which
+    give the matching region in one of the texts, one alignment gives the matching region
+    in both texts and which word corresponds to which.
+
+    Args:
+        text_a (str): First text.
+        text_b (str): Second text.
+        band (int): Half width of the band, see get_band_offsets().
+        match, mismatch, gap (int): Alignment scores, see fill_banded_matrix().
+        min_score (int): Minimum alignment score for the texts to be considered a match.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts.
+
+    Returns:
+        dict | NoneType: None if a text is missing or the alignment score is below
+            min_score. Otherwise a dict with
+            - start_a, end_a, start_b, end_b: Word indices of the aligned region in both
+              texts (end exclusive).
+            - score: Alignment score.
+            - path: Alignment path, see traceback_alignment().
+            - matches_a, matches_b: Boolean arrays over the words of each text, True for
+              words aligned to an identical word in the other text.
+            - agreement: Share of the columns of the alignment that are identical words.
+            - band_exceeded: True if the alignment touches the edge of the band, so that
+              the best alignment may lie partly outside it (then the result is the best
+              alignment within the band). A larger band may find a better alignment.
+    """
+
+    if text_a is None or text_b is None:
+        return None
+
+    tokens_a, tokens_b = get_token_ids(text_a, text_b, corpus=corpus)
+    if len(tokens_a) == 0 or len(tokens_b) == 0:
+        return None
+
+    anchors = get_seed_anchors(tokens_a, tokens_b)
+    H, lo = fill_banded_matrix(tokens_a, tokens_b, band, match, mismatch, gap, anchors=anchors)
+    score, path, band_exceeded = traceback_alignment(H, lo, tokens_a, tokens_b, match, mismatch, gap)
+    if score < min_score or len(path) == 0:
+        return None
+
+    aligned = (path[:, 0] >= 0) & (path[:, 1] >= 0)
+    identical = np.zeros(len(path), dtype=bool)
+    identical[aligned] = tokens_a[path[aligned, 0]] == tokens_b[path[aligned, 1]]
+
+    matches_a = np.zeros(len(tokens_a), dtype=bool)
+    matches_a[path[identical, 0]] = True
+    matches_b = np.zeros(len(tokens_b), dtype=bool)
+    matches_b[path[identical, 1]] = True
+
+    indices_a = path[path[:, 0] >= 0, 0]
+    indices_b = path[path[:, 1] >= 0, 1]
+
+    return {
+        "start_a": int(indices_a[0]),
+        "end_a": int(indices_a[-1]) + 1,
+        "start_b": int(indices_b[0]),
+        "end_b": int(indices_b[-1]) + 1,
+        "score": score,
+        "path": path,
+        "matches_a": matches_a,
+        "matches_b": matches_b,
+        "agreement": float(identical.mean()),
+        "band_exceeded": band_exceeded,
+    }
@@ -4,8 +4,25 @@ import requests
 from json import loads
 from src.data import preprocess_audio_metadata
 
+VODAPI_URL = "https://data.riksdagen.se/api/mhs-vodapi?"
 
-def get_audio_metadata(rel_dok_id, backoff_factor=0.2):
+
+def has_media(speech_metadata, rel_dok_id):
+    """
+    Check that an mhs-vodapi response has speakers and media files (streams).
+    """
+
+    if "speakers" not in speech_metadata["videodata"][0]:
+        return False
+
+    if speech_metadata["videodata"][0]["streams"] is None:
+        print(f"rel_dok_id {rel_dok_id} has no streams (media files).", end="\r", flush=True)
+        return False
+
+    return True
+
+
+def get_audio_metadata(rel_dok_id, backoff_factor=0.2, raw=False):
     """
     Download metadata for anföranden (speeches) to find which ones have related
     media files at riksdagens öppna data. The anföranden which have a
@@ -16,16 +33,16 @@ def get_audio_metadata(rel_dok_id, backoff_factor=0.2):
             transcript files at https://data.riksdagen.se/data/anforanden/.
         backoff_factor (int): Slow down the request frequency if riksdagen's
             API rejects requests.
+        raw (bool): Return the response as is, to be preprocessed together with
+            other responses by src.data.preprocess_audio_metadata_batch().
 
     Returns:
-        dict: Nested metadata fields with transcribed texts, media file
-            URLs and more.
+        pd.DataFrame | dict: Preprocessed metadata with transcribed texts, media
+            file URLs and more. The nested response dict if raw is True.
     """
-    base_url = "https://data.riksdagen.se/api/mhs-vodapi?"
-
     for i in range(3):
         backoff_time = backoff_factor * (2**i)
-        speech_metadata = requests.get(f"{base_url}{rel_dok_id}")
+        speech_metadata = requests.get(f"{VODAPI_URL}{rel_dok_id}")
 
         if speech_metadata.status_code == 200:
 
@@ -36,12 +53,11 @@ def get_audio_metadata(rel_dok_id, backoff_factor=0.2):
                 print(e)
                 return None
 
-            if "speakers" not in speech_metadata["videodata"][0]:
+            if not has_media(speech_metadata, rel_dok_id):
                 return None
 
-            if speech_metadata["videodata"][0]["streams"] is None:
-                print(f"rel_dok_id {rel_dok_id} has no streams (media files).", end="\r", flush=True)
-                return None
+            if raw:
+                return speech_metadata
 
             df = preprocess_audio_metadata(speech_metadata)
             df["rel_dok_id"] = rel_dok_id
@@ -62,6 +78,8 @@ def get_audio_file(audiofileurl, backoff_factor=0.2):
     """
     Download mp3 files from riksdagens öppna data.
     Endpoint https://data.riksdagen.se/api/mhs-vodapi?
+    The file is streamed to disk, see RiksdagenClient.get_audio_file() in
+    src/async_api.py for resumable downloads with a manifest.
 
     Args:
         audiofileurl (str): Download URL for the mp3 audio file.
@@ -82,17 +100,29 @@ def get_audio_file(audiofileurl, backoff_factor=0.2):
             break
 
         backoff_time = backoff_factor * (2**i)
-        speeches_media = requests.get(audiofileurl)
-
-        if speeches_media.status_code == 200:
-            with open(file_path, "wb") as f:
-                f.write(speeches_media.content)
-                # return file_path
-        else:
-            print(
-                f"audiofileurl {audiofileurl} failed with code {speeches_media.status_code}",
-                end="\r",
-                flush=True,
-            )
+        part_path = file_path + ".part"
+
+        try:
+            # Stream to a temporary file and only rename it once all bytes arrived, so an
+            # interrupted download never leaves a truncated file at file_path
+            with requests.get(audiofileurl, stream=True, headers={"Accept-Encoding": "identity"}) as speeches_media:
+                if speeches_media.status_code == 200:
+                    with open(part_path, "wb") as f:
+                        for chunk in speeches_media.iter_content(chunk_size=2**20):
+                            f.write(chunk)
+
+                    expected_size = speeches_media.headers.get("Content-Length")
+                    if expected_size is None or os.path.getsize(part_path) == int(expected_size):
+                        os.replace(part_path, file_path)
+                        break
+                    print(f"audiofileurl {audiofileurl} download incomplete", end="\r", flush=True)
+                else:
+                    print(
+                        f"audiofileurl {audiofileurl} failed with code {speeches_media.status_code}",
+                        end="\r",
+                        flush=True,
+                    )
+        except requests.exceptions.RequestException as e:
+            print(f"audiofileurl {audiofileurl} failed: {e}", end="\r", flush=True)
 
         time.sleep(backoff_time)
@@ -0,0 +1,513 @@
+import asyncio
+import os
+import random
+import re
+from datetime import datetime, timezone
+from json import dumps, loads
+
+import aiohttp
+from tqdm import tqdm
+
+from src.api import VODAPI_URL, has_media
+from src.rate_limit import ERROR_STATUSES, REJECT_STATUSES, AdaptiveRateLimiter
+
+# Status codes worth retrying: rate limiting and temporary server errors
+RETRY_STATUSES = REJECT_STATUSES | ERROR_STATUSES
+
+# How get_audio_metadata() uses the response cache: return cached responses and only fetch missing
+# ones ("use"), revalidate cached responses with the server ("revalidate"), or never make
+# requests ("offline")
+CACHE_MODES = ("use", "revalidate", "offline")
+
+# Audio files are streamed to disk in chunks of this many bytes
+CHUNK_SIZE = 2**20
+
+# File name of the download manifest in the audio folder, see DownloadManifest
+MANIFEST_NAME = "downloads.jsonl"
+
+
+class RequestError(Exception):
+    """
+    A request that still failed after all retries.
+    """
+
+    def __init__(self, url, status=None, reason=None):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        super().__init__(f"Request to {url} failed (status {status}): {reason}")
+
+
+class IncompleteDownload(aiohttp.ClientPayloadError):
+    """
+    A download that ended before all bytes were received. Retried like other payload
+    errors, resuming from the bytes already written.
+    """
+
+
+class DownloadManifest:
+    """
+    Record of the verified downloads of a folder, one json line per completed file
+    ({"filename", "url", "size", "downloaded"}) in {folder}/downloads.jsonl.
+
+    A file only counts as downloaded if it's in the manifest and still has the recorded
+    size. Files are only renamed to their final name after their size has been verified,
+    so a file missing from the manifest is either a leftover from an interrupted run or
+    from before the manifest existed, and is resumed/verified instead of trusted.
+
+    Args:
+        folder (str): Folder of the downloaded files.
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.entries = {}
+        self.cut_off = False
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    # A line cut off by an interrupted write is skipped, and ended before appending
+                    self.cut_off = not line.endswith("\n")
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry["filename"]] = entry
+
+    def is_complete(self, file_path):
+        entry = self.entries.get(os.path.basename(file_path))
+        return entry is not None and os.path.exists(file_path) and os.path.getsize(file_path) == entry["size"]
+
+    def add(self, file_path, url):
+        entry = {
+            "filename": os.path.basename(file_path),
+            "url": url,
+            "size": os.path.getsize(file_path),
+            "downloaded": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        self.entries[entry["filename"]] = entry
+        with open(self.path, "a") as f:
+            f.write(("\n" if self.cut_off else "") + dumps(entry, ensure_ascii=False) + "\n")
+        self.cut_off = False
+
+
+def parse_content_range(headers):
+    """
+    Start byte and total size from a Content-Range header ("bytes 100-199/1000" or
+    "bytes */1000"). Unknown values are None.
+    """
+
+    match = re.fullmatch(r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)", headers.get("Content-Range", "").strip())
+    if match is None:
+        return None, None
+    start, total = match.groups()
+    return (int(start) if start else None), (int(total) if total != "*" else None)
+
+
+def decode_json(body):
+    """
+    Decoded json body of a response, None if it isn't valid json (e.g. an html error page).
+    """
+
+    try:
+        return loads(body)
+    except ValueError:
+        return None
+
+
+class RiksdagenClient:
+    """
+    Asyncio HTTP client for riksdagen's APIs (data.riksdagen.se, mhdownload.riksdagen.se).
+
+    All requests share one aiohttp session, so TCP/TLS connections are kept alive and
+    reused, and at most `concurrency` requests are in flight at once. Failed requests
+    (connection errors, timeouts and the statuses in RETRY_STATUSES) are retried with
+    exponential backoff and full jitter, respecting the Retry-After header of 429/503
+    responses. Other statuses (e.g. 404) are returned as they are.
+
+    Requests are also paced by an AdaptiveRateLimiter (src/rate_limit.py), shared by all
+    requests of the client: the request rate is lowered for everyone when the server
+    answers 429/503 and slowly raised again while requests succeed.
+
+    mhs-vodapi responses can be kept in a ResponseCache (src/cache.py), so that reruns
+    read them from disk instead of downloading them again, see cache_mode.
+
+    Use as an async context manager:
+
+        async with RiksdagenClient(concurrency=16) as client:
+            speech_metadata = await client.get_audio_metadata(rel_dok_id)
+
+    Args:
+        concurrency (int): Maximum number of concurrent requests.
+        max_retries (int): Number of retries after the first attempt.
+        backoff_factor (float): Base of the backoff in seconds. Retry i waits a random
+            time between 0 and backoff_factor * 2**i seconds.
+        max_backoff (float): Maximum backoff in seconds.
+        timeout (float): Total timeout of a request in seconds (None for no timeout).
+        cache (ResponseCache | NoneType): Cache of mhs-vodapi responses. None disables
+            caching.
+        cache_mode (str): One of CACHE_MODES. "use" returns cached responses and fetches
+            (and caches) the missing ones. "revalidate" sends a conditional request
+            (ETag/Last-Modified) for cached responses and only downloads changed ones.
+            "offline" only replays cached responses and never makes requests.
+        rate_limiter (AdaptiveRateLimiter | NoneType): Rate limiter, can be shared by
+            several clients running in the same event loop. None creates one with the
+            default settings.
+    """
+
+    def __init__(
+        self,
+        concurrency=16,
+        max_retries=5,
+        backoff_factor=0.5,
+        max_backoff=60,
+        timeout=300,
+        cache=None,
+        cache_mode="use",
+        rate_limiter=None,
+    ):
+        if cache_mode not in CACHE_MODES:
+            raise ValueError(f"cache_mode must be one of {CACHE_MODES}, got {cache_mode}")
+        if cache_mode == "offline" and cache is None:
+            raise ValueError("cache_mode 'offline' needs a cache")
+
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.cache_mode = cache_mode
+        self.rate_limiter = rate_limiter if rate_limiter is not None else AdaptiveRateLimiter()
+        self.session = None
+        self.semaphore = None
+        self.manifests = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def get_backoff(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number attempt (0-based): exponential backoff with
+        full jitter, but at least the Retry-After of the server.
+        """
+
+        backoff = random.uniform(0, min(self.max_backoff, self.backoff_factor * 2**attempt))
+        if retry_after is not None:
+            backoff = max(backoff, min(retry_after, self.max_backoff))
+        return backoff
+
+    @staticmethod
+    def parse_retry_after(headers):
+        """
+        Retry-After header in seconds, None if missing or given as a date.
+        """
+
+        try:
+            return float(headers["Retry-After"])
+        except (KeyError, ValueError):
+            return None
+
+    async def request(self, url, handle_response, get_headers=None):
+        """
+        Make a GET request with retries.
+
+        Args:
+            url (str): URL to get.
+            handle_response (coroutine function): Called with the aiohttp response of
+                the successful (not retried) attempt, returns the result.
+            get_headers (function | NoneType): Called before every attempt, returns the
+                request headers of the attempt (e.g. a Range header that depends on how
+                much of a file an earlier attempt downloaded).
+
+        Returns:
+            Result of handle_response.
+
+        Raises:
+            RequestError: If all attempts failed.
+        """
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with self.semaphore:
+                sent_at = await self.rate_limiter.acquire()
+                try:
+                    headers = get_headers() if get_headers is not None else None
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status not in RETRY_STATUSES:
+                            self.rate_limiter.record(response.status, sent_at)
+                            return await handle_response(response)
+                        status, reason = response.status, response.reason
+                        retry_after = self.parse_retry_after(response.headers)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status, reason = None, repr(e)
+                self.rate_limiter.record(status, sent_at, retry_after)
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.get_backoff(attempt, retry_after))
+
+        raise RequestError(url, status, reason)
+
+    async def get_bytes(self, url, headers=None):
+        """
+        Returns:
+            tuple: Status code, headers and body of the response.
+        """
+
+        async def read_body(response):
+            return response.status, response.headers, await response.read()
+
+        return await self.request(url, read_body, get_headers=(lambda: headers) if headers else None)
+
+    async def get_audio_metadata(self, rel_dok_id):
+        """
+        Download the mhs-vodapi response of a debate, see src.api.get_audio_metadata().
+        The response is read from and stored in the cache according to cache_mode. A
+        cached response that can't be decoded is removed from the cache and downloaded
+        again (except in offline mode).
+
+        Returns:
+            dict | NoneType: The response, None if the debate has no media files or the
+                response could not be decoded (or isn't cached in offline mode).
+        """
+
+        body = None
+        if self.cache is not None and self.cache_mode != "revalidate":
+            body = self.cache.read(rel_dok_id)
+            if body is None and self.cache_mode == "offline":
+                print(f"rel_dok_id {rel_dok_id} is not cached.")
+                return None
+            if body is not None and self.cache_mode != "offline" and decode_json(body) is None:
+                # E.g. an error page cached before only decodable responses were stored
+                self.cache.remove(rel_dok_id)
+                body = None
+
+        if body is None:
+            body = await self.fetch_audio_metadata_body(rel_dok_id)
+            if body is None:
+                return None
+
+        speech_metadata = decode_json(body)
+        if speech_metadata is None:
+            print(f"JSON decoding failed for rel_dok_id {rel_dok_id}.")
+            return None
+
+        if not has_media(speech_metadata, rel_dok_id):
+            return None
+
+        return speech_metadata
+
+    async def fetch_audio_metadata_body(self, rel_dok_id):
+        """
+        Request the raw mhs-vodapi response of a debate, revalidating the cached response
+        in "revalidate" mode, and store it in the cache if it can be decoded.
+
+        Returns:
+            bytes | NoneType: Body of the response, None if the request failed.
+        """
+
+        url = f"{VODAPI_URL}{rel_dok_id}"
+        validators = {}
+        if self.cache is not None and self.cache_mode == "revalidate":
+            validators = self.cache.get_validators(rel_dok_id)
+
+        status, headers, body = await self.get_bytes(url, headers=validators)
+        if status == 304:
+            body = self.cache.read(rel_dok_id)
+            if body is not None and decode_json(body) is not None:
+                return body
+            # Cached body is missing, corrupt or can't be decoded, download it again
+            status, headers, body = await self.get_bytes(url)
+
+        if status != 200:
+            print(f"rel_dok_id {rel_dok_id} failed with code {status}.")
+            return None
+
+        if self.cache is not None and decode_json(body) is not None:
+            self.cache.put(rel_dok_id, body, headers=headers, url=url)
+        return body
+
+    def get_manifest(self, folder):
+        """
+        DownloadManifest of folder, loaded once per client.
+        """
+
+        if folder not in self.manifests:
+            self.manifests[folder] = DownloadManifest(folder)
+        return self.manifests[folder]
+
+    async def get_audio_file(self, audiofileurl, folder="data/audio"):
+        """
+        Download an mp3 file to folder, see src.api.get_audio_file().
+
+        The file is streamed in chunks to {file}.part and renamed to its final name once
+        its size matches the Content-Length (or Content-Range total) of the response, so
+        memory use is constant and a file at the final path is always complete. An
+        interrupted download is resumed with a Range request, by later retries or by the
+        next run. Completed downloads are recorded in the DownloadManifest of the folder
+        and skipped by later runs. A file at the final path that isn't in the manifest
+        (e.g. from a run before the manifest) is checked with a Range request from its
+        size, which costs one request if it's already complete. It's only moved to the
+        part file and resumed once the response shows that it's incomplete, so a failed
+        request never leaves a good file behind as a part file.
+
+        Returns:
+            str | NoneType: Path of the file, None if the download failed.
+        """
+
+        os.makedirs(folder, exist_ok=True)
+        file_path = os.path.join(folder, audiofileurl.rsplit("/")[-1])
+        part_path = file_path + ".part"
+        manifest = self.get_manifest(folder)
+        if manifest.is_complete(file_path):
+            return file_path
+
+        # checking: the unrecorded file at file_path is being checked, complete: it was complete
+        existing = {"checking": os.path.exists(file_path), "complete": False}
+
+        def get_offset():
+            if existing["checking"]:
+                return os.path.getsize(file_path)
+            return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        def get_headers():
+            headers = {"Accept-Encoding": "identity"}
+            offset = get_offset()
+            if offset > 0:
+                headers["Range"] = f"bytes={offset}-"
+            return headers
+
+        async def write_body(response):
+            offset = get_offset()
+            checking = existing["checking"]
+            start, total = parse_content_range(response.headers)
+
+            if response.status == 416:
+                # Range starts at the end of the file: the file is already complete
+                if total is not None and offset == total:
+                    existing["complete"] = checking
+                    return 200
+                if checking:
+                    # Keep the file until a new download of it is complete
+                    existing["checking"] = False
+                else:
+                    os.remove(part_path)
+                raise IncompleteDownload(f"Range {offset}- not satisfiable (size {total}), restarting")
+            if response.status == 206 and start == offset:
+                if checking:
+                    # The file is incomplete, resume it
+                    os.replace(file_path, part_path)
+                    existing["checking"] = False
+                mode, expected_size = "ab", total
+            elif response.status == 200:
+                if checking and response.content_length == offset:
+                    # Server ignored the Range header, the file has the full size
+                    existing["complete"] = True
+                    return 200
+                # Server ignored the Range header, start over
+                existing["checking"] = False
+                mode, expected_size = "wb", response.content_length
+            elif response.status == 206:
+                if checking:
+                    existing["checking"] = False
+                else:
+                    os.remove(part_path)
+                raise IncompleteDownload(f"Got bytes from {start}, expected {offset}, restarting")
+            else:
+                return response.status
+
+            with open(part_path, mode) as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    f.write(chunk)
+
+            size = os.path.getsize(part_path)
+            if expected_size is not None and size != expected_size:
+                if size > expected_size:
+                    os.remove(part_path)
+                raise IncompleteDownload(f"Got {size} of {expected_size} bytes")
+            return response.status
+
+        status = await self.request(audiofileurl, write_body, get_headers=get_headers)
+        if status != 200 and status != 206:
+            print(f"audiofileurl {audiofileurl} failed with code {status}")
+            return None
+
+        if not existing["complete"]:
+            os.replace(part_path, file_path)
+        manifest.add(file_path, audiofileurl)
+        return file_path
+
+
+async def gather_with_progress(coroutines, desc=None, rate_limiter=None):
+    """
+    Run coroutines concurrently and return their results in order. A coroutine that
+    raises RequestError gets the exception as its result, so one failed request
+    doesn't stop the others. If rate_limiter is given, its current rate, throughput and
+    rejection rate are shown in the progress bar.
+    """
+
+    progress = tqdm(total=len(coroutines), desc=desc)
+
+    async def run(coroutine):
+        try:
+            return await coroutine
+        except RequestError as e:
+            print(e)
+            return e
+        finally:
+            if rate_limiter is not None:
+                progress.set_postfix(rate_limiter.get_stats(), refresh=False)
+            progress.update(1)
+
+    results = await asyncio.gather(*[run(coroutine) for coroutine in coroutines])
+    progress.close()
+    return results
+
+
+def fetch_audio_metadata(rel_dok_ids, **client_kwargs):
+    """
+    Download the mhs-vodapi responses of many debates concurrently.
+
+    Args:
+        rel_dok_ids (list): rel_dok_ids of the debates.
+        **client_kwargs: Arguments of RiksdagenClient (concurrency, max_retries, cache,
+            cache_mode, ...).
+
+    Returns:
+        list: Response dict (None if no media, RequestError if failed) per rel_dok_id.
+    """
+
+    async def fetch():
+        async with RiksdagenClient(**client_kwargs) as client:
+            coroutines = [client.get_audio_metadata(rel_dok_id) for rel_dok_id in rel_dok_ids]
+            return await gather_with_progress(coroutines, desc="Audio metadata", rate_limiter=client.rate_limiter)
+
+    return asyncio.run(fetch())
+
+
+def fetch_audio_files(audiofileurls, folder="data/audio", **client_kwargs):
+    """
+    Download many mp3 files concurrently.
+
+    Args:
+        audiofileurls (list): Download URLs of the mp3 files.
+        folder (str): Folder to save the files to.
+        **client_kwargs: Arguments of RiksdagenClient (concurrency, max_retries,
+            rate_limiter, ...).
+
+    Returns:
+        list: Path (None or RequestError if failed) per URL.
+    """
+
+    async def fetch():
+        async with RiksdagenClient(**client_kwargs) as client:
+            coroutines = [client.get_audio_file(url, folder=folder) for url in audiofileurls]
+            return await gather_with_progress(coroutines, desc="Audio files", rate_limiter=client.rate_limiter)
+
+    return asyncio.run(fetch())
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from json import dumps, loads
+
+# Response headers used to revalidate cached responses, and the request headers they are sent back in
+VALIDATORS = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
+
+
+class ResponseCache:
+    """
+    On-disk cache of raw HTTP response bodies, keyed by e.g. rel_dok_id.
+
+    Bodies are stored gzip compressed and content addressed, in
+    {folder}/objects/{sha256[:2]}/{sha256}.gz where sha256 is the hash of the raw body,
+    so identical responses are stored once and a stored body is never modified. The
+    index {folder}/index.jsonl maps keys to body hashes and the validators (ETag,
+    Last-Modified) of the response, one json line per stored response. Later lines of a
+    key replace earlier ones, so the index keeps the history of a key. A line with
+    "removed": true removes the key.
+
+    Args:
+        folder (str): Folder of the cache, e.g. data/cache/mhs-vodapi.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.index_path = os.path.join(folder, "index.jsonl")
+        self.entries = {}
+        self.cut_off = False
+        os.makedirs(os.path.join(folder, "objects"), exist_ok=True)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    # A line cut off by an interrupted write is skipped, and ended before appending
+                    self.cut_off = not line.endswith("\n")
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("removed"):
+                        self.entries.pop(entry["key"], None)
+                    else:
+                        self.entries[entry["key"]] = entry
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_object_path(self, sha256):
+        return os.path.join(self.folder, "objects", sha256[:2], f"{sha256}.gz")
+
+    def read(self, key):
+        """
+        Returns:
+            bytes | NoneType: Cached body of key, None if key isn't cached or its stored
+                body is missing or corrupt (corrupt bodies are removed).
+        """
+
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        object_path = self.get_object_path(entry["sha256"])
+        try:
+            with gzip.open(object_path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError):
+            body = None
+
+        if body is None or hashlib.sha256(body).hexdigest() != entry["sha256"]:
+            # Remove the corrupt body so that put() stores it again
+            os.remove(object_path)
+            return None
+        return body
+
+    def get_validators(self, key):
+        """
+        Request headers (If-None-Match, If-Modified-Since) to revalidate the cached
+        response of key. Empty if key isn't cached or the response had no validators.
+        """
+
+        entry = self.entries.get(key, {})
+        return {header: entry[name] for name, header in VALIDATORS.items() if entry.get(name) is not None}
+
+    def put(self, key, body, headers=None, url=None):
+        """
+        Store the body of a response.
+
+        Args:
+            key (str): Key of the response, e.g. rel_dok_id.
+            body (bytes): Raw response body.
+            headers (dict | NoneType): Response headers, the validators are stored.
+            url (str | NoneType): URL of the request, stored for reference.
+        """
+
+        sha256 = hashlib.sha256(body).hexdigest()
+        object_path = self.get_object_path(sha256)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, object_path)
+
+        headers = headers or {}
+        validators = {name: headers.get(name) for name in VALIDATORS}
+        previous = self.entries.get(key)
+        if previous is not None and previous["sha256"] == sha256 and all(
+            previous.get(name) == value for name, value in validators.items()
+        ):
+            return
+
+        entry = {
+            "key": key,
+            "sha256": sha256,
+            "size": len(body),
+            **validators,
+            "url": url,
+            "fetched": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        self.entries[key] = entry
+        self.append_index(entry)
+
+    def remove(self, key):
+        """
+        Remove key from the cache, e.g. when its stored response turned out to be unusable.
+        The stored body is kept, as other keys may have the same body.
+        """
+
+        if self.entries.pop(key, None) is not None:
+            self.append_index({"key": key, "removed": True})
+
+    def append_index(self, entry):
+        with open(self.index_path, "a") as f:
+            f.write(("\n" if self.cut_off else "") + dumps(entry, ensure_ascii=False) + "\n")
+        self.cut_off = False
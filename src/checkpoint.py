@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+
+def read_manifest(checkpoint_dir):
+    """
+    Read the manifest of completed checkpoints.
+
+    The manifest (manifest.jsonl in checkpoint_dir) has one JSON line per written
+    checkpoint part with the keys "stage", "file", "dokids", "rows" and "created".
+
+    Args:
+        checkpoint_dir (str): Folder with checkpoints.
+
+    Returns:
+        list: List of manifest entries (dicts). A partially written last line
+            (e.g. after a crash) is ignored.
+    """
+
+    manifest_path = os.path.join(checkpoint_dir, "manifest.jsonl")
+    if not os.path.exists(manifest_path):
+        return []
+
+    entries = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Skipping corrupt line in {manifest_path}")
+
+    return entries
+
+
+def is_cut_off(path):
+    """
+    Whether the last line of a file is cut off (doesn't end with a newline), e.g. by a
+    crash while it was appended.
+    """
+
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def completed_dokids(checkpoint_dir, stage):
+    """
+    Set of dokids that have been completed and checkpointed for a stage.
+    """
+    return {dokid for entry in read_manifest(checkpoint_dir) if entry["stage"] == stage for dokid in entry["dokids"]}
+
+
+def write_checkpoint(df, checkpoint_dir, stage, dokids):
+    """
+    Write the results of some completed debates to a parquet part file and record
+    them in the manifest.
+
+    The part file is first written to a temporary file and then renamed, and the
+    manifest line is only appended after the part file is in place. A crash at any
+    point therefore never leaves a debate marked as completed without its results.
+
+    Args:
+        df (pd.DataFrame | NoneType): Results of the debates. None if there are no results,
+            in which case the debates are only marked as completed.
+        checkpoint_dir (str): Folder with checkpoints.
+        stage (str): Name of the pipeline stage, e.g. "transcription". Each stage gets
+            its own subfolder in checkpoint_dir.
+        dokids (list): The dokids of the debates in df.
+    """
+
+    dokids = sorted(str(dokid) for dokid in dokids)
+    part_name = hashlib.blake2b(",".join(dokids).encode("utf-8"), digest_size=8).hexdigest()
+    part_file = None
+
+    if df is not None:
+        os.makedirs(os.path.join(checkpoint_dir, stage), exist_ok=True)
+        part_file = os.path.join(stage, f"part-{part_name}.parquet")
+        part_path = os.path.join(checkpoint_dir, part_file)
+        df.to_parquet(f"{part_path}.tmp", index=False)
+        os.replace(f"{part_path}.tmp", part_path)
+
+    entry = {
+        "stage": stage,
+        "file": part_file,
+        "dokids": dokids,
+        "rows": 0 if df is None else len(df),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    manifest_path = os.path.join(checkpoint_dir, "manifest.jsonl")
+    # End a line cut off by an interrupted write, so the entry isn't appended to it and lost with it
+    prefix = "\n" if is_cut_off(manifest_path) else ""
+    with open(manifest_path, "a", encoding="utf-8") as f:
+        f.write(prefix + json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_checkpoints(checkpoint_dir, stage, columns=None, dokids=None, group_column="dokid"):
+    """
+    Read and concatenate the checkpointed parts of a stage.
+
+    Args:
+        checkpoint_dir (str): Folder with checkpoints.
+        stage (str): Name of the pipeline stage.
+        columns (list | NoneType): Columns to read. If None, read all columns.
+        dokids (list | NoneType): Only read the results of these debates, e.g. the debates
+            of the current run when earlier runs used other --min_date/--max_date. If None,
+            read the results of all completed debates.
+        group_column (str): Column identifying a debate in the results.
+
+    Returns:
+        pd.DataFrame: Results of the completed debates of the stage. Without results of
+            the debates, an empty DataFrame with the columns of the stage's parts.
+
+    Raises:
+        ValueError: If no results have been checkpointed for the stage at all, so its
+            columns are unknown (and columns is None).
+    """
+
+    stage_entries = [entry for entry in read_manifest(checkpoint_dir) if entry["stage"] == stage and entry["file"]]
+    entries = stage_entries
+    if dokids is not None:
+        dokids = {str(dokid) for dokid in dokids}
+        entries = [entry for entry in entries if not dokids.isdisjoint(entry["dokids"])]
+    if len(entries) == 0:
+        if len(stage_entries) > 0:
+            # Keep the columns (and types) of the stage, read from the schema of one of its parts
+            schema = pq.read_schema(os.path.join(checkpoint_dir, stage_entries[0]["file"]))
+            df = schema.empty_table().to_pandas()
+            return df if columns is None else df[columns]
+        if columns is not None:
+            return pd.DataFrame(columns=columns)
+        raise ValueError(
+            f"No results checkpointed for stage {stage} in {checkpoint_dir}, "
+            f"either there were no debates to process or none of them returned results."
+        )
+
+    read_columns = columns
+    if columns is not None and dokids is not None and group_column not in columns:
+        read_columns = list(columns) + [group_column]
+
+    df_parts = [pd.read_parquet(os.path.join(checkpoint_dir, entry["file"]), columns=read_columns) for entry in entries]
+    df = pd.concat(df_parts, ignore_index=True)
+    if dokids is not None:
+        # Parts of earlier runs can also contain debates outside of dokids
+        df = df[df[group_column].astype(str).isin(dokids)].reset_index(drop=True)
+
+    return df if columns is None else df[columns]
+
+
+def merge_checkpoints(checkpoint_dir, stage, output_path=None, dokids=None, group_column="dokid"):
+    """
+    Merge the checkpointed parts of a stage into a single DataFrame and optionally
+    save it to output_path.
+
+    Args:
+        checkpoint_dir (str): Folder with checkpoints.
+        stage (str): Name of the pipeline stage.
+        output_path (str | NoneType): Path of the merged parquet file.
+        dokids (list | NoneType): Only merge the results of these debates. If None, merge
+            the results of all completed debates, of all runs.
+        group_column (str): Column identifying a debate in the results.
+
+    Returns:
+        pd.DataFrame: Results of the completed debates of the stage.
+
+    Raises:
+        ValueError: If no results have been checkpointed for the stage.
+    """
+
+    df = read_checkpoints(checkpoint_dir, stage, dokids=dokids, group_column=group_column)
+    if output_path is not None:
+        df.to_parquet(output_path, index=False)
+
+    return df
+
+
+def run_checkpointed(df, process_function, checkpoint_dir, stage, group_column="dokid", batch_size=10):
+    """
+    Run process_function over the debates in df in batches, checkpointing the results
+    of every batch. Debates that were completed in a previous run (according to the
+    manifest) are skipped, so an interrupted run resumes where it stopped.
+
+    Args:
+        df (pd.DataFrame): Input data with one or several rows per debate.
+        process_function (function): Function taking the rows of a batch of debates
+            (pd.DataFrame) and returning a pd.DataFrame with the results (or None).
+        checkpoint_dir (str): Folder with checkpoints.
+        stage (str): Name of the pipeline stage.
+        group_column (str): Column identifying a debate.
+        batch_size (int): Number of debates per batch (and per checkpoint part).
+    """
+
+    completed = completed_dokids(checkpoint_dir, stage)
+    dokids = [dokid for dokid in df[group_column].unique() if str(dokid) not in completed]
+
+    if len(completed) > 0:
+        print(f"Stage {stage}: {len(completed)} debates already completed, {len(dokids)} left.")
+
+    for i in tqdm(range(0, len(dokids), batch_size), total=-(-len(dokids) // batch_size)):
+        batch_dokids = dokids[i : i + batch_size]
+        df_batch = df[df[group_column].isin(batch_dokids)].reset_index(drop=True)
+        df_result = process_function(df_batch)
+        write_checkpoint(df_result, checkpoint_dir, stage, batch_dokids)
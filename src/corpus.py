@@ -0,0 +1,205 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class TokenizedCorpus:
+    """
+    Store of whitespace tokenized texts shared by the matchers in src/metrics.py.
+
+    Each text is tokenized once and kept as an int32 array of token ids (indices into
+    a shared vocabulary) together with the character spans of every word. Texts are
+    keyed by a hash of their content, so the same text is only stored once no matter
+    how many speeches/rows it appears in (e.g. the anftext_inference of a debate).
+
+    The corpus can be saved to and loaded from a folder with two parquet files,
+    vocab.parquet and texts.parquet, so later pipeline stages can reuse it.
+    """
+
+    def __init__(self):
+        self.vocab = {}
+        self.words = []
+        self.token_ids = {}
+        self.word_spans = {}
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def __contains__(self, text):
+        return self.text_key(text) in self.token_ids
+
+    @staticmethod
+    def text_key(text):
+        """Content hash of a text, used as its key in the corpus."""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    @classmethod
+    def from_texts(cls, texts):
+        """
+        Create a corpus from an iterable of texts. None values are skipped.
+        """
+        corpus = cls()
+        corpus.add_texts(texts)
+        return corpus
+
+    def add(self, text):
+        """
+        Tokenize a text and add it to the corpus (unless it's already there).
+
+        Args:
+            text (str): Text to add.
+
+        Returns:
+            str: Key of the text in the corpus.
+        """
+
+        key = self.text_key(text)
+        if key in self.token_ids:
+            return key
+
+        vocab = self.vocab
+        words = self.words
+        word_spans = [match.span() for match in re.finditer(r"\S+", text)]
+        token_ids = []
+        for start, end in word_spans:
+            word = text[start:end]
+            token_id = vocab.get(word)
+            if token_id is None:
+                token_id = vocab[word] = len(words)
+                words.append(word)
+            token_ids.append(token_id)
+
+        self.token_ids[key] = np.array(token_ids, dtype=np.int32)
+        self.word_spans[key] = np.array(word_spans, dtype=np.int32).reshape(-1, 2)
+        return key
+
+    def add_texts(self, texts):
+        """
+        Add several texts to the corpus. Returns list of keys (None for missing texts,
+        None or NaN).
+        """
+        return [self.add(text) if isinstance(text, str) else None for text in texts]
+
+    def subset(self, texts):
+        """
+        New corpus with only the given texts (None values are skipped), e.g. to send to
+        worker processes only the texts they match instead of the whole shared corpus.
+        Texts not in the corpus yet are added to it first.
+
+        The vocabulary of the subset only has the words of its texts, so token ids are
+        renumbered, and the token ids of the subset can't be compared with the ones of
+        the full corpus.
+
+        Returns:
+            TokenizedCorpus: Corpus with the given texts.
+        """
+
+        keys = list(dict.fromkeys(key for key in self.add_texts(texts) if key is not None))
+        subset = TokenizedCorpus()
+        if len(keys) == 0:
+            return subset
+
+        used_ids = np.unique(np.concatenate([self.token_ids[key] for key in keys]))
+        subset.words = [self.words[token_id] for token_id in used_ids]
+        subset.vocab = {word: token_id for token_id, word in enumerate(subset.words)}
+        for key in keys:
+            subset.token_ids[key] = np.searchsorted(used_ids, self.token_ids[key]).astype(np.int32)
+            subset.word_spans[key] = self.word_spans[key]
+        return subset
+
+    def get_token_ids(self, text):
+        """
+        Token ids of text. The text is tokenized and added if not already in the corpus.
+
+        Returns:
+            np.array: int32 array of token ids, one per whitespace separated word.
+        """
+        return self.token_ids[self.add(text)]
+
+    def get_word_spans(self, text):
+        """
+        Character spans of the words in text. The text is added if not already in the corpus.
+
+        Returns:
+            np.array: int32 array of shape (n_words, 2) with the start and end character
+                offsets of each whitespace separated word.
+        """
+        return self.word_spans[self.add(text)]
+
+    def get_tokens(self, text):
+        """List of the words in text, as given by text.split(), read from the corpus."""
+        words = self.words
+        return [words[token_id] for token_id in self.get_token_ids(text)]
+
+    def save(self, folder="data/corpus"):
+        """
+        Save vocabulary and tokenized texts to folder/vocab.parquet and folder/texts.parquet.
+
+        Each file is written to a temporary file first and then renamed. The vocabulary is
+        written first, and token ids are only ever appended to it, so an interrupted save
+        never leaves texts with token ids missing from the vocabulary.
+        """
+
+        os.makedirs(folder, exist_ok=True)
+        vocab = pa.table(
+            {
+                "token_id": pa.array(np.arange(len(self.words), dtype=np.int32)),
+                "word": pa.array(self.words, type=pa.string()),
+            }
+        )
+        keys = list(self.token_ids)
+        texts = pa.table(
+            {
+                "key": pa.array(keys, type=pa.string()),
+                "token_ids": pa.array([self.token_ids[key] for key in keys], type=pa.list_(pa.int32())),
+                "word_spans": pa.array(
+                    [self.word_spans[key].ravel() for key in keys], type=pa.list_(pa.int32())
+                ),
+            }
+        )
+        for table, name in [(vocab, "vocab.parquet"), (texts, "texts.parquet")]:
+            path = os.path.join(folder, name)
+            pq.write_table(table, f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, folder="data/corpus", missing_ok=False):
+        """
+        Load a corpus saved with TokenizedCorpus.save().
+
+        The pipeline stages share one corpus: each stage loads it, adds its texts (only
+        texts not already in the corpus are tokenized) and saves it again.
+
+        Args:
+            folder (str): Folder of the corpus.
+            missing_ok (bool): Return an empty corpus if nothing has been saved to folder yet.
+
+        Returns:
+            TokenizedCorpus: The loaded corpus.
+        """
+
+        corpus = cls()
+        if missing_ok and not os.path.exists(os.path.join(folder, "texts.parquet")):
+            return corpus
+
+        vocab = pq.read_table(os.path.join(folder, "vocab.parquet"))
+        corpus.words = vocab["word"].to_pylist()
+        corpus.vocab = {word: token_id for token_id, word in enumerate(corpus.words)}
+
+        texts = pq.read_table(os.path.join(folder, "texts.parquet"))
+        token_ids = texts["token_ids"].combine_chunks()
+        word_spans = texts["word_spans"].combine_chunks()
+        token_values = token_ids.values.to_numpy()
+        token_offsets = token_ids.offsets.to_numpy()
+        span_values = word_spans.values.to_numpy()
+        span_offsets = word_spans.offsets.to_numpy()
+
+        for i, key in enumerate(texts["key"].to_pylist()):
+            corpus.token_ids[key] = token_values[token_offsets[i] : token_offsets[i + 1]]
+            corpus.word_spans[key] = span_values[span_offsets[i] : span_offsets[i + 1]].reshape(-1, 2)
+
+        return corpus
@@ -1,11 +1,146 @@
 import shutil
 import os
+import json
+import codecs
+import zipfile
 import pandas as pd
 import string
 import re
+import unicodedata
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from tqdm import tqdm
 from num2words import num2words
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Fields of the mhs-vodapi responses kept in the audio metadata (see preprocess_audio_metadata()),
+# with their Arrow types (pa.type_for_alias() names). audio_metadata_to_arrow() gives every batch of
+# responses these types, whatever values it happens to contain. write_metadata() and read_metadata()
+# in src/schema.py cast them to the compact types of the metadata files.
+AUDIO_METADATA_COLUMNS = {
+    "dokid": "string",
+    "party": "string",
+    "start": "float64",
+    "duration": "float64",
+    "debateseconds": "float64",
+    "title": "string",
+    "text": "string",
+    "debatename": "string",
+    "debatedate": "string",
+    "url": "string",
+    "debateurl": "string",
+    "id": "string",
+    "subid": "string",
+    "audiofileurl": "string",
+    "downloadfileurl": "string",
+    "debatetype": "string",
+    "number": "int64",
+    "anftext": "string",
+}
+
+# Month names of Swedish dates ("%B" in the sv_SE locale)
+SWEDISH_MONTHS = {
+    "januari": 1,
+    "februari": 2,
+    "mars": 3,
+    "april": 4,
+    "maj": 5,
+    "juni": 6,
+    "juli": 7,
+    "augusti": 8,
+    "september": 9,
+    "oktober": 10,
+    "november": 11,
+    "december": 12,
+}
+
+
+def audio_metadata_to_arrow(speech_metadata_list, rel_dok_ids=None):
+    """
+    Flatten many mhs-vodapi responses to one pyarrow table with one row per speaker
+    (speech), in a single pass over the responses.
+
+    Every row has the fields of its video, of the first media file of the video's stream
+    and of the speaker (later ones take precedence). Videos without speakers get a single
+    row with missing speaker fields.
+
+    Args:
+        speech_metadata_list (list): Responses (dicts with a "videodata" list) from
+            src.api.get_audio_metadata(..., raw=True).
+        rel_dok_ids (list | NoneType): rel_dok_id of each response. If given, it is added
+            as a column.
+
+    Returns:
+        pa.Table: Table with the AUDIO_METADATA_COLUMNS and their types (and rel_dok_id).
+    """
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    def to_array(values, value_type):
+        try:
+            return pa.array(values, type=value_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Values of another JSON type, e.g. numbers sent as strings, are cast from their string form
+            return pc.cast(pa.array([None if value is None else str(value) for value in values]), value_type)
+
+    columns = {column: [] for column in AUDIO_METADATA_COLUMNS}
+    rel_dok_id_values = []
+
+    for i, speech_metadata in enumerate(speech_metadata_list):
+        for video in speech_metadata["videodata"]:
+            streams = video.get("streams") or {}
+            files = streams.get("files") or [{}]
+            video_fields = {**video, **files[0]}
+            for speaker in video.get("speakers") or [None]:
+                fields = video_fields if speaker is None else {**video_fields, **speaker}
+                for column, values in columns.items():
+                    values.append(fields.get(column))
+                if rel_dok_ids is not None:
+                    rel_dok_id_values.append(rel_dok_ids[i])
+
+    table = pa.table(
+        {
+            column: to_array(values, pa.type_for_alias(AUDIO_METADATA_COLUMNS[column]))
+            for column, values in columns.items()
+        }
+    )
+    if rel_dok_ids is not None:
+        table = table.append_column("rel_dok_id", pa.array(rel_dok_id_values, type=pa.string()))
+    return table
+
+
+def parse_swedish_dates(dates):
+    """
+    Parse Swedish dates such as "15 januari 2020" (debatedate in the mhs-vodapi responses)
+    with vectorized string operations. Gives the same result as
+    pd.to_datetime(dates, format="%d %B %Y") in the sv_SE locale, without the locale
+    having to be installed and set.
+
+    Args:
+        dates (pd.Series): Dates as strings. Missing values become NaT.
+
+    Returns:
+        pd.Series: Parsed dates.
+    """
+
+    dates = dates.astype("string")
+    parts = dates.str.lower().str.extract(r"^\s*(\d{1,2})\s+(\w+)\s+(\d{4})\s*$")
+    months = parts[1].map(SWEDISH_MONTHS).astype("Int64")
+
+    invalid = dates.notna() & months.isna()
+    if invalid.any():
+        raise ValueError(f"Unknown Swedish date format: {dates[invalid].iloc[0]!r}")
+
+    iso_dates = parts[2] + "-" + months.astype("string").str.zfill(2) + "-" + parts[0].str.zfill(2)
+    return pd.to_datetime(iso_dates, format="%Y-%m-%d")
+
 
 def preprocess_audio_metadata(speech_metadata):
     """
@@ -19,107 +154,384 @@ def preprocess_audio_metadata(speech_metadata):
         pd.DataFrame: A pandas dataframe with the relevant metadata fields.
     """
 
-    df = pd.DataFrame(speech_metadata["videodata"])
-    df = df.explode("speakers").reset_index(drop=True)
-    df_files = pd.json_normalize(df["streams"], ["files"])
-    df_speakers = pd.json_normalize(df["speakers"])
-    df = df.drop(columns=["streams", "speakers"])
-    df = pd.concat([df, df_files], axis=1)
-    df = pd.concat([df, df_speakers], axis=1)
-
-    df = df[
-        [
-            "dokid",
-            "party",
-            "start",
-            "duration",
-            "debateseconds",
-            "title",
-            "text",
-            "debatename",
-            "debatedate",
-            "url",
-            "debateurl",
-            "id",
-            "subid",
-            "audiofileurl",
-            "downloadfileurl",
-            "debatetype",
-            "number",
-            "anftext",
-        ]
-    ]
-
+    df = audio_metadata_to_arrow([speech_metadata]).to_pandas()
     df = preprocess_text(df, is_audio_metadata=True)
 
     return df
 
 
-def preprocess_text(df, textcol="anftext", is_audio_metadata=False):
+def preprocess_audio_metadata_batch(speech_metadata_list, rel_dok_ids=None, cleaner=None, engine="python"):
+    """
+    Preprocess many mhs-vodapi responses at once: flatten them to one table, clean all
+    texts in one go and parse debatedate.
+
+    Args:
+        speech_metadata_list (list): Responses, see audio_metadata_to_arrow().
+        rel_dok_ids (list | NoneType): rel_dok_id of each response.
+        cleaner (TextCleaner | NoneType): Cleaner to use, see preprocess_text().
+        engine (str): "python" or "pyarrow", see TextCleaner.clean_column().
+
+    Returns:
+        pd.DataFrame: A pandas dataframe with the relevant metadata fields, like
+            preprocess_audio_metadata() for all responses concatenated, with debatedate
+            parsed to datetimes.
+    """
+
+    df = audio_metadata_to_arrow(speech_metadata_list, rel_dok_ids).to_pandas()
+    df = preprocess_text(df, is_audio_metadata=True, cleaner=cleaner, engine=engine)
+    df["debatedate"] = parse_swedish_dates(df["debatedate"])
+
+    return df
+
+
+# Headers mistakenly included in the text as paragraphs, removed by preprocess_text().
+STYLEREF_PATTERNS = [
+    r"(<p> STYLEREF.*?</p>)",
+    r"(<p>Gransknings- STYLEREF.*?</p>)",
+    r"(<p><em></em><em> STYLEREF.*?</p>)",
+]
+
+# Speaker of the house or other text not part of actual speech. Found at the end of a transcript.
+# Everything from the start of the pattern to the end of the line is removed.
+END_OF_SPEECH_PATTERNS = [
+    r"Interpellationsdebatten var [h|d]ärmed avslutad",
+    r"Partiledardebatten var [h|d]ärmed avslutad",
+    r"Frågestunden var [h|d]ärmed avslutad",
+    r"Överläggningen var [h|d]ärmed avslutad",
+    r"Den särskilda debatten var [h|d]ärmed avslutad",
+    r"Statsministerns frågestund var [h|d]ärmed avslutad",
+    r"Återrapporteringen var [h|d]ärmed avslutad",
+    r"Den muntliga frågestunden var [h|d]ärmed avslutad",
+    r"Den utrikespolitiska debatten var [h|d]ärmed avslutad",
+    r"Den allmänpolitiska debatten var härmed avslutad",
+    r"Den aktuella debatten var härmed avslutad",
+    r"Informationen var härmed avslutad",
+    r"Den EU-politiska (partiledar)?debatten var härmed avslutad",
+    r"Debatten med anledning av (vår|budget)propositionens avlämnande var härmed avslutad",
+    r"I detta anförande instämde",
+]
+
+# \s of the regexes of preprocess_text(). pandas runs the .str regexes of Arrow backed string columns
+# (the default str dtype in pandas 3) with RE2, where \s only matches ASCII whitespace, and those of
+# object columns with Python's re, where \s also matches Unicode whitespace (what str.strip() strips).
+# WHITESPACE_CLASS is Python's \s written for RE2.
+RE2_WHITESPACE_CLASS = r"[\t\n\f\r ]"
+WHITESPACE_CLASS = r"[\t\n\x{0b}\x{0c}\r\x{1c}-\x{1f} \x{85}\x{a0}\x{1680}\x{2000}-\x{200a}\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}]"
+
+
+def uses_re2(dtype):
+    """
+    Whether pandas runs the .str regexes of a column of dtype with RE2 (pyarrow.compute)
+    rather than with Python's re.
+    """
+    if isinstance(dtype, pd.ArrowDtype):
+        return True
+    return isinstance(dtype, pd.StringDtype) and dtype.storage.startswith("pyarrow")
+
+
+def escape_re2(text):
+    """
+    Escape a literal string for use in a RE2 regex (pyarrow.compute).
+    """
+    return re.sub(r"([\\.^$|?*+()\[\]{}])", r"\\\1", text)
+
+
+class TextCleaner:
+    """
+    Cleans the text of speeches (see preprocess_text()) in a single pass per text,
+    with regexes and header lookups that are compiled once when the cleaner is created.
+
+    Headers are removed by matching every innermost <p>...</p> paragraph once and looking
+    its content up in a set of headers, instead of one replace per header. In the rare case
+    where removing one header joins the text around it into another header, the text is
+    cleaned with the original header by header replacement instead, so the output is always
+    identical to replacing the headers one by one.
+
+    The output is identical to the step by step str.replace() calls preprocess_text() used
+    to make, for both dtypes of text columns: unicode_whitespace=False handles whitespace
+    like pandas does for Arrow backed string columns, unicode_whitespace=True like it does
+    for object columns (see uses_re2()).
+
+    Args:
+        headers (list): Headers (avsnittsrubrik) to remove when they appear as <p>{header}</p>.
+    """
+
+    def __init__(self, headers):
+        self.styleref_regexes = [re.compile(pattern) for pattern in STYLEREF_PATTERNS]
+        self.header_patterns = [f"<p>{header}</p>" for header in headers]
+        self.paragraph_regex = re.compile(r"<p>((?:(?!<p>).)*?)</p>", re.DOTALL)
+        self.tag_regex = re.compile(r"<.*?>")
+        self.parenthesis_regex = re.compile(r"\(.*?\)")
+        self.end_of_speech_regex = re.compile("(?:" + "|".join(END_OF_SPEECH_PATTERNS) + ").*")
+        self.whitespace_regexes = {
+            False: re.compile(f"({RE2_WHITESPACE_CLASS}){{2,}}"),
+            True: re.compile(r"(\s){2,}"),
+        }
+
+        # Headers that contain paragraph tags themselves can't be found as a single paragraph
+        self.header_texts = set()
+        self.nested_header_patterns = []
+        for pattern in self.header_patterns:
+            header = pattern[3:-4]
+            if "<p>" in header or "</p>" in header:
+                self.nested_header_patterns.append(pattern)
+            else:
+                self.header_texts.add(header)
+
+    def remove_header_paragraph(self, match):
+        return "" if match.group(1) in self.header_texts else match.group(0)
+
+    def has_header(self, text):
+        return any(match.group(1) in self.header_texts for match in self.paragraph_regex.finditer(text))
+
+    def remove_headers(self, text):
+        """
+        Remove all <p>{header}</p> from text.
+        """
+
+        if "<p>" not in text:
+            return text
+
+        if not any(pattern in text for pattern in self.nested_header_patterns):
+            cleaned = self.paragraph_regex.sub(self.remove_header_paragraph, text)
+            # Removing headers didn't create new ones, so the order of removal doesn't matter
+            if cleaned == text or not self.has_header(cleaned):
+                return cleaned
+
+        for pattern in self.header_patterns:
+            text = text.replace(pattern, "")
+        return text
+
+    def clean(self, text, unicode_whitespace=False):
+        """
+        Clean a single text. See preprocess_text().
+
+        Args:
+            text (str): Text to clean.
+            unicode_whitespace (bool): Collapse runs of Unicode whitespace rather than only
+                ASCII whitespace, see uses_re2().
+        """
+
+        for regex in self.styleref_regexes:
+            text = regex.sub("", text)
+        text = self.remove_headers(text)
+        text = self.tag_regex.sub(" ", text)  # Remove HTML tags
+        text = self.parenthesis_regex.sub("", text)  # Remove text within parentheses, e.g. (applåder)
+        text = self.end_of_speech_regex.sub("", text)
+        text = text.strip()
+        text = unicodedata.normalize("NFKC", text)  # Normalize unicode characters
+        text = self.whitespace_regexes[unicode_whitespace].sub(" ", text)  # Remove multiple spaces
+        text = text.replace("&amp;", "&")
+        return text
+
+    def clean_arrow(self, texts, unicode_whitespace=False):
+        """
+        Clean a pyarrow string array with pyarrow.compute kernels. Texts where removing one
+        header creates another are cleaned with clean() instead.
+
+        Args:
+            texts (pa.Array): Array of texts.
+            unicode_whitespace (bool): See clean().
+
+        Returns:
+            pa.Array: Cleaned texts.
+        """
+
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        cleaned = texts
+        for pattern in STYLEREF_PATTERNS:
+            cleaned = pc.replace_substring_regex(cleaned, pattern=pattern, replacement="")
+
+        fallback = pa.array([False] * len(texts))
+        if len(self.header_texts) > 0:
+            header_regex = "<p>(?:" + "|".join(escape_re2(header) for header in self.header_texts) + ")</p>"
+            cleaned = pc.replace_substring_regex(cleaned, pattern=header_regex, replacement="")
+            fallback = pc.or_(fallback, pc.fill_null(pc.match_substring_regex(cleaned, pattern=header_regex), False))
+        for pattern in self.nested_header_patterns:
+            fallback = pc.or_(fallback, pc.fill_null(pc.match_substring(texts, pattern=pattern), False))
+
+        cleaned = pc.replace_substring_regex(cleaned, pattern=r"<.*?>", replacement=" ")
+        cleaned = pc.replace_substring_regex(cleaned, pattern=r"\(.*?\)", replacement="")
+        cleaned = pc.replace_substring_regex(
+            cleaned, pattern="(?:" + "|".join(END_OF_SPEECH_PATTERNS) + ").*", replacement=""
+        )
+        cleaned = pc.utf8_trim_whitespace(cleaned)
+        # Not pc.utf8_normalize(), its Unicode version can be newer than that of unicodedata
+        cleaned = pa.array(
+            [None if text is None else unicodedata.normalize("NFKC", text) for text in cleaned.to_pylist()],
+            type=cleaned.type,
+        )
+        whitespace_class = WHITESPACE_CLASS if unicode_whitespace else RE2_WHITESPACE_CLASS
+        cleaned = pc.replace_substring_regex(cleaned, pattern=f"({whitespace_class}){{2,}}", replacement=" ")
+        cleaned = pc.replace_substring(cleaned, pattern="&amp;", replacement="&")
+
+        fallback_rows = pc.indices_nonzero(fallback).to_pylist()
+        if len(fallback_rows) > 0:
+            values = cleaned.to_pylist()
+            for row in fallback_rows:
+                values[row] = self.clean(texts[row].as_py(), unicode_whitespace)
+            cleaned = pa.array(values, type=cleaned.type)
+
+        return cleaned
+
+    def clean_column(self, texts, engine="python", threads=None, chunk_size=10000):
+        """
+        Clean a column of texts. Missing values are kept as they are, and other values that
+        are not strings become NaN, like with the pandas .str methods. Whitespace is handled
+        like the .str methods handle it for the dtype of texts, see uses_re2().
+
+        Args:
+            texts (pd.Series): Texts to clean.
+            engine (str): "python" cleans each text with clean(). "pyarrow" cleans chunks of
+                the column with pyarrow.compute kernels in a thread pool.
+            threads (int | NoneType): Number of threads for the "pyarrow" engine.
+            chunk_size (int): Number of texts per chunk for the "pyarrow" engine.
+
+        Returns:
+            pd.Series: Cleaned texts, with the same index and dtype as texts.
+        """
+
+        unicode_whitespace = not uses_re2(texts.dtype)
+        values = texts.tolist()
+        is_text = [isinstance(value, str) for value in values]
+        strings = [value for value, text in zip(values, is_text) if text]
+
+        if engine == "python":
+            cleaned = [self.clean(value, unicode_whitespace) for value in strings]
+        elif engine == "pyarrow":
+            import pyarrow as pa
+
+            chunks = [
+                pa.array(strings[i : i + chunk_size], type=pa.large_string())
+                for i in range(0, len(strings), chunk_size)
+            ]
+            with ThreadPoolExecutor(threads) as pool:
+                cleaned = pool.map(partial(self.clean_arrow, unicode_whitespace=unicode_whitespace), chunks)
+                cleaned = [value for chunk in cleaned for value in chunk.to_pylist()]
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+
+        cleaned = iter(cleaned)
+        values = [
+            next(cleaned) if text else (None if value is None else float("nan")) for value, text in zip(values, is_text)
+        ]
+        return pd.Series(values, index=texts.index, dtype=texts.dtype, name=texts.name)
+
+
+@lru_cache(maxsize=4)
+def load_text_cleaner(headers_path, modified_time):
+    """
+    TextCleaner for the headers in headers_path, cached by path and modification time.
+    """
+    return TextCleaner(pd.read_csv(headers_path)["avsnittsrubrik"].tolist())
+
+
+def get_text_cleaner(headers_path="data/headers.csv"):
+    """
+    Get the TextCleaner of headers_path. The headers file is only read again if it has
+    been modified since the last call.
+    """
+    return load_text_cleaner(headers_path, os.path.getmtime(headers_path))
+
+
+def preprocess_text(df, textcol="anftext", is_audio_metadata=False, cleaner=None, engine="python", threads=None):
     """
     Preprocess the text field.
 
     Args:
         df (pd.DataFrame): A pandas dataframe that contains text column with speeches.
         textcol (str): The name of the text column.
+        cleaner (TextCleaner | NoneType): Cleaner to use. If None, a cleaner with the headers
+            in data/headers.csv (created in scripts/preprocess_speeches_metadata.py) is used.
+        engine (str): "python" or "pyarrow", see TextCleaner.clean_column().
+        threads (int | NoneType): Number of threads for the "pyarrow" engine.
 
     Returns:
         pd.DataFrame: A pandas dataframe with preprocessed text column.
     """
 
-    # Remove all text within <p> tags that contain "STYLEREF".
-    # These are headers mistakenly included in the text as paragraphs.
-    df[textcol] = df[textcol].str.replace(r"(<p> STYLEREF.*?</p>)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(<p>Gransknings- STYLEREF.*?</p>)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(<p><em></em><em> STYLEREF.*?</p>)", "", regex=True)
-
-    # Some extra headers that don't contain "STYLEREF", but are still in <p> tags.
-    # We grab the headers from the header column and remove "<p>{header}</p>" from the text column.
-    # data/headers.csv is created in scripts/preprocess_speeches_metadata.py.
-    headers = pd.read_csv("data/headers.csv")["avsnittsrubrik"].tolist()
-
-    for header in headers:
-        remove_header_p = f"<p>{header}</p>"
-        df[textcol] = df[textcol].str.replace(remove_header_p, "", regex=False)
-
-    df[textcol] = df[textcol].str.replace(r"<.*?>", " ", regex=True)  # Remove HTML tags
-    # Remove text within parentheses, e.g. (applåder)
-    df[textcol] = df[textcol].str.replace(r"\(.*?\)", "", regex=True)
-
-    # Speaker of the house or other text not part of actual speech.
-    # Found at the end of a transcript.
-    df[textcol] = df[textcol].str.replace(r"(Interpellationsdebatten var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Partiledardebatten var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Frågestunden var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Överläggningen var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Den särskilda debatten var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Statsministerns frågestund var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Återrapporteringen var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Den muntliga frågestunden var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Den utrikespolitiska debatten var [h|d]ärmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Den allmänpolitiska debatten var härmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Den aktuella debatten var härmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(r"(Informationen var härmed avslutad.*)", "", regex=True)
-    df[textcol] = df[textcol].str.replace(
-        r"(Den EU-politiska (partiledar)?debatten var härmed avslutad.*)", "", regex=True
-    )
-    df[textcol] = df[textcol].str.replace(
-        r"(Debatten med anledning av (vår|budget)propositionens avlämnande var härmed avslutad.*)", "", regex=True
-    )
-    df[textcol] = df[textcol].str.replace(r"(I detta anförande instämde.*)", "", regex=True)
-
-    df[textcol] = df[textcol].str.strip()
+    if cleaner is None:
+        cleaner = get_text_cleaner("data/headers.csv")
 
-    # Normalize text
-    df[textcol] = df[textcol].str.normalize("NFKC")  # Normalize unicode characters
-    # Remove multiple spaces
-    df[textcol] = df[textcol].str.replace(r"(\s){2,}", " ", regex=True)
-    # Replace &amp; with &
-    df[textcol] = df[textcol].str.replace(r"&amp;", "&", regex=True)
+    df[textcol] = cleaner.clean_column(df[textcol], engine=engine, threads=threads)
 
     return df
 
 
+def parse_json(data):
+    """
+    Parse json bytes with orjson if it is installed, otherwise with the json module.
+    A leading UTF-8 byte order mark (as in Riksdagen's json files) is skipped.
+    """
+    data = data.removeprefix(codecs.BOM_UTF8)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def iter_zip_speeches(zip_path):
+    """
+    Iterate over the speeches in a zip archive of Riksdagen's anföranden (as downloaded by
+    download_text_anforanden.sh), reading the json files directly from the archive
+    without unzipping it.
+
+    Args:
+        zip_path (str): Path to the zip archive, e.g. data/json/anforande-202223.json.zip.
+
+    Yields:
+        dict: The "anforande" field of each json file.
+    """
+
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or not member.filename.endswith(".json"):
+                continue
+            yield parse_json(archive.read(member))["anforande"]
+
+
+def iter_json_speeches(json_files):
+    """
+    Iterate over the speeches in (unzipped) json files of Riksdagen's anföranden.
+
+    Yields:
+        dict: The "anforande" field of each json file.
+    """
+
+    for file in json_files:
+        with open(file, "rb") as f:
+            yield parse_json(f.read())["anforande"]
+
+
+def iter_speech_batches(speeches, schema, batch_size=10000):
+    """
+    Group speeches into pyarrow record batches, so that they can be processed and written
+    to parquet incrementally instead of collecting all of them in a list of dicts.
+
+    Args:
+        speeches (iterable): Speech dicts, e.g. from iter_zip_speeches().
+        schema (pa.Schema): Schema of the batches. Fields missing from a speech are null,
+            and fields not in the schema are dropped.
+        batch_size (int): Number of speeches per batch.
+
+    Yields:
+        pa.RecordBatch: Batches of at most batch_size speeches.
+    """
+
+    import pyarrow as pa
+
+    batch = []
+    for speech in speeches:
+        batch.append(speech)
+        if len(batch) == batch_size:
+            yield pa.RecordBatch.from_pylist(batch, schema=schema)
+            batch = []
+
+    if len(batch) > 0:
+        yield pa.RecordBatch.from_pylist(batch, schema=schema)
+
+
 def audio_to_dokid_folder(df, folder="data/audio"):
     """
     Move audio files to a folder named after the dokid.
@@ -192,7 +604,71 @@ def coalesce_columns(df, col1="anftext", col2="anforandetext"):
     return df
 
 
-def normalize_text(df, column_in, column_out):
+@lru_cache(maxsize=100000)
+def number_to_words(number):
+    """
+    Swedish words for a number, cached since the same numbers (years, bill numbers)
+    occur over and over.
+    """
+    return num2words(number, lang="sv")
+
+
+# Lowercasing of the characters where str.lower() applies special casing: "İ" becomes "i" (not
+# "i̇" with a combining dot) and "Σ" always becomes "σ" (not "ς" at the end of a word). Fixed
+# here so that normalized texts don't depend on the pandas version or string backend.
+LOWERCASE_FIXES = {"İ": "i", "Σ": "σ"}
+
+
+class TextNormalizer:
+    """
+    Normalizes speech texts like normalize_text(), with all steps fused into a single pass
+    per text and the translation table and regexes built once.
+
+    Texts that only contain lowercase letters and spaces (e.g. wav2vec2 transcripts) can't
+    be changed by any step other than collapsing multiple spaces, so the other steps are
+    skipped for them. Texts are lowercased with str.lower(), except for the characters in
+    LOWERCASE_FIXES.
+    """
+
+    def __init__(self):
+        self.punctuation_table = str.maketrans("", "", string.punctuation)
+        self.punctuation_table.update(str.maketrans(LOWERCASE_FIXES))
+        self.plain_text_regex = re.compile(r"[^ a-zåäöéüæøß]")
+        self.hyphen_regex = re.compile(r"(?<=\w)-(?=\w)")
+        self.multiple_space_regex = re.compile(" {2,}")
+        self.digit_space_regex = re.compile(r"(?<=\d) (?=\d)")
+        self.number_regex = re.compile(r"\d+")
+
+    def number_to_words(self, match):
+        return number_to_words(int(match.group(0)))
+
+    def normalize(self, text):
+        """
+        Normalize a single text. See normalize_text().
+        """
+
+        if self.plain_text_regex.search(text) is None:
+            return self.multiple_space_regex.sub(" ", text) if "  " in text else text
+
+        text = text.translate(self.punctuation_table).lower()
+        if not text.isascii():
+            text = unicodedata.normalize("NFKC", text)  # Normalize unicode characters
+        if "-" in text:
+            text = self.hyphen_regex.sub(" ", text)  # Remove hyphen between words
+        if "  " in text:
+            text = self.multiple_space_regex.sub(" ", text)
+        text = self.digit_space_regex.sub("", text)  # Remove whitespace between numbers
+        return self.number_regex.sub(self.number_to_words, text)  # Convert numbers to words
+
+    def normalize_texts(self, texts):
+        """
+        Normalize a list of texts. Missing values (anything that is not a string) are
+        returned as None.
+        """
+        return [self.normalize(text) if isinstance(text, str) else None for text in texts]
+
+
+def normalize_text(df, column_in, column_out, processes=1, chunk_size=5000):
     """
     Normalize speech text transcript by removing punctuation, converting numbers to words,
     replacing hyphens joining words with whitespace, and lowercasing the text.
@@ -201,24 +677,23 @@ def normalize_text(df, column_in, column_out):
         df (pd.DataFrame): A pandas dataframe that contains text column anftext with speeches.
         column_in (str): The name of the text column to normalize.
         column_out (str): The name of the normalized text column.
+        processes (int | NoneType): Number of processes normalizing chunks of the column in
+            parallel. 1 normalizes in the current process, None uses all available processes.
+        chunk_size (int): Number of texts per chunk when processes != 1.
     Returns:
         pd.DataFrame: A pandas dataframe with normalized text column `column_out`.
     """
-    df[column_out] = df[column_in].apply(
-        lambda x: None if x is None else x.translate(str.maketrans("", "", string.punctuation))
-    )
-    df[column_out] = df[column_out].str.lower()
-    # df[column_out] = df[column_out].str.replace("\xa0", " ")
-    df[column_out] = df[column_out].str.normalize("NFKC")  # Normalize unicode characters
-    # Remove hyphen between words
-    df[column_out] = df[column_out].str.replace("(?<=\w)-(?=\w)", " ", regex=True)
-    # Remove multiple spaces and replace with single space
-    df[column_out] = df[column_out].str.replace(" +", " ", regex=True)
-    # Remove whitespace between numbers
-    df[column_out] = df[column_out].str.replace("(?<=\d) (?=\d)", "", regex=True)
-    # Convert numbers to words
-    df[column_out] = df[column_out].apply(
-        lambda x: None if x is None else re.sub(r"\d+", lambda m: num2words(int(m.group(0)), lang="sv"), x)
-    )
+
+    normalizer = TextNormalizer()
+    texts = df[column_in].tolist()
+
+    if processes == 1:
+        normalized = normalizer.normalize_texts(texts)
+    else:
+        chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        with mp.Pool(processes) as pool:
+            normalized = [text for chunk in pool.imap(normalizer.normalize_texts, chunks) for text in chunk]
+
+    df[column_out] = pd.Series(normalized, index=df.index)
 
     return df
@@ -6,6 +6,7 @@ import torchaudio
 from torch.utils.data import Dataset
 from tqdm import tqdm
 from transformers import pipeline
+from src.schema import read_metadata
 
 
 class AnforandeDataset(Dataset):
@@ -39,7 +40,7 @@ class DiarizationDataset(Dataset):
         self._full_debate = full_debate
         self.folder = folder
         if self._full_debate:
-            self.df = df.groupby("dokid").first().reset_index()
+            self.df = df.groupby("dokid", observed=True).first().reset_index()
             self.filepaths = self.df["filename"]
         else:
             # Process files on the speech level.
@@ -80,8 +81,7 @@ class DiarizationDataset(Dataset):
 
 if __name__ == "__main__":
     pipe = pipeline(model="KBLab/wav2vec2-large-voxrex-swedish", device=0)
-    df = pd.read_parquet("data/df_audio_metadata.parquet")
-    df = df.reset_index(drop=True)
+    df = read_metadata("data/df_audio_metadata.parquet", compact=False)
     anforande_dataset = AnforandeDataset(df)
     batch_size = 2
 
@@ -1,25 +1,65 @@
 import multiprocessing as mp
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import count
+from multiprocessing.util import Finalize
 
 import numpy as np
+import pandas as pd
 from rapidfuzz import fuzz
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 from nltk.tokenize import TreebankWordTokenizer
 from nltk import ngrams
 from tqdm import tqdm
 
+from src.alignment import align_words
+from src.corpus import TokenizedCorpus
+from src.utils import SharedTexts, detach_shared_texts
 
-def calculate_bleu(text1, text2):
+
+# Set in worker processes by init_worker_corpus()
+_worker_corpus = None
+
+
+def init_worker_corpus(corpus):
+    """
+    Pool initializer that makes a TokenizedCorpus (src/corpus.py) available in the
+    worker processes, so it is pickled once per worker instead of once per task.
+    """
+    global _worker_corpus
+    _worker_corpus = corpus
+
+
+def init_match_worker(corpus):
+    """
+    Pool initializer of MatchPool. Like init_worker_corpus(), and closes the shared memory
+    attachments of the worker (see match_batch_star()) when it exits.
+    """
+    init_worker_corpus(corpus)
+    Finalize(None, detach_shared_texts, exitpriority=0)
+
+
+def calculate_bleu(text1, text2, corpus=None):
     """
     Calculate BLEU score between two texts.
+
+    If corpus (TokenizedCorpus) is given, the token ids of the texts are read from
+    the corpus instead of splitting the texts again.
     """
 
     if text1 is None or text2 is None:
         return None
     else:
         chencherry = SmoothingFunction()
+        if corpus is None:
+            reference, hypothesis = text1.split(), text2.split()
+        else:
+            reference, hypothesis = corpus.get_token_ids(text1).tolist(), corpus.get_token_ids(text2).tolist()
         return sentence_bleu(
-            references=[text1.split()],
-            hypothesis=text2.split(),
+            references=[reference],
+            hypothesis=hypothesis,
             smoothing_function=chencherry.method4,
         )
 
@@ -98,6 +138,260 @@ def get_weighted_ngram_score(anftext_normalized, anftext_inference, n):
     return ngram_matches
 
 
+# Large odd multiplier for the polynomial rolling hash (from splitmix64).
+NGRAM_HASH_PRIME = np.uint64(0x9E3779B97F4A7C15)
+
+
+def get_word_ids(*texts):
+    """
+    Map the whitespace separated words of one or several texts to integer ids
+    using a shared vocabulary. Identical words get identical ids across all texts.
+
+    Args:
+        *texts (str): Texts to encode.
+
+    Returns:
+        list: One np.array (dtype uint64) of word ids per text.
+    """
+
+    # Unseen words get the next id. Start ids at 1 so that no word hashes to 0.
+    vocab = defaultdict(count(1).__next__)
+    word_ids = []
+    for text in texts:
+        ids = [vocab[word] for word in text.split()]
+        word_ids.append(np.array(ids, dtype=np.uint64))
+
+    return word_ids
+
+
+def get_ngram_hashes(word_ids, n):
+    """
+    Roll word ids into 64-bit hashes for all ngrams of size 1 to n.
+
+    Hashes for ngrams of size i are computed from the hashes of size i-1 as
+    hash_i[k] = hash_(i-1)[k] * NGRAM_HASH_PRIME + word_ids[k + i - 1] (mod 2**64),
+    so every ngram size costs a single pass over the text.
+
+    Args:
+        word_ids (np.array): Word ids of a text. Via function get_word_ids().
+        n (int): Maximum ngram size.
+
+    Returns:
+        list: List where element i-1 is an np.array (dtype uint64) with the hashes
+            of all ngrams of size i. Empty arrays for sizes longer than the text.
+    """
+
+    ngram_hashes = [word_ids]
+    hashes = word_ids
+    for i in range(2, n + 1):
+        # uint64 arithmetic wraps around on overflow, which is what we want
+        hashes = hashes[:-1] * NGRAM_HASH_PRIME + word_ids[i - 1 :]
+        ngram_hashes.append(hashes)
+
+    return ngram_hashes
+
+
+def get_weighted_ngram_score_hashed(anftext_normalized, anftext_inference, n, corpus=None):
+    """
+    Same scores as get_weighted_ngram_score(), but computed on hashed ngrams.
+
+    Instead of comparing every ngram in anftext_normalized against every ngram in
+    anftext_inference, words are mapped to integer ids, ngrams are rolled into 64-bit
+    hashes and the matches are found with a single set membership lookup (np.isin)
+    per ngram size. Runs in O(N log N) instead of O(N * M) for texts of N and M words.
+
+    Args:
+        anftext_normalized (str): Official normalized text transcription of speech audio file.
+        anftext_inference (str): Text transcription of speech audio file by wav2vec2.
+        n (int): Maximum ngram size. Will use 1 to n ngram size.
+        corpus (TokenizedCorpus | NoneType): If given, word ids are read from the corpus
+            instead of tokenizing the texts.
+
+    Returns:
+        np.array: Array with different ngram size occurences weighted together.
+    """
+
+    if corpus is None:
+        normalized_ids, inference_ids = get_word_ids(anftext_normalized, anftext_inference)
+    else:
+        # Corpus token ids start at 0, shift them so no word hashes to 0
+        normalized_ids = corpus.get_token_ids(anftext_normalized).astype(np.uint64) + 1
+        inference_ids = corpus.get_token_ids(anftext_inference).astype(np.uint64) + 1
+    normalized_hashes = get_ngram_hashes(normalized_ids, n - 1)
+    inference_hashes = get_ngram_hashes(inference_ids, n - 1)
+
+    # Which indices in anftext_inference ngrams that match anftext_normalized ngrams
+    ngrams_bool_list = [np.isin(inference_hashes[i - 1], normalized_hashes[i - 1]) for i in range(1, n)]
+
+    return weigh_ngram_matches(ngrams_bool_list)
+
+
+def weigh_ngram_matches(ngrams_bool_list):
+    """
+    Weigh together boolean ngram match arrays of ngram sizes 1 to n-1 into one score per word,
+    the same way as get_weighted_ngram_score(). Unlike get_weighted_ngram_score(), texts
+    shorter than n + 1 words are also scored: words outside the text count as non-matches.
+
+    Args:
+        ngrams_bool_list (list): List where element i-1 is a boolean np.array telling
+            which ngrams of size i in anftext_inference have a match.
+
+    Returns:
+        np.array: Array with different ngram size occurences weighted together.
+    """
+
+    nr_words = len(ngrams_bool_list[0])
+    weighted_list = []
+    for i, ngram_matches in enumerate(ngrams_bool_list, start=1):
+        # Add some zeroes at the end because ngrams of different size are not the same length
+        ngram_matches = np.concatenate([ngram_matches, np.zeros(nr_words - len(ngram_matches), dtype=bool)])
+        # Longer convolutions and higher weights for longer ngrams. Same as np.convolve(mode="same"),
+        # but also one score per word for texts shorter than the kernel.
+        kernel = np.ones(i + 2) * np.sqrt(np.log(i + 1))
+        start = (len(kernel) - 1) // 2
+        ngram_matches = np.convolve(ngram_matches, kernel)[start : start + nr_words]
+        weighted_list.append(ngram_matches)
+
+    ngram_matches = np.vstack(weighted_list)
+    ngram_matches = ngram_matches.sum(axis=0)
+    ngram_matches = ngram_matches / 3
+
+    return ngram_matches
+
+
+def get_flat_ngram_keys(word_ids, n):
+    """
+    Hash all ngrams of size n in several texts at once.
+
+    Args:
+        word_ids (list): List of np.arrays (dtype uint64) with word ids, one per text.
+        n (int): Ngram size.
+
+    Returns:
+        tuple: np.array (dtype uint64) with one key per ngram, mixing the ngram hash with
+            the index of the text it belongs to, and np.array with the index of the text.
+    """
+
+    lengths = np.array([len(ids) for ids in word_ids], dtype=np.int64)
+    text_index = np.repeat(np.arange(len(word_ids)), lengths)
+    flat_ids = np.concatenate(word_ids) if len(word_ids) > 0 else np.zeros(0, dtype=np.uint64)
+    # Position of each word within its own text
+    positions = np.arange(len(flat_ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    hashes = get_ngram_hashes(flat_ids, n)[n - 1]
+    # Ngrams crossing the boundary between two texts are not valid ngrams
+    valid = positions[: len(hashes)] <= (lengths[text_index[: len(hashes)]] - n)
+    text_index = text_index[: len(hashes)][valid]
+    keys = hashes[valid] * NGRAM_HASH_PRIME + (text_index.astype(np.uint64) + np.uint64(1))
+
+    return keys, text_index
+
+
+def batch_bleu(refs, hyps, corpus=None, n=4, k=5, shard_size=20000, processes=None):
+    """
+    Calculate BLEU scores for many reference/hypothesis text pairs at once.
+
+    Gives the same scores as calculate_bleu() (nltk sentence_bleu with uniform weights
+    and SmoothingFunction().method4), but counts the clipped ngram matches of all pairs
+    together with NumPy instead of building Counters for one pair at a time.
+
+    Args:
+        refs (list | pd.Series): Reference texts (e.g. anftext_normalized).
+        hyps (list | pd.Series): Hypothesis texts (e.g. anftext_inference).
+        corpus (TokenizedCorpus | NoneType): If given, token ids are read from the corpus.
+        n (int): Maximum ngram size. BLEU uses uniform weights 1/n for ngram sizes 1 to n.
+        k (int): The k parameter of smoothing method4.
+        shard_size (int): Number of pairs per shard. When there are several shards they
+            are scored in parallel with multiprocessing.
+        processes (int | NoneType): Number of processes to use for multiprocessing.
+            If None, use all available processes.
+
+    Returns:
+        np.array: BLEU scores. NaN for pairs where either text is missing.
+    """
+
+    refs = list(refs)
+    hyps = list(hyps)
+
+    if len(refs) > shard_size:
+        shards = [
+            (refs[i : i + shard_size], hyps[i : i + shard_size], None, n, k, shard_size)
+            for i in range(0, len(refs), shard_size)
+        ]
+        with mp.Pool(processes, initializer=init_worker_corpus, initargs=(corpus,)) as pool:
+            bleu_scores = list(tqdm(pool.imap(batch_bleu_star, shards), total=len(shards)))
+        return np.concatenate(bleu_scores)
+
+    bleu_scores = np.full(len(refs), np.nan)
+    pair_index = np.array(
+        [i for i, (ref, hyp) in enumerate(zip(refs, hyps)) if isinstance(ref, str) and isinstance(hyp, str)],
+        dtype=np.int64,
+    )
+    if len(pair_index) == 0:
+        return bleu_scores
+
+    if corpus is None:
+        word_ids = get_word_ids(*[refs[i] for i in pair_index], *[hyps[i] for i in pair_index])
+        ref_ids, hyp_ids = word_ids[: len(pair_index)], word_ids[len(pair_index) :]
+    else:
+        ref_ids = [corpus.get_token_ids(refs[i]).astype(np.uint64) + 1 for i in pair_index]
+        hyp_ids = [corpus.get_token_ids(hyps[i]).astype(np.uint64) + 1 for i in pair_index]
+
+    nr_pairs = len(pair_index)
+    ref_lengths = np.array([len(ids) for ids in ref_ids], dtype=np.int64)
+    hyp_lengths = np.array([len(ids) for ids in hyp_ids], dtype=np.int64)
+
+    numerators = np.zeros((nr_pairs, n))
+    denominators = np.zeros((nr_pairs, n))
+    for i in range(1, n + 1):
+        hyp_keys, hyp_pairs = get_flat_ngram_keys(hyp_ids, i)
+        ref_keys, _ = get_flat_ngram_keys(ref_ids, i)
+
+        hyp_unique, hyp_first, hyp_counts = np.unique(hyp_keys, return_index=True, return_counts=True)
+        ref_unique, ref_counts = np.unique(ref_keys, return_counts=True)
+
+        # Clip each hypothesis ngram count by its count in the reference
+        ref_pos = np.minimum(np.searchsorted(ref_unique, hyp_unique), max(len(ref_unique) - 1, 0))
+        if len(ref_unique) > 0:
+            ref_matches = np.where(ref_unique[ref_pos] == hyp_unique, ref_counts[ref_pos], 0)
+        else:
+            ref_matches = np.zeros(len(hyp_unique), dtype=np.int64)
+        clipped_counts = np.minimum(hyp_counts, ref_matches)
+
+        numerators[:, i - 1] = np.bincount(hyp_pairs[hyp_first], weights=clipped_counts, minlength=nr_pairs)
+        denominators[:, i - 1] = np.maximum(1, hyp_lengths - i + 1)
+
+    # Smoothing method4: precisions with no matches get 1 / (2**incvnt * k / ln(hyp_len)),
+    # where incvnt counts the zero precisions so far.
+    zero_matches = numerators == 0
+    incvnt = np.cumsum(zero_matches, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        smoothed = np.log(hyp_lengths)[:, None] / (2.0**incvnt * k)
+        smooth = zero_matches & (hyp_lengths > 1)[:, None]
+        precisions = np.where(smooth, smoothed, numerators) / denominators
+        log_precisions = np.where(precisions > 0, np.log(precisions), 0)
+
+    brevity_penalty = np.where(
+        hyp_lengths > ref_lengths,
+        1.0,
+        np.exp(1 - ref_lengths / np.maximum(hyp_lengths, 1)) * (hyp_lengths > 0),
+    )
+    scores = brevity_penalty * np.exp(log_precisions.sum(axis=1) / n)
+    # No unigram matches means BLEU is 0
+    scores[numerators[:, 0] == 0] = 0
+
+    bleu_scores[pair_index] = scores
+    return bleu_scores
+
+
+def batch_bleu_star(args):
+    """
+    Wrapper for multiprocessing.
+    Unpacks arguments and calls batch_bleu() on a shard.
+    """
+    return batch_bleu(*args[:2], _worker_corpus, *args[3:])
+
+
 # Source: https://stackoverflow.com/q/4494404
 def contiguous_regions(condition):
     """Finds contiguous True regions of the boolean array "condition". Returns
@@ -126,7 +420,7 @@ def contiguous_regions(condition):
 
 
 def contiguous_ngram_match(
-    anftext_normalized, anftext_inference, n=6, threshold=1, min_continuous_match=8, max_gap=30
+    anftext_normalized, anftext_inference, n=6, threshold=1, min_continuous_match=8, max_gap=30, corpus=None
 ):
     """
     Get (fuzzy-ish) contiguous matching indices for anftext_inference and anftext_normalized
@@ -142,16 +436,37 @@ def contiguous_ngram_match(
         max_gap (int): Maximum gap (in words) between contiguous region and the next/previous
             region for it to be seen as the start/end index of a larger joined together contiguous
             region.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts.
 
     Returns:
         tuple: Start and end indices of contiguous fuzzy match in anftext_inference
             (or whatever text is input as second arg).
     """
 
-    if anftext_normalized is None or anftext_inference is None or len(anftext_inference.split()) == 1:
+    if anftext_normalized is None or anftext_inference is None:
         return None, None
 
-    ngram_match_scores = get_weighted_ngram_score(anftext_normalized, anftext_inference, n=n)
+    nr_words = len(anftext_inference.split()) if corpus is None else len(corpus.get_token_ids(anftext_inference))
+    if nr_words == 1:
+        return None, None
+
+    ngram_match_scores = get_weighted_ngram_score_hashed(anftext_normalized, anftext_inference, n=n, corpus=corpus)
+
+    return get_contiguous_match_indices(ngram_match_scores, threshold, min_continuous_match, max_gap)
+
+
+def get_contiguous_match_indices(ngram_match_scores, threshold=1, min_continuous_match=8, max_gap=30):
+    """
+    Find start and end indices of the contiguous match from weighted ngram scores.
+    See contiguous_ngram_match() for a description of the arguments.
+
+    Args:
+        ngram_match_scores (np.array): Weighted ngram scores, via get_weighted_ngram_score_hashed().
+
+    Returns:
+        tuple: Start and end indices of contiguous match, or (None, None).
+    """
+
     # Contiguous region indices satisfying the condition ngram_match_scores > threshold
     ngram_match_indices = contiguous_regions(ngram_match_scores > threshold)
 
@@ -192,37 +507,373 @@ def contiguous_ngram_match(
         return start_index, end_index
 
 
+def get_contiguous_match_indices_batch(values, offsets, threshold=1, min_continuous_match=8, max_gap=30):
+    """
+    Batched get_contiguous_match_indices() for the weighted ngram scores of many texts.
+
+    The scores are passed as one ragged array: the scores of text i are
+    values[offsets[i]:offsets[i + 1]]. Thresholded regions, their lengths and the gaps
+    to the neighbouring regions of the same text are computed for all texts at once,
+    without looping over the regions in Python.
+
+    Args:
+        values (np.array): Concatenated weighted ngram scores of all texts.
+        offsets (np.array): Start offset of every text in values, followed by len(values).
+        threshold, min_continuous_match, max_gap: See contiguous_ngram_match().
+
+    Returns:
+        list: Start and end indices (tuples) of the contiguous match of each text,
+            or (None, None). Same as get_contiguous_match_indices() on every text.
+    """
+
+    values = np.asarray(values)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    nr_texts = len(offsets) - 1
+    lengths = np.diff(offsets)
+
+    # Regions where the condition is True, not allowed to run across text boundaries
+    condition = values > threshold
+    text_first = np.zeros(len(values), dtype=bool)
+    text_first[offsets[:-1][lengths > 0]] = True
+    text_last = np.zeros(len(values), dtype=bool)
+    text_last[offsets[1:][lengths > 0] - 1] = True
+    previous = np.r_[False, condition[:-1]]
+    following = np.r_[condition[1:], False]
+    region_starts = np.flatnonzero(condition & (text_first | ~previous))
+    region_ends = np.flatnonzero(condition & (text_last | ~following)) + 1
+    region_text = np.searchsorted(offsets, region_starts, side="right") - 1
+
+    # A long enough region is a valid start (end) if the next (previous) region of the
+    # same text is at most max_gap words away, or if there is no next (previous) region.
+    long_regions = region_ends - region_starts > min_continuous_match
+    joined = (region_text[1:] != region_text[:-1]) | (region_starts[1:] - region_ends[:-1] <= max_gap)
+    valid_starts = np.flatnonzero(long_regions & np.r_[joined, True])
+    valid_ends = np.flatnonzero(long_regions & np.r_[True, joined])[::-1]
+
+    start_indices = np.full(nr_texts, -1, dtype=np.int64)
+    end_indices = np.full(nr_texts, -1, dtype=np.int64)
+    # First valid start and last valid end region of every text
+    texts, first = np.unique(region_text[valid_starts], return_index=True)
+    start_indices[texts] = region_starts[valid_starts[first]] - offsets[texts]
+    texts, last = np.unique(region_text[valid_ends], return_index=True)
+    end_indices[texts] = region_ends[valid_ends[last]] - offsets[texts]
+
+    return [
+        (start, end) if start >= 0 and end >= 0 else (None, None)
+        for start, end in zip(start_indices.tolist(), end_indices.tolist())
+    ]
+
+
+def contiguous_ngram_match_batch(
+    texts_in, texts_out, n=6, threshold=1, min_continuous_match=8, max_gap=30, corpus=None
+):
+    """
+    Same as contiguous_ngram_match() on every pair of texts_in and texts_out, but the
+    contiguous regions of all pairs are found in one call to
+    get_contiguous_match_indices_batch().
+
+    Returns:
+        list: Start and end indices (tuples) of the contiguous match of each pair.
+    """
+
+    scores = []
+    matched = []
+    for i, (text_in, text_out) in enumerate(zip(texts_in, texts_out)):
+        if text_in is None or text_out is None:
+            continue
+        nr_words = len(text_out.split()) if corpus is None else len(corpus.get_token_ids(text_out))
+        if nr_words == 1:
+            continue
+        scores.append(get_weighted_ngram_score_hashed(text_in, text_out, n=n, corpus=corpus))
+        matched.append(i)
+
+    results = [(None, None)] * len(texts_in)
+    if len(scores) == 0:
+        return results
+
+    offsets = np.r_[0, np.cumsum([len(score) for score in scores])]
+    matches = get_contiguous_match_indices_batch(
+        np.concatenate(scores), offsets, threshold, min_continuous_match, max_gap
+    )
+    for i, match in zip(matched, matches):
+        results[i] = match
+
+    return results
+
+
+def contiguous_ngram_match_batch_star(args):
+    """
+    Wrapper for multiprocessing.
+    Unpacks arguments and calls contiguous_ngram_match_batch().
+    """
+    return contiguous_ngram_match_batch(*args, corpus=_worker_corpus)
+
+
 def contiguous_ngram_match_star(args):
     """
     Wrapper for multiprocessing.
     Unpacks arguments and calls contiguous_ngram_match().
     """
-    return contiguous_ngram_match(*args)
+    return contiguous_ngram_match(*args, corpus=_worker_corpus)
+
+
+class DebateNgramIndex:
+    """
+    Inverted index from hashed ngrams to word positions in the transcript of a debate.
+
+    Built once per debate from the ASR transcript (anftext_inference). The speeches of the
+    debate are then located by looking up their ngrams in the postings of the index,
+    instead of comparing each speech against the whole transcript again. Gives the same
+    results as contiguous_ngram_match(speech, anftext_inference, ...).
+
+    Args:
+        anftext_inference (str): Text transcription of the debate audio file by wav2vec2.
+        n (int): Maximum ngram size. Will use 1 to n-1 ngram size, like
+            get_weighted_ngram_score().
+        corpus (TokenizedCorpus | NoneType): If given, word ids are read from the corpus.
+    """
+
+    def __init__(self, anftext_inference, n=6, corpus=None):
+        self.n = n
+        self.corpus = corpus
+        self.vocab = defaultdict(count(1).__next__)
+
+        if corpus is None:
+            word_ids = np.array([self.vocab[word] for word in anftext_inference.split()], dtype=np.uint64)
+        else:
+            word_ids = corpus.get_token_ids(anftext_inference).astype(np.uint64) + 1
+        self.nr_words = len(word_ids)
+
+        # Postings for every ngram size: sorted ngram hashes and the word position of each
+        self.postings = []
+        for hashes in get_ngram_hashes(word_ids, n - 1):
+            positions = np.argsort(hashes, kind="stable")
+            self.postings.append((hashes[positions], positions))
+
+    def get_word_ids(self, text):
+        """
+        Word ids of text in the vocabulary of the index. Words that are not in the
+        debate transcript get id 0.
+        """
+
+        if self.corpus is None:
+            return np.array([self.vocab.get(word, 0) for word in text.split()], dtype=np.uint64)
+        else:
+            return self.corpus.get_token_ids(text).astype(np.uint64) + 1
+
+    def get_ngram_positions(self, text):
+        """
+        Look up the ngrams of text in the index.
+
+        Args:
+            text (str): Text to look up, e.g. anftext_normalized of a speech.
+
+        Returns:
+            list: List where element i-1 is a boolean np.array over the ngrams of size i
+                in the debate transcript, True where the ngram also occurs in text.
+        """
+
+        word_ids = self.get_word_ids(text)
+        # Ngrams containing words that are not in the debate can't match anything
+        known_words = (word_ids > 0).astype(np.int64)
+
+        ngrams_bool_list = []
+        for i, hashes in enumerate(get_ngram_hashes(word_ids, self.n - 1), start=1):
+            sorted_hashes, positions = self.postings[i - 1]
+            if len(hashes) > 0:
+                known_ngrams = np.convolve(known_words, np.ones(i, dtype=np.int64), mode="valid") == i
+                hashes = np.unique(hashes[known_ngrams])
+            # Postings of each query ngram are positions[left:right]
+            left = np.searchsorted(sorted_hashes, hashes, side="left")
+            right = np.searchsorted(sorted_hashes, hashes, side="right")
+            lengths = right - left
+            hits = np.repeat(left - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+            ngram_matches = np.zeros(len(sorted_hashes), dtype=bool)
+            ngram_matches[positions[hits]] = True
+            ngrams_bool_list.append(ngram_matches)
+
+        return ngrams_bool_list
+
+    def get_weighted_ngram_score(self, anftext_normalized):
+        """
+        Same as get_weighted_ngram_score_hashed(anftext_normalized, anftext_inference, n).
+        """
+        return weigh_ngram_matches(self.get_ngram_positions(anftext_normalized))
+
+    def contiguous_ngram_match(self, anftext_normalized, threshold=1, min_continuous_match=8, max_gap=30):
+        """
+        Same as contiguous_ngram_match(anftext_normalized, anftext_inference, n, ...),
+        using the index. See contiguous_ngram_match() for a description of the arguments.
+        """
+
+        if anftext_normalized is None or self.nr_words == 1:
+            return None, None
+
+        ngram_match_scores = self.get_weighted_ngram_score(anftext_normalized)
+        return get_contiguous_match_indices(ngram_match_scores, threshold, min_continuous_match, max_gap)
+
+    def locate_speeches(self, speeches, threshold=1, min_continuous_match=8, max_gap=30):
+        """
+        Locate all speeches of the debate in the transcript.
+
+        Args:
+            speeches (list): Texts of the speeches (anftext_normalized).
+
+        Returns:
+            list: Start and end indices (tuples) of the contiguous match of each speech.
+        """
+
+        results = [(None, None)] * len(speeches)
+        if self.nr_words == 1:
+            return results
+
+        matched = [i for i, speech in enumerate(speeches) if speech is not None]
+        if len(matched) == 0:
+            return results
+
+        # Contiguous regions of all speeches are found in one batch
+        scores = [self.get_weighted_ngram_score(speeches[i]) for i in matched]
+        offsets = np.r_[0, np.cumsum([len(score) for score in scores])]
+        matches = get_contiguous_match_indices_batch(
+            np.concatenate(scores), offsets, threshold, min_continuous_match, max_gap
+        )
+        for i, match in zip(matched, matches):
+            results[i] = match
+
+        return results
+
+
+def locate_speeches_star(args):
+    """
+    Wrapper for multiprocessing.
+    Builds a DebateNgramIndex for the debate transcript and locates all speeches of the debate.
+    Args are (speeches, anftext_inference, n, threshold, min_continuous_match, max_gap).
+    """
+
+    speeches, anftext_inference, n, threshold, min_continuous_match, max_gap = args
+    if anftext_inference is None:
+        return [(None, None)] * len(speeches)
+
+    debate_index = DebateNgramIndex(anftext_inference, n=n, corpus=_worker_corpus)
+    return debate_index.locate_speeches(speeches, threshold, min_continuous_match, max_gap)
 
 
-def get_fuzzy_match_word_indices(anftext_inference, alignment):
+def get_whitespace_word_spans(text):
+    """
+    Character spans of the whitespace separated words in text, i.e. the words of text.split().
+
+    Returns:
+        np.array: Array of shape (n_words, 2) with start and end character offsets.
+    """
+    return np.array([match.span() for match in re.finditer(r"\S+", text)], dtype=np.int64).reshape(-1, 2)
+
+
+class WordOffsets:
+    """
+    Character offset to word index map for a text.
+
+    Converts character indices (e.g. from rapidfuzz alignments) to word indices with
+    np.searchsorted over the start and end offsets of the words.
+
+    Args:
+        word_spans (np.array): Array of shape (n_words, 2) with the start and end
+            character offsets of each word.
+        text_length (int): Number of characters in the text.
+    """
+
+    def __init__(self, word_spans, text_length):
+        word_spans = np.asarray(word_spans).reshape(-1, 2)
+        self.starts = word_spans[:, 0]
+        self.ends = word_spans[:, 1]
+        self.text_length = text_length
+
+    def __len__(self):
+        return len(self.starts)
+
+    def word_indices(self, char_start, char_end):
+        """
+        Word indices of the words containing char_start and char_end.
+
+        Returns:
+            tuple: Index of the word where char_start falls (or the last word starting before it)
+                and index of the first word ending at or after char_end (exclusive end index
+                len(self) if char_end is the end of the text).
+        """
+        start_index, end_index = self.batch_word_indices([char_start], [char_end])
+        return start_index[0], end_index[0]
+
+    def batch_word_indices(self, char_starts, char_ends):
+        """
+        Vectorized word_indices() for many character start/end offsets at once.
+
+        Returns:
+            tuple: np.arrays with start and end word indices.
+        """
+
+        char_starts = np.asarray(char_starts)
+        char_ends = np.asarray(char_ends)
+
+        # Last word that starts at or before char_start
+        start_indices = np.searchsorted(self.starts, char_starts, side="right") - 1
+        start_indices = np.where(char_starts == 0, 0, np.maximum(start_indices, 0))
+        # First word that ends at or after char_end
+        end_indices = np.searchsorted(self.ends, char_ends, side="left")
+        end_indices = np.where(char_ends == self.text_length, len(self), end_indices)
+
+        return start_indices, end_indices
+
+
+@lru_cache(maxsize=8)
+def get_word_offsets(text):
+    """
+    WordOffsets of the words in text as tokenized by TreebankWordTokenizer.
+
+    Cached, so a debate transcript is only tokenized once per process even when
+    many speeches are matched against it.
+    """
+    word_spans = np.array(list(TreebankWordTokenizer().span_tokenize(text)))
+    return WordOffsets(word_spans, len(text))
+
+
+def get_fuzzy_match_word_indices(anftext_inference, alignment, word_spans=None):
     """
     Rapidfuzz and fuzzysearch return character indices for fuzzy matches.
     This function converts them to word indices.
-    """
 
-    word_spans = TreebankWordTokenizer().span_tokenize(anftext_inference)
-    word_spans = np.array(list(word_spans))
+    word_spans (np.array) can be passed to use precomputed word character spans
+    (e.g. from TokenizedCorpus.get_word_spans()) instead of tokenizing the text.
+    """
 
-    if alignment.src_start == 0:
-        start_index = 0
+    if word_spans is None:
+        word_offsets = get_word_offsets(anftext_inference)
     else:
-        start_index = np.where(word_spans <= alignment.src_start)[0][-1]
+        word_offsets = WordOffsets(word_spans, len(anftext_inference))
+
+    return word_offsets.word_indices(alignment.src_start, alignment.src_end)
+
 
-    if alignment.src_end == len(anftext_inference):
-        end_index = len(word_spans)
+def get_fuzzy_match_word_indices_batch(anftext_inference, alignments, word_spans=None):
+    """
+    Convert the character indices of many fuzzy match alignments against the same
+    text to word indices at once. See get_fuzzy_match_word_indices().
+
+    Returns:
+        list: Start and end word indices (tuples) of each alignment.
+    """
+
+    if word_spans is None:
+        word_offsets = get_word_offsets(anftext_inference)
     else:
-        end_index = np.where(word_spans >= alignment.src_end)[0][0]
+        word_offsets = WordOffsets(word_spans, len(anftext_inference))
 
-    return start_index, end_index
+    start_indices, end_indices = word_offsets.batch_word_indices(
+        [alignment.src_start for alignment in alignments], [alignment.src_end for alignment in alignments]
+    )
+    return list(zip(start_indices, end_indices))
 
 
-def contiguous_fuzzy_match(anftext_normalized, anftext_inference, threshold=55):
+def contiguous_fuzzy_match(anftext_normalized, anftext_inference, threshold=55, corpus=None):
     """
     Fuzzy contiguous index match for anftext_inference and anftext_normalized using
     fuzz.partial_ratio_alignment().
@@ -232,13 +883,20 @@ def contiguous_fuzzy_match(anftext_normalized, anftext_inference, threshold=55):
         anftext_inference (str): Text transcription of speech audio file by wav2vec2.
         threshold (int): Fuzzy match score threshold for being considered a match.
             0 to 100, 100 being exact match.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts. If given,
+            word indices are computed from the whitespace word spans stored in the corpus.
 
     Returns:
         tuple: Start and end indices of contiguous fuzzy match in anftext_inference,
             along with fuzzy match score of the matching segment.
     """
 
-    if anftext_normalized is None or anftext_inference is None or len(anftext_inference.split()) <= 1:
+    if anftext_normalized is None or anftext_inference is None:
+        return None, None, None
+
+    word_spans = None if corpus is None else corpus.get_word_spans(anftext_inference)
+    nr_words = len(anftext_inference.split()) if word_spans is None else len(word_spans)
+    if nr_words <= 1:
         return None, None, None
 
     align = fuzz.partial_ratio_alignment(anftext_inference, anftext_normalized)
@@ -249,7 +907,7 @@ def contiguous_fuzzy_match(anftext_normalized, anftext_inference, threshold=55):
     if align_check.score < threshold and align.score < threshold:
         return None, None, None
 
-    start_index, end_index = get_fuzzy_match_word_indices(anftext_inference, align)
+    start_index, end_index = get_fuzzy_match_word_indices(anftext_inference, align, word_spans=word_spans)
 
     return start_index, end_index, align_check.score
 
@@ -259,7 +917,361 @@ def contiguous_fuzzy_match_star(args):
     Wrapper function for multiprocessing.
     Unpacks arguments and calls contiguous_fuzzy_match().
     """
-    return contiguous_fuzzy_match(*args)
+    return contiguous_fuzzy_match(*args, corpus=_worker_corpus)
+
+
+def get_word_start_times(chunks):
+    """
+    Start time (in seconds) of every word in the word level chunks returned by the
+    wav2vec2 pipeline with return_timestamps="word".
+
+    Args:
+        chunks (list | np.array): List of dicts with keys "text" and "timestamp".
+
+    Returns:
+        np.array: Start time of each word.
+    """
+    return np.array([chunk["timestamp"][0] for chunk in chunks], dtype=np.float64)
+
+
+def contiguous_fuzzy_match_windowed(
+    anftext_normalized,
+    anftext_inference,
+    word_times,
+    start,
+    duration,
+    threshold=55,
+    padding=60,
+    max_padding=960,
+    corpus=None,
+):
+    """
+    Fuzzy contiguous index match like contiguous_fuzzy_match(), but only searching a time
+    window of anftext_inference around where the speech is expected to be according to
+    its metadata (start and duration).
+
+    The window starts as [start - padding, start + duration + padding] seconds. If no
+    match scoring above threshold is found inside the window, or if the match runs into
+    the edge of the window, the padding is doubled until it exceeds max_padding. As a
+    last resort contiguous_fuzzy_match() is run on the whole transcript.
+
+    Args:
+        anftext_normalized (str): Official normalized text transcription of speech audio file.
+        anftext_inference (str): Text transcription of the debate audio file by wav2vec2.
+        word_times (np.array): Start time of each word in anftext_inference.
+            Via function get_word_start_times().
+        start (float): Start of speech in seconds, from the metadata.
+        duration (float): Duration of speech in seconds, from the metadata.
+        threshold (int): Fuzzy match score threshold for being considered a match.
+            0 to 100, 100 being exact match.
+        padding (float): Initial padding in seconds on both sides of the expected position.
+        max_padding (float): Largest padding to try before falling back to a full search.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts.
+
+    Returns:
+        tuple: Start and end indices of contiguous fuzzy match in anftext_inference,
+            along with fuzzy match score of the matching segment.
+    """
+
+    if anftext_normalized is None or anftext_inference is None:
+        return None, None, None
+
+    # Word indices from the window need to line up with the word timestamps, so
+    # whitespace separated words are used (same as the wav2vec2 word chunks).
+    if corpus is None:
+        word_spans = get_whitespace_word_spans(anftext_inference)
+    else:
+        word_spans = corpus.get_word_spans(anftext_inference)
+
+    nr_words = len(word_spans)
+    if nr_words <= 1:
+        return None, None, None
+
+    if (
+        word_times is None
+        or len(word_times) != nr_words
+        or start is None
+        or duration is None
+        or np.isnan(start)
+        or np.isnan(duration)
+    ):
+        return contiguous_fuzzy_match(anftext_normalized, anftext_inference, threshold, corpus=corpus)
+
+    while padding <= max_padding:
+        window_start = np.searchsorted(word_times, start - padding, side="left")
+        window_end = np.searchsorted(word_times, start + duration + padding, side="right")
+        if window_start == 0 and window_end == nr_words:
+            # Window covers the whole transcript
+            break
+
+        window_spans = word_spans[window_start:window_end]
+        if len(window_spans) <= 1:
+            padding *= 2
+            continue
+
+        char_start, char_end = window_spans[0][0], window_spans[-1][1]
+        window_text = anftext_inference[char_start:char_end]
+
+        # partial_ratio aligns the shorter string against the longer one, so the window
+        # needs to be at least as long as the speech.
+        if len(window_text) >= len(anftext_normalized):
+            align = fuzz.partial_ratio_alignment(window_text, anftext_normalized)
+            align_check = fuzz.partial_ratio_alignment(window_text[align.src_start : align.src_end], anftext_normalized)
+
+            # Match might continue outside of the window if it touches the edge of the window
+            touches_edge = (align.src_start == 0 and window_start > 0) or (
+                align.src_end == len(window_text) and window_end < nr_words
+            )
+
+            if (align_check.score >= threshold or align.score >= threshold) and not touches_edge:
+                start_index, end_index = get_fuzzy_match_word_indices(
+                    window_text, align, word_spans=window_spans - char_start
+                )
+                return window_start + start_index, window_start + end_index, align_check.score
+
+        padding *= 2
+
+    return contiguous_fuzzy_match(anftext_normalized, anftext_inference, threshold, corpus=corpus)
+
+
+def contiguous_fuzzy_match_windowed_star(args):
+    """
+    Wrapper function for multiprocessing.
+    Unpacks arguments and calls contiguous_fuzzy_match_windowed().
+    """
+    return contiguous_fuzzy_match_windowed(*args, corpus=_worker_corpus)
+
+
+def get_match_batches(df, column_in, column_out, method, params, batch_size=64):
+    """
+    Deduplicate the texts of column_in and column_out and group the rows of df into
+    batches of rows sharing the same column_out text (e.g. all speeches of a debate).
+
+    Batches only refer to the texts by their index in the returned list of texts, so the
+    texts themselves don't have to be sent along with every task.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing column_in and column_out.
+        column_in (str): Column name of text to match against.
+        column_out (str): Column name of text we get matching indices for.
+        method (str): "ngram", "fuzzy" or "fuzzy_windowed". See match_batch().
+        params (tuple): Parameters of the match method. See match_batch().
+        batch_size (int): Maximum number of rows per batch.
+
+    Returns:
+        tuple: List of unique texts and list of batches. Each batch is a tuple
+            (method, text_out_id, rows, word_times, params), where rows is a list of
+            (row number, text_in_id, start, duration).
+    """
+
+    text_ids = {}
+    texts = []
+
+    def text_id(text):
+        if text not in text_ids:
+            text_ids[text] = len(texts)
+            texts.append(text)
+        return text_ids[text]
+
+    ids_in = [text_id(text) for text in df[column_in]]
+    ids_out = [text_id(text) for text in df[column_out]]
+
+    windowed = method == "fuzzy_windowed"
+    starts = df["start"].tolist() if windowed else [None] * len(df)
+    durations = df["duration"].tolist() if windowed else [None] * len(df)
+    chunks = df["chunks"].tolist() if windowed else [None] * len(df)
+
+    groups = {}
+    for row, text_out_id in enumerate(ids_out):
+        groups.setdefault(text_out_id, []).append(row)
+
+    batches = []
+    for text_out_id, rows in groups.items():
+        # Word timestamps are the same for all rows of a group
+        word_times = None
+        if windowed and chunks[rows[0]] is not None:
+            word_times = get_word_start_times(chunks[rows[0]])
+        for i in range(0, len(rows), batch_size):
+            batch_rows = [(row, ids_in[row], starts[row], durations[row]) for row in rows[i : i + batch_size]]
+            batches.append((method, text_out_id, batch_rows, word_times, params))
+
+    return texts, batches
+
+
+def match_batch(batch, texts, corpus=None):
+    """
+    Match a batch of rows (from get_match_batches()) against their shared column_out text.
+
+    Methods and their params:
+        "ngram": (n, threshold, min_continuous_match, max_gap). A DebateNgramIndex is built
+            once for the batch. Same results as contiguous_ngram_match().
+        "fuzzy": (threshold,). Same results as contiguous_fuzzy_match().
+        "fuzzy_windowed": (threshold, padding, max_padding). Same results as
+            contiguous_fuzzy_match_windowed().
+
+    Args:
+        batch (tuple): Batch from get_match_batches().
+        texts (list | SharedTexts): Texts referred to by the batch.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts.
+
+    Returns:
+        list: (row number, result) for every row in the batch.
+    """
+
+    method, text_out_id, rows, word_times, params = batch
+    text_out = texts[text_out_id]
+
+    if method == "ngram":
+        n, threshold, min_continuous_match, max_gap = params
+        if text_out is None:
+            return [(row, (None, None)) for row, _, _, _ in rows]
+        debate_index = DebateNgramIndex(text_out, n=n, corpus=corpus)
+        speeches = [texts[text_in_id] for _, text_in_id, _, _ in rows]
+        matches = debate_index.locate_speeches(speeches, threshold, min_continuous_match, max_gap)
+        return [(row, match) for (row, _, _, _), match in zip(rows, matches)]
+    elif method == "fuzzy":
+        (threshold,) = params
+        return [
+            (row, contiguous_fuzzy_match(texts[text_in_id], text_out, threshold, corpus=corpus))
+            for row, text_in_id, _, _ in rows
+        ]
+    elif method == "fuzzy_windowed":
+        threshold, padding, max_padding = params
+        return [
+            (
+                row,
+                contiguous_fuzzy_match_windowed(
+                    texts[text_in_id], text_out, word_times, start, duration, threshold, padding, max_padding, corpus
+                ),
+            )
+            for row, text_in_id, start, duration in rows
+        ]
+    else:
+        raise ValueError(f"Unknown match method: {method}")
+
+
+def match_batch_star(args):
+    """
+    Wrapper for multiprocessing.
+    Unpacks the batch and its SharedTexts and calls match_batch() with the corpus of the worker process.
+    """
+    batch, shared_texts = args
+    # The worker stays attached to the texts of the current call, for its following tasks.
+    # Blocks of earlier calls of a reused MatchPool are unlinked and can be let go of.
+    detach_shared_texts(keep=shared_texts.shm.name)
+    return match_batch(batch, shared_texts, _worker_corpus)
+
+
+class MatchPool:
+    """
+    Process pool for the "shared_memory" executor of run_match_batches() that can be
+    reused for many calls, e.g. for every checkpoint batch of a run. The worker processes
+    and the corpus in them are only set up once, when the pool is created. The texts of
+    each call are placed in shared memory (SharedTexts in src/utils.py) and tasks only
+    carry the name of the shared memory block and text ids.
+
+    Use as a context manager, or call close() when done.
+
+    Args:
+        processes (int | NoneType): Number of processes to use.
+            If None, use all available processes.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts.
+    """
+
+    def __init__(self, processes=None, corpus=None):
+        self.pool = mp.Pool(processes, initializer=init_match_worker, initargs=(corpus,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def match_batches(self, texts, batches):
+        """
+        Run batches from get_match_batches() in the pool.
+
+        Returns:
+            list: Results of the batches (in any order), see match_batch().
+        """
+
+        shared_texts = SharedTexts(texts)
+        try:
+            tasks = [(batch, shared_texts) for batch in batches]
+            return list(tqdm(self.pool.imap_unordered(match_batch_star, tasks), total=len(batches)))
+        finally:
+            shared_texts.close()
+            shared_texts.unlink()
+
+
+def run_match_batches(texts, batches, nr_rows, executor="shared_memory", processes=None, corpus=None, pool=None):
+    """
+    Run batches from get_match_batches() in parallel and collect the results in row order.
+
+    Args:
+        texts (list): Unique texts from get_match_batches().
+        batches (list): Batches from get_match_batches().
+        nr_rows (int): Number of rows in the DataFrame the batches were created from.
+        executor (str): "shared_memory" to run the batches in a process pool where the texts
+            are placed in shared memory once (tasks only carry text ids), or "thread" to run
+            them in a thread pool that reads the texts directly. Threads avoid all copying
+            and only pay off when the matching releases the GIL (numpy, rapidfuzz).
+        processes (int | NoneType): Number of processes/threads to use.
+            If None, use all available processes.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts.
+        pool (MatchPool | NoneType): Pool to run the batches in with the "shared_memory"
+            executor. If None, a pool is created (and closed) for this call. The processes
+            and corpus of a given pool are the ones it was created with.
+
+    Returns:
+        list: Result of each row.
+    """
+
+    if executor == "thread":
+        with ThreadPoolExecutor(processes or mp.cpu_count()) as thread_pool:
+            batch_results = list(
+                tqdm(thread_pool.map(partial(match_batch, texts=texts, corpus=corpus), batches), total=len(batches))
+            )
+    elif executor == "shared_memory":
+        if pool is not None:
+            batch_results = pool.match_batches(texts, batches)
+        else:
+            with MatchPool(processes, corpus) as pool:
+                batch_results = pool.match_batches(texts, batches)
+    else:
+        raise ValueError(f"Unknown executor: {executor}")
+
+    results = [None] * nr_rows
+    for batch_result in batch_results:
+        for row, result in batch_result:
+            results[row] = result
+
+    return results
+
+
+def fill_prefiltered_results(keep, matches, empty_result):
+    """
+    Combine the results of the rows kept by a prefilter with empty results for the rows
+    it filtered out.
+
+    Args:
+        keep (np.array): Boolean array over all rows, from MinHashSignatures.filter_pairs().
+        matches (list): Results of the kept rows.
+        empty_result (tuple): Result of the filtered out rows, e.g. (None, None).
+
+    Returns:
+        list: Result of every row.
+    """
+
+    results = [empty_result] * len(keep)
+    for i, match in zip(np.flatnonzero(keep), matches):
+        results[i] = match
+
+    return results
 
 
 def contiguous_ngram_indices(
@@ -271,6 +1283,13 @@ def contiguous_ngram_indices(
     min_continuous_match=8,
     max_gap=30,
     processes=None,
+    corpus=None,
+    index_by=None,
+    executor="process",
+    batch_size=256,
+    prefilter=None,
+    min_similarity=0.1,
+    pool=None,
 ):
     """
     Find and return the indices of the contiguous text in column_out that
@@ -289,26 +1308,120 @@ def contiguous_ngram_indices(
             region.
         processes (int | NoneType): Number of processes to use for multiprocessing.
             If None, use all available processes.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts, shared with
+            the worker processes.
+        index_by (str | NoneType): Column that groups rows sharing the same column_out text,
+            e.g. "dokid" when column_out is the transcript of the whole debate. If given,
+            a DebateNgramIndex is built once per group and all rows of the group are
+            located with it, instead of matching every row against column_out separately.
+        executor (str): "process" sends the texts of every row to a process pool, batch_size rows per task.
+            "shared_memory" or "thread" deduplicate the texts and run rows sharing the same
+            column_out text in batches with one DebateNgramIndex each, see run_match_batches().
+        batch_size (int): Number of rows per task with the "process" executor. The contiguous
+            regions of all rows in a task are found in one batch, see contiguous_ngram_match_batch().
+        prefilter (MinHashSignatures | NoneType): If given, rows whose estimated containment of
+            column_in in column_out (src/minhash.py) is below min_similarity get (None, None)
+            without being matched.
+        min_similarity (float): Similarity threshold of the prefilter.
+        pool (MatchPool | NoneType): Pool reused across calls by the "shared_memory" executor,
+            see run_match_batches(). processes and corpus are then those of the pool.
     """
 
-    df
+    if prefilter is not None:
+        keep = prefilter.filter_pairs(df[column_in].tolist(), df[column_out].tolist(), min_similarity)
+        matches = contiguous_ngram_indices(
+            df[keep].reset_index(drop=True),
+            column_in,
+            column_out,
+            n,
+            threshold,
+            min_continuous_match,
+            max_gap,
+            processes,
+            corpus,
+            index_by,
+            executor,
+            batch_size,
+            pool=pool,
+        )
+        return fill_prefiltered_results(keep, matches, (None, None))
+
+    if executor != "process":
+        texts, batches = get_match_batches(
+            df, column_in, column_out, "ngram", (n, threshold, min_continuous_match, max_gap)
+        )
+        return run_match_batches(texts, batches, len(df), executor, processes, corpus, pool)
+
+    if index_by is not None:
+        return contiguous_ngram_indices_by_group(
+            df, column_in, column_out, index_by, n, threshold, min_continuous_match, max_gap, processes, corpus
+        )
+
+    texts_in = df[column_in].tolist()
+    texts_out = df[column_out].tolist()
 
-    with mp.Pool(processes) as pool:
+    with mp.Pool(processes, initializer=init_worker_corpus, initargs=(corpus,)) as pool:
         args = [
-            (text1, text2, n, threshold, min_continuous_match, max_gap)
-            for text1, text2 in zip(df[column_in], df[column_out])
+            (texts_in[i : i + batch_size], texts_out[i : i + batch_size], n, threshold, min_continuous_match, max_gap)
+            for i in range(0, len(df), batch_size)
         ]
-        contiguous_ngram_list = list(
+        batch_results = list(
             tqdm(
                 pool.imap(
-                    contiguous_ngram_match_star,
+                    contiguous_ngram_match_batch_star,
                     args,
                     chunksize=1,
                 ),
-                total=len(df),
+                total=len(args),
+            )
+        )
+
+    return [match for batch_result in batch_results for match in batch_result]
+
+
+def contiguous_ngram_indices_by_group(
+    df,
+    column_in,
+    column_out,
+    index_by,
+    n=6,
+    threshold=1.3,
+    min_continuous_match=8,
+    max_gap=30,
+    processes=None,
+    corpus=None,
+):
+    """
+    Same as contiguous_ngram_indices(), but builds one DebateNgramIndex per group of rows
+    (e.g. per dokid) and locates all rows of the group with it. The column_out text of
+    each group is only sent to the worker processes once.
+    """
+
+    groups = list(df.groupby(index_by, sort=False).indices.values())
+    texts_in = df[column_in].tolist()
+    texts_out = df[column_out].tolist()
+
+    with mp.Pool(processes, initializer=init_worker_corpus, initargs=(corpus,)) as pool:
+        args = [
+            ([texts_in[i] for i in group], texts_out[group[0]], n, threshold, min_continuous_match, max_gap)
+            for group in groups
+        ]
+        group_results = list(
+            tqdm(
+                pool.imap(
+                    locate_speeches_star,
+                    args,
+                    chunksize=1,
+                ),
+                total=len(groups),
             )
         )
 
+    contiguous_ngram_list = [(None, None)] * len(df)
+    for group, results in zip(groups, group_results):
+        for i, result in zip(group, results):
+            contiguous_ngram_list[i] = result
+
     return contiguous_ngram_list
 
 
@@ -318,6 +1431,14 @@ def contiguous_fuzzy_indices(
     column_out,
     threshold=55,
     processes=None,
+    corpus=None,
+    windowed=False,
+    padding=60,
+    max_padding=960,
+    executor="process",
+    prefilter=None,
+    min_similarity=0.1,
+    pool=None,
 ):
     """
     Find and return the indices of the contiguous text in column_out that
@@ -331,14 +1452,77 @@ def contiguous_fuzzy_indices(
         threshold (int): Threshold score for the fuzzy match to return indices.
         processes (int | NoneType): Number of processes to use for multiprocessing.
             If None, use all available processes.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts, shared with
+            the worker processes.
+        windowed (bool): If True, only search a time window around the expected position of
+            each speech with contiguous_fuzzy_match_windowed(). Requires the columns "start",
+            "duration" and "chunks" (wav2vec2 word timestamps of column_out) in df.
+        padding (float): Initial padding in seconds of the window when windowed=True.
+        max_padding (float): Largest padding before falling back to a full search.
+        executor (str): "process" sends both texts to a process pool for every row.
+            "shared_memory" or "thread" deduplicate the texts and run rows sharing the same
+            column_out text in batches, see run_match_batches().
+        prefilter (MinHashSignatures | NoneType): If given, rows whose estimated containment of
+            column_in in column_out (src/minhash.py) is below min_similarity get (None, None, None)
+            without being aligned.
+        min_similarity (float): Similarity threshold of the prefilter.
+        pool (MatchPool | NoneType): Pool reused across calls by the "shared_memory" executor,
+            see run_match_batches(). processes and corpus are then those of the pool.
     """
 
-    with mp.Pool(processes) as pool:
+    if prefilter is not None:
+        keep = prefilter.filter_pairs(df[column_in].tolist(), df[column_out].tolist(), min_similarity)
+        matches = contiguous_fuzzy_indices(
+            df[keep].reset_index(drop=True),
+            column_in,
+            column_out,
+            threshold,
+            processes,
+            corpus,
+            windowed,
+            padding,
+            max_padding,
+            executor,
+            pool=pool,
+        )
+        return fill_prefiltered_results(keep, matches, (None, None, None))
+
+    if executor != "process":
+        if windowed:
+            method, params = "fuzzy_windowed", (threshold, padding, max_padding)
+        else:
+            method, params = "fuzzy", (threshold,)
+        texts, batches = get_match_batches(df, column_in, column_out, method, params)
+        return run_match_batches(texts, batches, len(df), executor, processes, corpus, pool)
+
+    if windowed:
+        # Word timestamps are the same for all speeches of a debate, compute them once per text
+        word_times_cache = {}
+        word_times = []
+        for text, chunks in zip(df[column_out], df["chunks"]):
+            if text is None or chunks is None:
+                word_times.append(None)
+                continue
+            if text not in word_times_cache:
+                word_times_cache[text] = get_word_start_times(chunks)
+            word_times.append(word_times_cache[text])
+
+        args = [
+            (text1, text2, times, start, duration, threshold, padding, max_padding)
+            for text1, text2, times, start, duration in zip(
+                df[column_in], df[column_out], word_times, df["start"], df["duration"]
+            )
+        ]
+        match_function = contiguous_fuzzy_match_windowed_star
+    else:
         args = [(text1, text2, threshold) for text1, text2 in zip(df[column_in], df[column_out])]
+        match_function = contiguous_fuzzy_match_star
+
+    with mp.Pool(processes, initializer=init_worker_corpus, initargs=(corpus,)) as pool:
         contiguous_fuzzy_list = list(
             tqdm(
                 pool.imap(
-                    contiguous_fuzzy_match_star,
+                    match_function,
                     args,
                     chunksize=1,
                 ),
@@ -347,3 +1531,225 @@ def contiguous_fuzzy_indices(
         )
 
     return contiguous_fuzzy_list
+
+
+def match_text_pairs(
+    texts_in,
+    texts_out,
+    metrics=("ngram", "fuzzy", "bleu"),
+    directions=("forward", "backward"),
+    n=6,
+    threshold_ngram=1.3,
+    min_continuous_match=8,
+    max_gap=30,
+    threshold_fuzzy=55,
+    suffixes=("_i", "_a"),
+    band=50,
+    corpus=None,
+):
+    """
+    Compute several match metrics for a list of text pairs in one pass.
+
+    The texts are tokenized once (into a TokenizedCorpus unless one is given) and the
+    tokens are shared by all metrics and directions.
+
+    Args:
+        texts_in (list): Texts to match against (e.g. anftext_normalized).
+        texts_out (list): Texts we get matching indices for (e.g. anftext_inference).
+        metrics, directions, n, threshold_ngram, min_continuous_match, max_gap,
+            threshold_fuzzy, suffixes, band: See match_texts().
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts.
+
+    Returns:
+        dict: Column name -> list of values.
+    """
+
+    if corpus is None:
+        corpus = TokenizedCorpus.from_texts(texts_in)
+        corpus.add_texts(texts_out)
+
+    columns = {}
+    for direction, suffix in zip(("forward", "backward"), suffixes):
+        if direction not in directions:
+            continue
+        pairs = list(zip(texts_in, texts_out)) if direction == "forward" else list(zip(texts_out, texts_in))
+
+        if "ngram" in metrics:
+            ngram_matches = contiguous_ngram_match_batch(
+                [pair[0] for pair in pairs],
+                [pair[1] for pair in pairs],
+                n,
+                threshold_ngram,
+                min_continuous_match,
+                max_gap,
+                corpus=corpus,
+            )
+            columns[f"start_ngram{suffix}"] = [match[0] for match in ngram_matches]
+            columns[f"end_ngram{suffix}"] = [match[1] for match in ngram_matches]
+
+        if "fuzzy" in metrics:
+            fuzzy_matches = [
+                contiguous_fuzzy_match(text1, text2, threshold_fuzzy, corpus=corpus) for text1, text2 in pairs
+            ]
+            columns[f"start_fuzzy{suffix}"] = [match[0] for match in fuzzy_matches]
+            columns[f"end_fuzzy{suffix}"] = [match[1] for match in fuzzy_matches]
+            columns[f"fuzzy_score{suffix}"] = [match[2] for match in fuzzy_matches]
+
+    if "alignment" in metrics:
+        # The alignment is symmetric, one pass gives the matched region in both texts
+        alignments = [
+            align_words(text_in, text_out, band=band, corpus=corpus) for text_in, text_out in zip(texts_in, texts_out)
+        ]
+        suffix_out, suffix_in = suffixes
+        for key, column in [
+            ("start_b", f"start_align{suffix_out}"),
+            ("end_b", f"end_align{suffix_out}"),
+            ("start_a", f"start_align{suffix_in}"),
+            ("end_a", f"end_align{suffix_in}"),
+            ("score", "align_score"),
+            ("agreement", "align_agreement"),
+            ("band_exceeded", "align_band_exceeded"),
+        ]:
+            columns[column] = [None if alignment is None else alignment[key] for alignment in alignments]
+
+    if "bleu" in metrics:
+        # Already running inside one shard, so don't let batch_bleu shard it further
+        columns["bleu_score"] = batch_bleu(texts_in, texts_out, corpus=corpus, shard_size=len(texts_in) + 1)
+
+    return columns
+
+
+def match_text_pairs_star(args):
+    """
+    Wrapper for multiprocessing.
+    Unpacks arguments and calls match_text_pairs().
+    """
+    return match_text_pairs(*args, corpus=_worker_corpus)
+
+
+def match_texts(
+    df,
+    column_in,
+    column_out,
+    metrics=("ngram", "fuzzy", "bleu"),
+    directions=("forward", "backward"),
+    n=6,
+    threshold_ngram=1.3,
+    min_continuous_match=8,
+    max_gap=30,
+    threshold_fuzzy=55,
+    suffixes=("_i", "_a"),
+    band=50,
+    batch_size=256,
+    processes=None,
+    corpus=None,
+    prefilter=None,
+    min_similarity=0.1,
+):
+    """
+    Compute n-gram matches, fuzzy matches and BLEU scores between the texts in column_in
+    and column_out in a single pass. Each worker task handles a batch of text pairs and
+    computes all requested metrics and directions for them, so the texts are sent to the
+    workers and tokenized once instead of once per metric and direction.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing column_in and column_out.
+        column_in (str): Column name of text to match against (e.g. anftext_normalized).
+        column_out (str): Column name of text we get matching indices for (e.g. anftext_inference).
+        metrics (tuple): Any of "ngram" (contiguous_ngram_match()), "fuzzy"
+            (contiguous_fuzzy_match()), "bleu" (calculate_bleu(column_in, column_out)) and
+            "alignment" (align_words(column_in, column_out) in src/alignment.py). The alignment
+            is symmetric and always gives the matched region in both texts. Its column
+            align_band_exceeded flags alignments that may be cut off by the band.
+        directions (tuple): "forward" gives indices in column_out of the match of column_in,
+            "backward" gives indices in column_in of the match of column_out.
+        n (int): N-gram sizes 1 to n.
+        threshold_ngram (float): Threshold score for contiguous n-gram match to be considered a match.
+        min_continous_match (int): Minimum continuous word matches for the region to
+            be considered contiguous.
+        max_gap (int): Maximum gap (in words) between contiguous region and the next/previous
+            region for it to be seen as the start/end index of a larger joined together contiguous
+            region.
+        threshold_fuzzy (int): Threshold score for the fuzzy match to return indices.
+        suffixes (tuple): Column name suffixes of the forward and backward results. The defaults
+            "_i" (indices in anftext_inference) and "_a" (indices in anftext) are the column
+            names expected by src.utils.print_overlapping_segments().
+        band (int): Half width in words of the band of the word alignment, see align_words().
+        batch_size (int): Number of text pairs per worker task.
+        processes (int | NoneType): Number of processes to use for multiprocessing.
+            If None, use all available processes.
+        corpus (TokenizedCorpus | NoneType): Corpus with the tokenized texts, shared with
+            the worker processes.
+        prefilter (MinHashSignatures | NoneType): If given, rows whose estimated containment of
+            column_in in column_out (src/minhash.py) is below min_similarity are not matched,
+            and get missing values in all result columns.
+        min_similarity (float): Similarity threshold of the prefilter.
+
+    Returns:
+        pd.DataFrame: One row per row in df with the columns start_ngram{suffix},
+            end_ngram{suffix} (Int64), start_fuzzy{suffix}, end_fuzzy{suffix} (Int64),
+            fuzzy_score{suffix} (Float64), start_align{suffix}, end_align{suffix} (Int64),
+            align_score, align_agreement (Float64), align_band_exceeded (boolean) and
+            bleu_score (Float64), depending on the requested metrics and directions.
+    """
+
+    if prefilter is not None:
+        keep = prefilter.filter_pairs(df[column_in].tolist(), df[column_out].tolist(), min_similarity)
+        df_match = match_texts(
+            df[keep].reset_index(drop=True),
+            column_in,
+            column_out,
+            metrics,
+            directions,
+            n,
+            threshold_ngram,
+            min_continuous_match,
+            max_gap,
+            threshold_fuzzy,
+            suffixes,
+            band,
+            batch_size,
+            processes,
+            corpus,
+        )
+        df_match.index = np.flatnonzero(keep)
+        df_match = df_match.reindex(range(len(df)))
+        df_match.index = df.index
+        return df_match
+
+    texts_in = df[column_in].tolist()
+    texts_out = df[column_out].tolist()
+    args = [
+        (
+            texts_in[i : i + batch_size],
+            texts_out[i : i + batch_size],
+            metrics,
+            directions,
+            n,
+            threshold_ngram,
+            min_continuous_match,
+            max_gap,
+            threshold_fuzzy,
+            suffixes,
+            band,
+        )
+        for i in range(0, len(df), batch_size)
+    ]
+
+    with mp.Pool(processes, initializer=init_worker_corpus, initargs=(corpus,)) as pool:
+        batch_results = list(tqdm(pool.imap(match_text_pairs_star, args), total=len(args)))
+
+    if len(batch_results) == 0:
+        return pd.DataFrame(index=df.index)
+
+    df_match = pd.concat([pd.DataFrame(batch_result) for batch_result in batch_results], ignore_index=True)
+    df_match.index = df.index
+    for column in df_match.columns:
+        if column.startswith(("start_", "end_")):
+            df_match[column] = df_match[column].astype("Int64")
+        elif column == "align_band_exceeded":
+            df_match[column] = df_match[column].astype("boolean")
+        else:
+            df_match[column] = df_match[column].astype("Float64")
+
+    return df_match
@@ -0,0 +1,279 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.corpus import TokenizedCorpus
+
+# Multiplier of the polynomial rolling hash over word hashes (same as NGRAM_HASH_PRIME in src/metrics.py)
+SHINGLE_HASH_PRIME = np.uint64(0x9E3779B97F4A7C15)
+
+
+def get_shingle_hashes(text, shingle_size=3):
+    """
+    Unique 64-bit hashes of the word shingles (word ngrams of size shingle_size) of text.
+
+    Words are hashed with pd.util.hash_array(), which is stable across processes and runs,
+    so signatures can be saved and reused. Texts shorter than shingle_size words get a
+    single shingle of all their words.
+
+    Args:
+        text (str): Text to shingle.
+        shingle_size (int): Number of words per shingle.
+
+    Returns:
+        np.array: Sorted unique uint64 shingle hashes.
+    """
+
+    words = text.split()
+    if len(words) == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    word_hashes = pd.util.hash_array(np.array(words, dtype=object))
+    size = min(shingle_size, len(words))
+    nr_shingles = len(words) - size + 1
+
+    with np.errstate(over="ignore"):
+        hashes = word_hashes[:nr_shingles].copy()
+        for i in range(1, size):
+            hashes = hashes * SHINGLE_HASH_PRIME + word_hashes[i : i + nr_shingles]
+
+    return np.unique(hashes)
+
+
+class MinHashSignatures:
+    """
+    Store of MinHash signatures of texts, used to cheaply estimate the overlap of text
+    pairs before running the expensive matchers in src/metrics.py.
+
+    For every text two arrays with one value per hash function are kept: the signature
+    (minimum permuted shingle hash) and the sample (the shingle that attained the minimum).
+    Signatures estimate the Jaccard similarity of two texts. Samples are a random sample of
+    the shingles of a text and estimate how much of it is contained in another text, which
+    also works when the other text is much longer (a speech vs. the transcript of its whole
+    debate), where the Jaccard similarity is too small to estimate.
+
+    Texts are keyed like in TokenizedCorpus (src/corpus.py), and signatures can be saved to
+    and loaded from a folder for reuse.
+
+    Args:
+        num_perm (int): Number of hash functions.
+        shingle_size (int): Number of words per shingle.
+        seed (int): Seed of the hash functions. Signatures are only comparable with the
+            same num_perm, shingle_size and seed.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=3, seed=0):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        # Odd multipliers make (a * x + b) mod 2**64 a permutation of the 64-bit hashes
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 2**64, size=num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self.b = rng.integers(0, 2**64, size=num_perm, dtype=np.uint64, endpoint=False)
+
+        self.signatures = {}
+        self.samples = {}
+        self.nr_shingles = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, text):
+        return TokenizedCorpus.text_key(text) in self.signatures
+
+    def get_signature(self, shingle_hashes, chunk_size=4096):
+        """
+        MinHash signature and sample of a set of shingle hashes.
+
+        Returns:
+            tuple: Signature and sample, uint64 arrays of length num_perm.
+        """
+
+        signature = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        sample = np.zeros(self.num_perm, dtype=np.uint64)
+
+        with np.errstate(over="ignore"):
+            for i in range(0, len(shingle_hashes), chunk_size):
+                chunk = shingle_hashes[i : i + chunk_size]
+                permuted = chunk[:, None] * self.a + self.b
+                argmin = permuted.argmin(axis=0)
+                chunk_min = permuted[argmin, np.arange(self.num_perm)]
+                smaller = chunk_min < signature
+                signature[smaller] = chunk_min[smaller]
+                sample[smaller] = chunk[argmin[smaller]]
+
+        return signature, sample
+
+    def add(self, text):
+        """
+        Compute the signature of a text and add it (unless it's already there).
+
+        Returns:
+            str: Key of the text.
+        """
+
+        key = TokenizedCorpus.text_key(text)
+        if key in self.signatures:
+            return key
+
+        shingle_hashes = get_shingle_hashes(text, self.shingle_size)
+        self.signatures[key], self.samples[key] = self.get_signature(shingle_hashes)
+        self.nr_shingles[key] = len(shingle_hashes)
+        return key
+
+    def add_texts(self, texts):
+        """
+        Add several texts. Returns list of keys (None for missing texts).
+        """
+        return [None if text is None else self.add(text) for text in texts]
+
+    def estimate_jaccard(self, texts_in, texts_out):
+        """
+        Estimate the Jaccard similarity of the shingles of each pair of texts from their
+        signatures. Missing texts are added first.
+
+        Args:
+            texts_in (list): First text of every pair.
+            texts_out (list): Second text of every pair.
+
+        Returns:
+            np.array: Estimated Jaccard similarity of each pair, NaN if a text is missing.
+        """
+
+        keys_in = self.add_texts(texts_in)
+        keys_out = self.add_texts(texts_out)
+        similarity = np.full(len(keys_in), np.nan)
+        pairs = [i for i, (key_in, key_out) in enumerate(zip(keys_in, keys_out)) if key_in and key_out]
+        if len(pairs) == 0:
+            return similarity
+
+        signatures_in = np.stack([self.signatures[keys_in[i]] for i in pairs])
+        signatures_out = np.stack([self.signatures[keys_out[i]] for i in pairs])
+        similarity[pairs] = (signatures_in == signatures_out).mean(axis=1)
+
+        # Empty texts have equal (all max) signatures but share no shingles
+        empty = [self.nr_shingles[keys_in[i]] == 0 or self.nr_shingles[keys_out[i]] == 0 for i in pairs]
+        similarity[np.array(pairs)[empty]] = 0
+        return similarity
+
+    def estimate_containment(self, texts_in, texts_out):
+        """
+        Estimate the share of the shingles of each text in texts_in that also occur in the
+        paired text in texts_out, by looking up the sample of texts_in in the shingles of
+        texts_out. The shingles of every unique text in texts_out are computed once.
+
+        Returns:
+            np.array: Estimated containment of each pair, NaN if a text is missing.
+        """
+
+        keys_in = self.add_texts(texts_in)
+        similarity = np.full(len(keys_in), np.nan)
+
+        groups = {}
+        for i, (key_in, text_out) in enumerate(zip(keys_in, texts_out)):
+            if key_in is not None and text_out is not None:
+                groups.setdefault(text_out, []).append(i)
+
+        for text_out, rows in groups.items():
+            shingle_hashes = get_shingle_hashes(text_out, self.shingle_size)
+            samples = np.stack([self.samples[keys_in[i]] for i in rows])
+            similarity[rows] = np.isin(samples, shingle_hashes).mean(axis=1)
+            empty = [self.nr_shingles[keys_in[i]] == 0 for i in rows]
+            similarity[np.array(rows)[empty]] = 0
+
+        return similarity
+
+    def filter_pairs(self, texts_in, texts_out, min_similarity=0.1, measure="containment"):
+        """
+        Find the pairs of texts worth sending to the matchers.
+
+        Args:
+            texts_in (list): Texts to match against (e.g. anftext_normalized).
+            texts_out (list): Texts we get matching indices for (e.g. anftext_inference).
+            min_similarity (float): Pairs with a lower estimated similarity are filtered out.
+            measure (str): "containment" (share of texts_in found in texts_out) or "jaccard".
+
+        Returns:
+            np.array: Boolean array, True for pairs to keep. Pairs with a missing text are
+                filtered out, as the matchers return None for them anyway.
+        """
+
+        if measure == "containment":
+            similarity = self.estimate_containment(texts_in, texts_out)
+        elif measure == "jaccard":
+            similarity = self.estimate_jaccard(texts_in, texts_out)
+        else:
+            raise ValueError(f"Unknown similarity measure: {measure}")
+
+        return np.nan_to_num(similarity, nan=-1) >= min_similarity
+
+    def save(self, folder="data/minhash"):
+        """
+        Save signatures and samples to folder/signatures.parquet.
+        """
+
+        os.makedirs(folder, exist_ok=True)
+        keys = list(self.signatures)
+        table = pa.table(
+            {
+                "key": pa.array(keys, type=pa.string()),
+                "nr_shingles": pa.array([self.nr_shingles[key] for key in keys], type=pa.int64()),
+                "signature": pa.array([self.signatures[key] for key in keys], type=pa.list_(pa.uint64())),
+                "sample": pa.array([self.samples[key] for key in keys], type=pa.list_(pa.uint64())),
+            }
+        )
+        params = {"num_perm": self.num_perm, "shingle_size": self.shingle_size, "seed": self.seed}
+        table = table.replace_schema_metadata({"minhash": json.dumps(params)})
+        pq.write_table(table, os.path.join(folder, "signatures.parquet"))
+
+    @classmethod
+    def load(cls, folder="data/minhash"):
+        """
+        Load signatures saved with MinHashSignatures.save().
+        """
+
+        table = pq.read_table(os.path.join(folder, "signatures.parquet"))
+        params = json.loads(table.schema.metadata[b"minhash"])
+        minhash = cls(**params)
+
+        signatures = table["signature"].combine_chunks().values.to_numpy().reshape(-1, minhash.num_perm)
+        samples = table["sample"].combine_chunks().values.to_numpy().reshape(-1, minhash.num_perm)
+        for i, (key, nr_shingles) in enumerate(zip(table["key"].to_pylist(), table["nr_shingles"].to_pylist())):
+            minhash.signatures[key] = signatures[i]
+            minhash.samples[key] = samples[i]
+            minhash.nr_shingles[key] = nr_shingles
+
+        return minhash
+
+
+def get_prefilter_recall(keep, matches):
+    """
+    Recall of a prefilter against the results of the full matcher: the share of the pairs
+    the full matcher found a match for that the prefilter kept.
+
+    Args:
+        keep (np.array): Boolean array from MinHashSignatures.filter_pairs().
+        matches (list): Results of the full matcher (e.g. contiguous_fuzzy_indices()) on all
+            pairs. A pair is matched if the start index of its result is not None.
+
+    Returns:
+        dict: Number of pairs, filtered out pairs, matched pairs, matched pairs that were
+            filtered out, and the recall.
+    """
+
+    keep = np.asarray(keep, dtype=bool)
+    matched = np.array([match is not None and match[0] is not None for match in matches], dtype=bool)
+    nr_matched = int(matched.sum())
+
+    return {
+        "pairs": len(keep),
+        "filtered": int((~keep).sum()),
+        "matched": nr_matched,
+        "matched_filtered": int((matched & ~keep).sum()),
+        "recall": float((matched & keep).sum() / nr_matched) if nr_matched > 0 else None,
+    }
@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import deque
+
+# Statuses meaning the server is overloaded or rate limiting us
+REJECT_STATUSES = {429, 503}
+# Temporary server errors, neither rejections nor successes
+ERROR_STATUSES = {408, 500, 502, 504}
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket rate limiter for asyncio tasks with an adaptive (AIMD) rate, shared by
+    all requests of a RiksdagenClient (or several clients) so that they slow down
+    together when the server starts rejecting requests.
+
+    Every request takes a token with acquire(), tokens are refilled at `rate` per second
+    up to `burst`. Responses are reported with record():
+    - Rejections (429/503) halve the rate (multiplicative decrease, by decrease_factor).
+      Only rejections of requests sent after the last decrease count, so a burst of
+      rejected in-flight requests lowers the rate once. A Retry-After pauses all
+      requests.
+    - Successes raise the rate by `increase` requests per second per second (additive
+      increase). Until the first rejection, the rate instead doubles every second (slow
+      start), to quickly find the rate the server accepts. The rate is never raised
+      above twice the measured throughput, so it doesn't grow unboundedly while the
+      concurrency limit rather than the rate is the bottleneck.
+    - Temporary server errors (408/500/502/504) are ignored, they neither raise the rate
+      nor count towards the throughput.
+
+    Args:
+        rate (float): Initial rate in requests per second.
+        min_rate (float): Minimum rate.
+        max_rate (float | NoneType): Maximum rate, None for no maximum.
+        increase (float): Additive increase of the rate, in requests per second per second.
+        decrease_factor (float): Multiplicative decrease of the rate on rejections.
+        burst (float | NoneType): Bucket size, maximum number of requests sent at once.
+            Default: the current rate (at least 1).
+        window (float): Seconds of history used for throughput() and rejection_rate().
+    """
+
+    def __init__(
+        self,
+        rate=10,
+        min_rate=0.5,
+        max_rate=None,
+        increase=1.0,
+        decrease_factor=0.5,
+        burst=None,
+        window=60,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+        self.window = window
+
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.slow_start = True
+        self.started = self.updated
+        # (time, rejected) of the responses in the last window seconds
+        self.events = deque()
+        self.n_rejected = 0
+        self.lock = asyncio.Lock()
+
+    def get_capacity(self):
+        return self.burst if self.burst is not None else max(1.0, self.rate)
+
+    def refill(self, now):
+        self.tokens = min(self.get_capacity(), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """
+        Wait for a token. Waiting tasks get tokens in the order they asked for them.
+
+        Returns:
+            float: time.monotonic() when the token was granted, pass it to record().
+        """
+
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def record(self, status, sent_at, retry_after=None):
+        """
+        Adapt the rate to the response of a request.
+
+        Args:
+            status (int | NoneType): Status code of the response, None if the request
+                failed without a response (not counted, nor are ERROR_STATUSES).
+            sent_at (float): Return value of acquire() for the request.
+            retry_after (float | NoneType): Retry-After of the response in seconds.
+        """
+
+        if status is None or status in ERROR_STATUSES:
+            return
+
+        now = time.monotonic()
+        rejected = status in REJECT_STATUSES
+        self.events.append((now, rejected))
+        self.n_rejected += rejected
+        self.prune(now)
+
+        if rejected:
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if sent_at >= self.last_decrease:
+                self.refill(now)
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.tokens = min(self.tokens, 0.0)
+                self.last_decrease = now
+                self.slow_start = False
+        else:
+            # About rate successes per second, each adding 1 (slow start) or increase / rate
+            rate = self.rate + (1 if self.slow_start else self.increase / self.rate)
+            rate = min(rate, max(self.rate, 2 * self.throughput(now)))
+            if self.max_rate is not None:
+                rate = min(rate, self.max_rate)
+            self.refill(now)
+            self.rate = rate
+
+    def prune(self, now):
+        while len(self.events) > 0 and self.events[0][0] < now - self.window:
+            _, rejected = self.events.popleft()
+            self.n_rejected -= rejected
+
+    def get_window(self, now):
+        return max(1.0, min(self.window, now - self.started))
+
+    def throughput(self, now=None):
+        """
+        Successful requests per second over the last window seconds.
+        """
+
+        now = time.monotonic() if now is None else now
+        self.prune(now)
+        return (len(self.events) - self.n_rejected) / self.get_window(now)
+
+    def rejection_rate(self, now=None):
+        """
+        Share of the responses of the last window seconds that were rejections.
+        """
+
+        now = time.monotonic() if now is None else now
+        self.prune(now)
+        if len(self.events) == 0:
+            return 0.0
+        return self.n_rejected / len(self.events)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Current rate limit, throughput (requests/s) and rejection rate.
+        """
+
+        now = time.monotonic()
+        return {
+            "rate": round(self.rate, 2),
+            "throughput": round(self.throughput(now), 2),
+            "rejected": round(self.rejection_rate(now), 3),
+        }
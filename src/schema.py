@@ -0,0 +1,290 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Strings repeated across many rows (one value per debate, speaker, party, ...). Dictionary encoded
+# in Arrow and loaded as pd.Categorical.
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+# Compact Arrow types of the columns of the metadata files (df_audio_metadata.parquet and the files
+# derived from it). Columns not listed here are loaded as they are stored.
+COLUMN_TYPES = {
+    # Ids and names
+    "dokid": CATEGORY,
+    "rel_dok_id": CATEGORY,
+    "intressent_id": CATEGORY,
+    "speaker": CATEGORY,
+    "talare": CATEGORY,
+    "party": CATEGORY,
+    "gender": CATEGORY,
+    "electoral_district": CATEGORY,
+    "debatetype": CATEGORY,
+    "debatename": CATEGORY,
+    "filename": CATEGORY,
+    # Texts, urls and other mostly unique strings
+    "anftext": pa.string(),
+    "anforandetext": pa.string(),
+    "anftext_normalized": pa.string(),
+    "anftext_inference": pa.string(),
+    "filename_anforande_audio": pa.string(),
+    "audiofileurl": pa.string(),
+    "downloadfileurl": pa.string(),
+    "url": pa.string(),
+    "debateurl": pa.string(),
+    # Numbers
+    "anforande_nummer": pa.int32(),
+    "number": pa.int32(),
+    "birth_year": pa.int32(),
+    # Times in whole seconds from the mhs-vodapi, exact in float32. Times with decimals from alignment
+    # (start_segment, end_segment, ...) are kept as float64, as they are used in file names.
+    "start": pa.float32(),
+    "duration": pa.float32(),
+    "debateseconds": pa.float32(),
+}
+
+# Hive partition column (year of debatedate) of metadata datasets written with write_metadata()
+PARTITION_COLUMN = "year"
+
+# Row number of each row in the dataframe given to write_metadata(), used to read the rows back in that order
+ROW_NUMBER_COLUMN = "_row_nr"
+
+# pandas dtypes of the compact Arrow types (dictionaries become pd.Categorical without a mapping)
+PANDAS_TYPES = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+    pa.int32(): pd.Int32Dtype(),
+}
+
+
+def get_schema(columns):
+    """
+    Arrow schema of the metadata columns in COLUMN_TYPES.
+
+    Args:
+        columns (list): Column names. Columns not in COLUMN_TYPES are skipped.
+
+    Returns:
+        pa.Schema: Schema with the compact types of the columns.
+    """
+    return pa.schema([(column, COLUMN_TYPES[column]) for column in columns if column in COLUMN_TYPES])
+
+
+def cast_table(table):
+    """
+    Cast the columns of an Arrow table that are in COLUMN_TYPES to their compact types.
+    Columns that can't be cast safely (e.g. numbers with decimals to int32) are kept as
+    they are.
+
+    Args:
+        table (pa.Table): Metadata table.
+
+    Returns:
+        pa.Table: Table with compact column types.
+    """
+
+    for i, field in enumerate(table.schema):
+        column_type = COLUMN_TYPES.get(field.name)
+        if column_type is None or field.type == column_type:
+            continue
+
+        column = table.column(i)
+        try:
+            if column_type == CATEGORY:
+                if pa.types.is_dictionary(field.type):
+                    column = pc.cast(column, pa.dictionary(field.type.index_type, pa.string()))
+                else:
+                    column = pc.cast(column, pa.string()).dictionary_encode()
+            else:
+                column = pc.cast(column, column_type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            continue
+
+        table = table.set_column(i, pa.field(field.name, column.type), column)
+
+    return table
+
+
+def write_metadata(df, path, date_column="debatedate", sort_by=("dokid",), row_group_size=20000, partitioned=True):
+    """
+    Write metadata as a hive partitioned parquet dataset with one folder per year of
+    date_column (path/year=2019/part-0.parquet, ...). Rows are sorted by sort_by within
+    each year, so that the row group statistics let readers skip row groups when
+    filtering on dokid. The row number of every row in df is stored, and read_metadata()
+    returns the rows in the order of df.
+
+    With partitioned=False, a single parquet file with the rows in the order of df and
+    without the year and row number columns is written instead, for the published
+    outputs (df_final_metadata.parquet, df_final_riksvox.parquet) that are also read
+    with plain pd.read_parquet().
+
+    date_column is stored as a timestamp, so the date filters of get_filters() work.
+    Dates given as strings (e.g. "2019-01-15") or dates are cast.
+
+    An existing dataset or single parquet file at path is replaced.
+
+    Args:
+        df (pd.DataFrame | pa.Table): Metadata with date_column.
+        path (str): Folder of the dataset (or path of the file), e.g. data/df_audio_metadata.parquet.
+        date_column (str): Date column to partition by.
+        sort_by (tuple): Columns to sort by within each year.
+        row_group_size (int): Maximum number of rows per row group.
+        partitioned (bool): Write a year partitioned dataset, otherwise a single file.
+    """
+
+    if isinstance(df, pa.Table):
+        table = df
+        date_index = table.schema.get_field_index(date_column)
+        if not pa.types.is_timestamp(table.schema.field(date_index).type):
+            table = table.set_column(date_index, date_column, pc.cast(table[date_column], pa.timestamp("ns")))
+    else:
+        # Cast in pandas, so that the pandas metadata of the table has the new type
+        if not pd.api.types.is_datetime64_any_dtype(df[date_column]):
+            df = df.assign(**{date_column: pd.to_datetime(df[date_column])})
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+    table = table.drop_columns(
+        [column for column in (PARTITION_COLUMN, ROW_NUMBER_COLUMN) if column in table.column_names]
+    )
+
+    if not partitioned:
+        pq.write_table(table, f"{path}.tmp", row_group_size=row_group_size)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(f"{path}.tmp", path)
+        return
+
+    if os.path.isfile(path):
+        os.remove(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+    table = table.append_column(ROW_NUMBER_COLUMN, pa.array(np.arange(table.num_rows, dtype=np.int64)))
+    table = table.append_column(PARTITION_COLUMN, pc.cast(pc.year(table[date_column]), pa.int32()))
+    sort_keys = [PARTITION_COLUMN, *[column for column in sort_by if column in table.column_names]]
+    table = table.sort_by([(column, "ascending") for column in sort_keys])
+
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=[PARTITION_COLUMN],
+        partitioning_flavor="hive",
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+        max_rows_per_group=row_group_size,
+        min_rows_per_group=min(row_group_size, 1000),
+    )
+
+
+def get_filters(min_date=None, max_date=None, dokids=None, date_column="debatedate"):
+    """
+    Row filters for read_metadata(), pushed down to the parquet reader. The year
+    conditions skip the folders of other years in datasets written with
+    write_metadata(), and the date and dokid conditions skip row groups by their
+    statistics.
+
+    Args:
+        min_date (str | NoneType): Keep rows with date_column >= min_date.
+        max_date (str | NoneType): Keep rows with date_column < max_date.
+        dokids (list | NoneType): Keep rows of these dokids.
+        date_column (str): Date column to filter on.
+
+    Returns:
+        list | NoneType: Filters, None if there are no conditions.
+    """
+
+    filters = []
+    if min_date is not None:
+        min_date = pd.Timestamp(min_date)
+        filters += [(PARTITION_COLUMN, ">=", min_date.year), (date_column, ">=", min_date.to_pydatetime())]
+    if max_date is not None:
+        max_date = pd.Timestamp(max_date)
+        filters += [(PARTITION_COLUMN, "<=", max_date.year), (date_column, "<", max_date.to_pydatetime())]
+    if dokids is not None:
+        filters.append(("dokid", "in", list(dokids)))
+
+    return filters if len(filters) > 0 else None
+
+
+def read_parquet_table(path, columns=None, filters=None):
+    """
+    Read a parquet file or a dataset written with write_metadata(), with the rows in the
+    order of the dataframe it was written from. The partition column (of datasets) and the
+    row number column are only returned if they're in columns, and year filters are ignored
+    for single files.
+    """
+
+    if os.path.isfile(path):
+        if filters is not None:
+            filters = [condition for condition in filters if condition[0] != PARTITION_COLUMN] or None
+        schema = pq.read_schema(path)
+        partitioning = None
+        hidden_columns = [ROW_NUMBER_COLUMN]
+    else:
+        schema = ds.dataset(path, format="parquet", partitioning="hive").schema
+        partitioning = "hive"
+        hidden_columns = [PARTITION_COLUMN, ROW_NUMBER_COLUMN]
+
+    # Files written before row numbers were stored are read in the order they're stored in
+    has_row_numbers = ROW_NUMBER_COLUMN in schema.names
+    read_columns = columns
+    if columns is not None and has_row_numbers and ROW_NUMBER_COLUMN not in columns:
+        read_columns = [*columns, ROW_NUMBER_COLUMN]
+
+    table = pq.read_table(path, columns=read_columns, filters=filters, partitioning=partitioning)
+    if has_row_numbers:
+        table = table.take(pc.sort_indices(table[ROW_NUMBER_COLUMN]))
+
+    if columns is not None:
+        hidden_columns = [column for column in hidden_columns if column not in columns]
+    return table.drop_columns([column for column in hidden_columns if column in table.column_names])
+
+
+def read_metadata_table(path, columns=None, filters=None, compact=True):
+    """
+    Read a metadata parquet file or dataset to an Arrow table with compact column types,
+    reading only the given columns (and row groups/partitions matching filters) from disk.
+
+    Args:
+        path (str): Path to a parquet file or dataset folder.
+        columns (list | NoneType): Columns to read. None reads all columns.
+        filters (list | NoneType): Row filters, see get_filters() and
+            pyarrow.parquet.read_table().
+        compact (bool): Cast columns to the compact types in COLUMN_TYPES.
+
+    Returns:
+        pa.Table: Metadata table.
+    """
+
+    table = read_parquet_table(path, columns=columns, filters=filters)
+    return cast_table(table) if compact else table
+
+
+def read_metadata(path, columns=None, filters=None, compact=True):
+    """
+    Read a metadata parquet file or dataset (e.g. data/df_audio_metadata.parquet) to a
+    pandas dataframe in compact form: repeated strings as categoricals, texts as
+    string[pyarrow], speech numbers as Int32 and API times as float32. Load only the
+    columns a script uses to keep memory down, and pass filters (see get_filters()) to
+    only read the years and debates needed.
+
+    Args:
+        path (str): Path to a parquet file or dataset folder.
+        columns (list | NoneType): Columns to read. None reads all columns.
+        filters (list | NoneType): Row filters, see get_filters().
+        compact (bool): Use the compact types. If False, columns are loaded with the
+            same types as pd.read_parquet().
+
+    Returns:
+        pd.DataFrame: Metadata dataframe.
+    """
+
+    table = read_metadata_table(path, columns=columns, filters=filters, compact=compact)
+    if compact:
+        return table.to_pandas(types_mapper=PANDAS_TYPES.get)
+    return table.to_pandas()
@@ -0,0 +1,89 @@
+import pandas as pd
+
+# Person attributes joined to the speeches from Riksdagen's person.csv (see scripts/mop_joiner.py)
+PERSON_COLUMNS = ["Förnamn", "Efternamn", "Parti", "Kön", "Född", "Valkrets"]
+
+
+def read_person_records(path="person.csv"):
+    """
+    Read Riksdagen's person records. Every row is an assignment of a person (Id), valid
+    from the date From to the date Tom (missing if the assignment is ongoing).
+
+    Returns:
+        pd.DataFrame: Person records with From and Tom as datetimes.
+    """
+
+    df_person = pd.read_csv(path)
+    df_person["From"] = pd.to_datetime(df_person["From"])
+    df_person["Tom"] = pd.to_datetime(df_person["Tom"])
+    return df_person
+
+
+def join_person_records(df, df_person, columns=PERSON_COLUMNS, id_column="intressent_id", date_column="debatedate"):
+    """
+    Interval (as-of) join of speeches against person records: every speech gets the
+    attributes of the speaker's records that were valid (From <= date <= Tom) on the
+    date of the speech, so party and electoral district are the ones the speaker had at
+    the time.
+
+    The join is done once per unique (speaker id, date) pair rather than per speech. When
+    several records are valid on a date, the latest non-missing value of each attribute
+    (by From) is used. Attributes still missing, e.g. for dates outside all records, are
+    filled with the first non-missing value of the person, like groupby("Id").first().
+
+    Args:
+        df (pd.DataFrame): Speeches with id_column and date_column.
+        df_person (pd.DataFrame): Person records, see read_person_records().
+        columns (list): Person attributes to join.
+        id_column (str): Column of df with the person Id.
+        date_column (str): Column of df with the date of the speech.
+
+    Returns:
+        pd.DataFrame: df with the person attributes added.
+    """
+
+    pairs = df[[id_column, date_column]].dropna().drop_duplicates()
+    candidates = pairs.merge(df_person[["Id", "From", "Tom", *columns]], left_on=id_column, right_on="Id", how="inner")
+
+    date = candidates[date_column]
+    valid = (candidates["From"].isna() | (candidates["From"] <= date)) & (
+        candidates["Tom"].isna() | (date <= candidates["Tom"])
+    )
+    candidates = candidates[valid].sort_values("From", na_position="first", kind="stable")
+    attributes = candidates.groupby([id_column, date_column], sort=False)[columns].last().reset_index()
+
+    df = df.merge(attributes, on=[id_column, date_column], how="left")
+
+    first_attributes = df_person.groupby("Id")[columns].first()
+    for column in columns:
+        df[column] = df[column].fillna(df[id_column].map(first_attributes[column]))
+
+    return df
+
+
+def fill_with_speaker_mode(df, columns, by="speaker"):
+    """
+    Fill missing values of columns with the most common value of the column for the
+    same speaker (ties go to the smallest value). Vectorized version of
+    df.groupby(by).apply(lambda x: x.fillna(x.mode().iloc[0])). Rows where by is missing
+    are left as they are.
+
+    Args:
+        df (pd.DataFrame): Speeches.
+        columns (list): Columns to fill.
+        by (str): Column identifying the speaker.
+
+    Returns:
+        pd.DataFrame: df with missing values filled.
+    """
+
+    for column in columns:
+        if column == by:
+            continue
+
+        counts = df.groupby([by, column], observed=True).size().rename("count").reset_index()
+        counts = counts.sort_values([by, "count", column], ascending=[True, False, True], kind="stable")
+        modes = counts.drop_duplicates(by).set_index(by)[column]
+        df[column] = df[column].fillna(df[by].map(modes))
+
+    return df
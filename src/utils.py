@@ -1,3 +1,94 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Attachments of this process to the shared memory blocks of SharedTexts objects created in
+# another process, by block name: (SharedMemory, offsets, missing). Pool workers unpickle a
+# SharedTexts object for every task, which reuses the attachment instead of attaching again.
+_attached_texts = {}
+
+
+class SharedTexts:
+    """
+    List of texts stored in shared memory, so worker processes can read them without
+    the texts being pickled and sent through the pool for every task.
+
+    The texts are utf-8 encoded and concatenated into one shared memory block, after a
+    header with the offsets of the texts and which of them are missing. Pickling a
+    SharedTexts object (e.g. as a pool initializer argument or as part of a task) only
+    pickles the name of the shared memory block and the number of texts; the unpickled
+    object attaches to the existing block, once per process (see detach_shared_texts()).
+
+    The process that creates the object owns the shared memory and should call
+    close() and unlink() when done.
+
+    Args:
+        texts (list): List of texts (str or None).
+    """
+
+    def __init__(self, texts):
+        encoded = [b"" if text is None else text.encode("utf-8") for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+        missing = np.array([text is None for text in texts], dtype=bool)
+
+        header = offsets.tobytes() + missing.tobytes()
+        self.shm = shared_memory.SharedMemory(create=True, size=len(header) + int(offsets[-1]))
+        self.shm.buf[: len(header)] = header
+        self.shm.buf[len(header) : len(header) + offsets[-1]] = b"".join(encoded)
+        self.read_header(len(encoded))
+
+    def read_header(self, nr_texts):
+        # Copies, so that no numpy array keeps the shared memory buffer exported when closing it
+        self.offsets = np.frombuffer(self.shm.buf, dtype=np.int64, count=nr_texts + 1).copy()
+        self.missing = np.frombuffer(self.shm.buf, dtype=bool, count=nr_texts, offset=self.offsets.nbytes).copy()
+        self.offsets += self.offsets.nbytes + self.missing.nbytes
+
+    def __len__(self):
+        return len(self.missing)
+
+    def __getitem__(self, i):
+        if self.missing[i]:
+            return None
+        # Decodes straight from the shared memory buffer, without copying to bytes first
+        return str(self.shm.buf[self.offsets[i] : self.offsets[i + 1]], "utf-8")
+
+    def __getstate__(self):
+        return {"name": self.shm.name, "nr_texts": len(self)}
+
+    def __setstate__(self, state):
+        if state["name"] not in _attached_texts:
+            # Worker processes share the resource tracker of the parent process, so attaching
+            # doesn't make the block get unlinked when a worker exits.
+            self.shm = shared_memory.SharedMemory(name=state["name"])
+            self.read_header(state["nr_texts"])
+            _attached_texts[state["name"]] = (self.shm, self.offsets, self.missing)
+        self.shm, self.offsets, self.missing = _attached_texts[state["name"]]
+
+    def close(self):
+        # Also closes the attachment shared by all objects unpickled in this process
+        _attached_texts.pop(self.shm.name, None)
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def detach_shared_texts(keep=None):
+    """
+    Close the attachments of this process to the shared memory blocks of unpickled
+    SharedTexts objects. Called by pool workers to let go of the blocks of earlier
+    calls, which the process that created them has already unlinked.
+
+    Args:
+        keep (str | NoneType): Name of a block to stay attached to.
+    """
+
+    for name in list(_attached_texts):
+        if name != keep:
+            _attached_texts.pop(name)[0].close()
+
+
 def print_overlapping_segments(df, row_nr, method="fuzzy", column="anftext_inference"):
     """
     Prints segments that overlap between actual transcription ("anftext_normalized")
@@ -11,7 +102,7 @@ def print_overlapping_segments(df, row_nr, method="fuzzy", column="anftext_infer
     Args:
         df (pd.DataFrame): DataFrame with columns "anftext_normalized" and "anftext_inference".
         row_nr (int): Row number of the DataFrame to print.
-        method (str): Method to use for matching. Either "ngram" or "fuzzy".
+        method (str): Method to use for matching. Either "ngram", "fuzzy" or "align".
         column (str): Column to print. Either "anftext_inference" or "anftext_normalized".
     """
 
@@ -27,6 +118,12 @@ def print_overlapping_segments(df, row_nr, method="fuzzy", column="anftext_infer
     elif "ngram" in method and column == "anftext_normalized":
         start = int(df["start_ngram_a"][row_nr])
         end = int(df["end_ngram_a"][row_nr])
+    elif "align" in method and column == "anftext_inference":
+        start = int(df["start_align_i"][row_nr])
+        end = int(df["end_align_i"][row_nr])
+    elif "align" in method and column == "anftext_normalized":
+        start = int(df["start_align_a"][row_nr])
+        end = int(df["end_align_a"][row_nr])
 
     split_text = df[column][row_nr].split()
     color_text = (
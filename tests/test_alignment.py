@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from src.alignment import align_words, fill_banded_matrix, get_seed_anchors, traceback_alignment
+
+
+def full_alignment_score(tokens_a, tokens_b, match=1, mismatch=-1, gap=-1):
+    """
+    Best local alignment score of the full O(n * m) Smith-Waterman matrix.
+    """
+
+    n, m = len(tokens_a), len(tokens_b)
+    H = np.zeros((n + 1, m + 1), dtype=np.int64)
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            score = match if tokens_a[i - 1] == tokens_b[j - 1] else mismatch
+            H[i, j] = max(0, H[i - 1, j - 1] + score, H[i - 1, j] + gap, H[i, j - 1] + gap)
+    return int(H.max())
+
+
+def path_score(path, tokens_a, tokens_b, match=1, mismatch=-1, gap=-1):
+    score = 0
+    for i, j in path:
+        if i < 0 or j < 0:
+            score += gap
+        else:
+            score += match if tokens_a[i] == tokens_b[j] else mismatch
+    return score
+
+
+def banded_alignment(tokens_a, tokens_b, band, anchors=None):
+    H, lo = fill_banded_matrix(tokens_a, tokens_b, band, anchors=anchors)
+    return traceback_alignment(H, lo, tokens_a, tokens_b)
+
+
+def noisy_copy(rng, tokens, vocab_size, noise=0.1):
+    """Copy of tokens with substituted, deleted and inserted words."""
+    copy = []
+    for token in tokens:
+        r = rng.random()
+        if r < noise / 3:
+            copy.append(rng.integers(0, vocab_size))
+        elif r < 2 * noise / 3:
+            continue
+        elif r < noise:
+            copy.extend([token, rng.integers(0, vocab_size)])
+        else:
+            copy.append(token)
+    return np.array(copy, dtype=np.int64)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_wide_band_matches_full_dp(seed):
+    rng = np.random.default_rng(seed)
+    vocab_size = int(rng.choice([3, 20, 500]))
+    tokens_a = rng.integers(0, vocab_size, rng.integers(1, 40))
+    tokens_b = rng.integers(0, vocab_size, rng.integers(1, 40))
+
+    score, path, band_exceeded = banded_alignment(tokens_a, tokens_b, band=len(tokens_a) + len(tokens_b))
+    assert score == full_alignment_score(tokens_a, tokens_b)
+    assert path_score(path, tokens_a, tokens_b) == score
+    assert not band_exceeded
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_anchored_band_follows_drift_larger_than_band(seed):
+    rng = np.random.default_rng(seed)
+    vocab_size = 2000
+    speech = rng.integers(0, vocab_size, 150)
+    # The speech starts 200 words into the debate and words are inserted/deleted, the drift
+    # from the diagonal is far larger than the band
+    debate = np.concatenate(
+        [rng.integers(0, vocab_size, 200), noisy_copy(rng, speech, vocab_size), rng.integers(0, vocab_size, 300)]
+    )
+
+    anchors = get_seed_anchors(speech, debate)
+    score, path, band_exceeded = banded_alignment(speech, debate, band=10, anchors=anchors)
+    assert score == full_alignment_score(speech, debate)
+    assert path_score(path, speech, debate) == score
+    assert not band_exceeded
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_band_without_shared_kgrams(seed):
+    rng = np.random.default_rng(seed)
+    # Every fourth word differs, so no 4-gram is shared and the band follows the diagonal
+    tokens_a = rng.integers(0, 1000, 90)
+    tokens_b = tokens_a.copy()
+    tokens_b[::4] += 1000
+    tokens_b = np.concatenate([rng.integers(2000, 3000, 40), tokens_b, rng.integers(2000, 3000, 40)])
+    anchors = get_seed_anchors(tokens_a, tokens_b)
+    assert len(anchors[0]) == 0
+
+    score, path, band_exceeded = banded_alignment(tokens_a, tokens_b, band=5, anchors=anchors)
+    full_score = full_alignment_score(tokens_a, tokens_b)
+    assert score < full_score
+    assert path_score(path, tokens_a, tokens_b) == score
+    # The copy crosses the diagonal, so the alignment leaves the band, which is reported
+    assert band_exceeded
+
+    score, _, band_exceeded = banded_alignment(tokens_a, tokens_b, band=60)
+    assert score == full_score
+    assert not band_exceeded
+
+
+def test_seed_anchors_longest_increasing_chain():
+    block_a, block_b, block_c = np.arange(0, 10), np.arange(100, 110), np.arange(200, 230)
+    # Blocks A and C are in the same order in both sequences, the short block B is moved
+    tokens_a = np.concatenate([block_a, block_b, block_c])
+    tokens_b = np.concatenate([block_a, block_c, block_b])
+
+    anchors_a, anchors_b = get_seed_anchors(tokens_a, tokens_b, k=4)
+    assert np.all(np.diff(anchors_a) > 0) and np.all(np.diff(anchors_b) > 0)
+    expected_a = np.concatenate([np.arange(0, 7), np.arange(20, 47)])
+    np.testing.assert_array_equal(anchors_a, expected_a)
+    np.testing.assert_array_equal(anchors_b, np.concatenate([np.arange(0, 7), np.arange(10, 37)]))
+
+    # Repeated k-grams are not anchors
+    repeated = np.array([1, 2, 3, 4] * 3)
+    assert len(get_seed_anchors(repeated, repeated)[0]) == 0
+    assert len(get_seed_anchors(repeated[:3], repeated)[0]) == 0
+
+
+def test_align_words():
+    text_a = "herr talman jag yrkar bifall till motionen och avslag på propositionen"
+    text_b = "tack fru talman jag yrkar bifall till motion och avslag på propositionen tack"
+
+    result = align_words(text_a, text_b, min_score=5)
+    assert (result["start_a"], result["end_a"]) == (1, 11)
+    assert (result["start_b"], result["end_b"]) == (2, 12)
+    assert result["score"] == 8
+    assert result["agreement"] == pytest.approx(9 / 10)
+    assert result["matches_a"].sum() == result["matches_b"].sum() == 9
+    assert not result["band_exceeded"]
+
+    assert align_words(text_a, text_b, min_score=9) is None
+    assert align_words(text_a, None) is None
+    assert align_words("", text_b) is None
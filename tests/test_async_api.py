@@ -0,0 +1,510 @@
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import src.async_api as async_api
+from src.async_api import (
+    MANIFEST_NAME,
+    DownloadManifest,
+    RequestError,
+    RiksdagenClient,
+    fetch_audio_files,
+    parse_content_range,
+)
+from src.cache import ResponseCache
+from src.rate_limit import AdaptiveRateLimiter
+
+AUDIO = bytes(range(256)) * 4000
+
+SPEECH_METADATA = {"videodata": [{"dokid": "H0C120230101", "streams": {"files": []}, "speakers": [{"number": 1}]}]}
+
+
+def fast_client(**kwargs):
+    """
+    Client without noticeable backoff or rate limiting, for tests that aren't about them.
+    """
+    kwargs.setdefault("backoff_factor", 0.001)
+    kwargs.setdefault("rate_limiter", AdaptiveRateLimiter(rate=1000))
+    return RiksdagenClient(**kwargs)
+
+
+def set_vodapi_url(monkeypatch, server):
+    # yarl drops a trailing "?", so it's added after building the URL
+    monkeypatch.setattr(async_api, "VODAPI_URL", str(server.make_url("/api/mhs-vodapi")) + "?")
+
+
+@asynccontextmanager
+async def serve(routes):
+    """
+    Local stand-in for riksdagen's servers. routes maps paths to aiohttp handlers.
+    """
+
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        yield server
+    finally:
+        await server.close()
+
+
+class AudioServer:
+    """
+    Serves AUDIO at /audio/{name} with support for Range requests. Files named cut*
+    break off the connection after cut_at bytes on the first request, files named
+    norange* ignore the Range header.
+    """
+
+    def __init__(self, cut_at=300000):
+        self.cut_at = cut_at
+        self.requests = []
+
+    async def handle(self, request):
+        name = request.match_info["name"]
+        range_header = request.headers.get("Range")
+        self.requests.append((name, range_header))
+
+        start = 0
+        if range_header is not None and not name.startswith("norange"):
+            start = int(range_header[len("bytes=") : -1])
+        if start >= len(AUDIO):
+            return web.Response(status=416, headers={"Content-Range": f"bytes */{len(AUDIO)}"})
+
+        body = AUDIO[start:]
+        headers = {"Content-Length": str(len(body))}
+        status = 200
+        if start > 0:
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{len(AUDIO) - 1}/{len(AUDIO)}"
+
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        if name.startswith("cut") and len([r for r in self.requests if r[0] == name]) == 1:
+            await response.write(body[: self.cut_at])
+            request.transport.close()
+            return response
+        await response.write(body)
+        await response.write_eof()
+        return response
+
+
+def test_parse_content_range():
+    assert parse_content_range({"Content-Range": "bytes 100-199/1000"}) == (100, 1000)
+    assert parse_content_range({"Content-Range": "bytes */1000"}) == (None, 1000)
+    assert parse_content_range({"Content-Range": "bytes 0-99/*"}) == (0, None)
+    assert parse_content_range({}) == (None, None)
+    assert parse_content_range({"Content-Range": "items 0-9/10"}) == (None, None)
+
+
+def test_backoff_has_jitter_and_respects_retry_after():
+    client = RiksdagenClient(backoff_factor=0.5, max_backoff=4)
+    backoffs = [client.get_backoff(3) for _ in range(200)]
+    assert all(0 <= backoff <= 4 for backoff in backoffs)
+    assert len(set(backoffs)) > 100
+    assert all(0 <= client.get_backoff(0) <= 0.5 for _ in range(100))
+    assert all(client.get_backoff(0, retry_after=2) >= 2 for _ in range(100))
+    assert client.get_backoff(10, retry_after=100) <= 4
+
+    assert RiksdagenClient.parse_retry_after({"Retry-After": "3"}) == 3
+    assert RiksdagenClient.parse_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) is None
+    assert RiksdagenClient.parse_retry_after({}) is None
+
+
+def test_retries_5xx_and_429(monkeypatch):
+    calls = {}
+
+    async def vodapi(request):
+        rel_dok_id = request.query_string
+        calls[rel_dok_id] = calls.get(rel_dok_id, 0) + 1
+        if rel_dok_id == "missing":
+            return web.Response(status=404)
+        if rel_dok_id == "broken":
+            return web.Response(status=500)
+        if calls[rel_dok_id] == 1:
+            return web.Response(status=503)
+        if calls[rel_dok_id] == 2:
+            return web.Response(status=429, headers={"Retry-After": "0.05"})
+        return web.json_response(SPEECH_METADATA)
+
+    async def run():
+        async with serve({"/api/mhs-vodapi": vodapi}) as server:
+            set_vodapi_url(monkeypatch, server)
+            async with fast_client(max_retries=3) as client:
+                assert await client.get_audio_metadata("flaky") == SPEECH_METADATA
+                assert await client.get_audio_metadata("missing") is None
+                with pytest.raises(RequestError) as error:
+                    await client.get_audio_metadata("broken")
+                assert error.value.status == 500
+
+    asyncio.run(run())
+    # 503 and 429 are retried, 404 isn't, 500 is retried max_retries times
+    assert calls == {"flaky": 3, "missing": 1, "broken": 4}
+
+
+def test_fetch_audio_metadata_keeps_failures_separate(monkeypatch):
+    async def vodapi(request):
+        if request.query_string == "broken":
+            return web.Response(status=502)
+        if request.query_string == "nomedia":
+            return web.json_response({"videodata": [{"streams": None, "speakers": []}]})
+        return web.json_response(SPEECH_METADATA)
+
+    async def run():
+        async with serve({"/api/mhs-vodapi": vodapi}) as server:
+            set_vodapi_url(monkeypatch, server)
+            async with fast_client(max_retries=1) as client:
+                return await async_api.gather_with_progress(
+                    [client.get_audio_metadata(rel_dok_id) for rel_dok_id in ["a", "broken", "nomedia", "b"]]
+                )
+
+    results = asyncio.run(run())
+    assert results[0] == results[3] == SPEECH_METADATA
+    assert isinstance(results[1], RequestError)
+    assert results[2] is None
+
+
+def test_download_resumes_with_range(tmp_path):
+    audio_server = AudioServer()
+
+    async def run():
+        async with serve({"/audio/{name}": audio_server.handle}) as server:
+            async with fast_client() as client:
+                return await client.get_audio_file(str(server.make_url("/audio/cut.mp3")), folder=str(tmp_path))
+
+    path = asyncio.run(run())
+    assert open(path, "rb").read() == AUDIO
+    assert not os.path.exists(f"{path}.part")
+    # The retry continues where the broken off response ended
+    assert audio_server.requests == [("cut.mp3", None), ("cut.mp3", f"bytes={audio_server.cut_at}-")]
+
+
+def test_download_resumes_part_file_from_earlier_run(tmp_path):
+    audio_server = AudioServer()
+    (tmp_path / "a.mp3.part").write_bytes(AUDIO[:12345])
+    (tmp_path / "norange.mp3.part").write_bytes(AUDIO[:12345])
+
+    async def run():
+        async with serve({"/audio/{name}": audio_server.handle}) as server:
+            async with fast_client() as client:
+                return [
+                    await client.get_audio_file(str(server.make_url(f"/audio/{name}")), folder=str(tmp_path))
+                    for name in ["a.mp3", "norange.mp3"]
+                ]
+
+    paths = asyncio.run(run())
+    assert [open(path, "rb").read() == AUDIO for path in paths] == [True, True]
+    # A server that ignores the Range header sends the whole file, which replaces the part file
+    assert audio_server.requests == [("a.mp3", "bytes=12345-"), ("norange.mp3", "bytes=12345-")]
+
+
+def test_download_failure_keeps_no_file(tmp_path):
+    async def missing(request):
+        return web.Response(status=404)
+
+    async def run():
+        async with serve({"/audio/{name}": missing}) as server:
+            async with fast_client() as client:
+                return await client.get_audio_file(str(server.make_url("/audio/a.mp3")), folder=str(tmp_path))
+
+    assert asyncio.run(run()) is None
+    assert sorted(os.listdir(tmp_path)) == []
+
+
+def test_manifest_skips_completed_files(tmp_path):
+    audio_server = AudioServer()
+    names = ["a.mp3", "b.mp3", "cut.mp3"]
+
+    async def run():
+        async with serve({"/audio/{name}": audio_server.handle}) as server:
+            urls = [str(server.make_url(f"/audio/{name}")) for name in names]
+            async with fast_client() as client:
+                first = [await client.get_audio_file(url, folder=str(tmp_path)) for url in urls]
+            audio_server.requests.clear()
+            async with fast_client() as client:
+                second = [await client.get_audio_file(url, folder=str(tmp_path)) for url in urls]
+            return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    # Completed downloads are in the manifest and aren't requested again
+    assert audio_server.requests == []
+    manifest = DownloadManifest(str(tmp_path))
+    assert sorted(manifest.entries) == names
+    assert all(manifest.entries[name]["size"] == len(AUDIO) for name in names)
+    assert all(manifest.is_complete(path) for path in first)
+
+
+def test_manifest_does_not_trust_unrecorded_or_changed_files(tmp_path):
+    audio_server = AudioServer()
+    # Complete and truncated files from before the manifest, and a recorded file that was truncated later
+    (tmp_path / "complete.mp3").write_bytes(AUDIO)
+    (tmp_path / "truncated.mp3").write_bytes(AUDIO[:1000])
+    (tmp_path / "changed.mp3").write_bytes(AUDIO[:2000])
+    DownloadManifest(str(tmp_path)).add(str(tmp_path / "changed.mp3"), "url")
+    (tmp_path / "changed.mp3").write_bytes(AUDIO[:1000])
+    # A line cut off by an interrupted write is skipped
+    with open(tmp_path / MANIFEST_NAME, "a") as f:
+        f.write('{"filename": "trunc')
+
+    async def run():
+        async with serve({"/audio/{name}": audio_server.handle}) as server:
+            async with fast_client() as client:
+                return [
+                    await client.get_audio_file(str(server.make_url(f"/audio/{name}")), folder=str(tmp_path))
+                    for name in ["complete.mp3", "truncated.mp3", "changed.mp3"]
+                ]
+
+    paths = asyncio.run(run())
+    assert [open(path, "rb").read() == AUDIO for path in paths] == [True, True, True]
+    # Unrecorded files are resumed: a complete one costs one request answered with 416
+    assert audio_server.requests == [
+        ("complete.mp3", f"bytes={len(AUDIO)}-"),
+        ("truncated.mp3", "bytes=1000-"),
+        ("changed.mp3", "bytes=1000-"),
+    ]
+    assert all(DownloadManifest(str(tmp_path)).is_complete(path) for path in paths)
+
+
+def test_failed_check_keeps_unrecorded_files(tmp_path):
+    audio_server = AudioServer()
+    (tmp_path / "a.mp3").write_bytes(AUDIO)
+    (tmp_path / "b.mp3").write_bytes(AUDIO[:1000])
+    (tmp_path / "norange.mp3").write_bytes(AUDIO)
+
+    async def broken(request):
+        return web.Response(status=500)
+
+    async def run(handle):
+        async with serve({"/audio/{name}": handle}) as server:
+            async with fast_client(max_retries=1) as client:
+                coroutines = [
+                    client.get_audio_file(str(server.make_url(f"/audio/{name}")), folder=str(tmp_path))
+                    for name in ["a.mp3", "b.mp3", "norange.mp3"]
+                ]
+                return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    # Files from earlier runs stay where they are when the server fails
+    assert all(isinstance(result, RequestError) for result in asyncio.run(run(broken)))
+    assert sorted(os.listdir(tmp_path)) == ["a.mp3", "b.mp3", "norange.mp3"]
+    assert (tmp_path / "b.mp3").read_bytes() == AUDIO[:1000]
+
+    # A server ignoring the Range header confirms a complete file by its Content-Length
+    paths = asyncio.run(run(audio_server.handle))
+    assert [open(path, "rb").read() == AUDIO for path in paths] == [True, True, True]
+    assert not any(name.endswith(".part") for name in os.listdir(tmp_path))
+
+
+def test_fetch_audio_files(tmp_path):
+    audio_server = AudioServer()
+
+    async def start():
+        server = TestServer(web.Application())
+        server.app.router.add_get("/audio/{name}", audio_server.handle)
+        await server.start_server()
+        return server
+
+    # fetch_audio_files runs its own event loop, so the server runs in a thread with another loop
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        urls = [str(server.make_url(f"/audio/{name}.mp3")) for name in ["a", "b", "cut"]]
+        paths = fetch_audio_files(urls, folder=str(tmp_path), concurrency=2, backoff_factor=0.001)
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    assert [os.path.basename(path) for path in paths] == ["a.mp3", "b.mp3", "cut.mp3"]
+    assert all(open(path, "rb").read() == AUDIO for path in paths)
+
+
+def test_response_cache_modes(monkeypatch, tmp_path):
+    version = {"value": 1}
+    requests = []
+
+    async def vodapi(request):
+        requests.append((request.query_string, request.headers.get("If-None-Match")))
+        etag = f'"{request.query_string}-{version["value"]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        body = {**SPEECH_METADATA, "version": version["value"]}
+        return web.json_response(body, headers={"ETag": etag})
+
+    async def fetch(mode, rel_dok_ids):
+        async with serve({"/api/mhs-vodapi": vodapi}) as server:
+            set_vodapi_url(monkeypatch, server)
+            async with fast_client(cache=ResponseCache(str(tmp_path)), cache_mode=mode) as client:
+                return [await client.get_audio_metadata(rel_dok_id) for rel_dok_id in rel_dok_ids]
+
+    results = asyncio.run(fetch("use", ["a", "b"]))
+    assert [result["version"] for result in results] == [1, 1]
+    assert requests == [("a", None), ("b", None)]
+
+    # Cached responses are used without requests
+    requests.clear()
+    version["value"] = 2
+    assert asyncio.run(fetch("use", ["a", "b"])) == results
+    assert requests == []
+
+    # Offline mode replays the cache and never makes requests
+    results = asyncio.run(fetch("offline", ["a", "b", "c"]))
+    assert [result["version"] for result in results[:2]] == [1, 1]
+    assert results[2] is None
+    assert requests == []
+
+    # Revalidation sends the ETag and downloads changed responses
+    results = asyncio.run(fetch("revalidate", ["a"]))
+    assert results[0]["version"] == 2
+    assert requests == [("a", '"a-1"')]
+    requests.clear()
+    results = asyncio.run(fetch("revalidate", ["a"]))
+    assert results[0]["version"] == 2
+    assert requests == [("a", '"a-2"')]
+
+    # One stored body per distinct response, and the index keeps every version
+    cache = ResponseCache(str(tmp_path))
+    assert len(cache) == 2
+    assert len(open(tmp_path / "index.jsonl").read().splitlines()) == 3
+
+    with pytest.raises(ValueError):
+        RiksdagenClient(cache_mode="offline")
+
+
+def test_response_cache_replaces_corrupt_bodies(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("a", b'{"videodata": []}', headers={"ETag": '"1"'}, url="url")
+    assert cache.get_validators("a") == {"If-None-Match": '"1"'}
+
+    path = cache.get_object_path(cache.entries["a"]["sha256"])
+    with open(path, "wb") as f:
+        f.write(b"not gzip")
+    assert ResponseCache(str(tmp_path)).read("a") is None
+    assert not os.path.exists(path)
+
+    cache.put("a", b'{"videodata": []}', headers={"ETag": '"1"'}, url="url")
+    assert ResponseCache(str(tmp_path)).read("a") == b'{"videodata": []}'
+
+
+def test_response_cache_refetches_undecodable_bodies(monkeypatch, tmp_path):
+    error_page = {"value": True}
+    requests = []
+
+    async def vodapi(request):
+        requests.append(request.query_string)
+        if error_page["value"]:
+            return web.Response(status=200, text="<html>Service Unavailable</html>", content_type="text/html")
+        return web.json_response(SPEECH_METADATA)
+
+    async def fetch(mode):
+        async with serve({"/api/mhs-vodapi": vodapi}) as server:
+            set_vodapi_url(monkeypatch, server)
+            async with fast_client(cache=ResponseCache(str(tmp_path)), cache_mode=mode) as client:
+                return await client.get_audio_metadata("a")
+
+    # Error pages aren't stored
+    assert asyncio.run(fetch("use")) is None
+    assert len(ResponseCache(str(tmp_path))) == 0
+
+    # An error page cached before is removed from the cache and downloaded again, except offline
+    ResponseCache(str(tmp_path)).put("a", b"<html>Service Unavailable</html>")
+    error_page["value"] = False
+    requests.clear()
+    assert asyncio.run(fetch("offline")) is None
+    assert requests == []
+    assert asyncio.run(fetch("use")) == SPEECH_METADATA
+    assert requests == ["a"]
+    assert asyncio.run(fetch("use")) == SPEECH_METADATA
+    assert requests == ["a"]
+
+    cache = ResponseCache(str(tmp_path))
+    cache.remove("a")
+    assert "a" not in ResponseCache(str(tmp_path))
+
+
+def test_rate_limiter_slows_down_on_rejections(monkeypatch):
+    statuses = iter([429, 429, 503] + [200] * 100)
+
+    async def vodapi(request):
+        status = next(statuses)
+        if status != 200:
+            return web.Response(status=status)
+        return web.json_response(SPEECH_METADATA)
+
+    async def run():
+        async with serve({"/api/mhs-vodapi": vodapi}) as server:
+            set_vodapi_url(monkeypatch, server)
+            rate_limiter = AdaptiveRateLimiter(rate=100)
+            async with fast_client(max_retries=5, rate_limiter=rate_limiter) as client:
+                results = await asyncio.gather(*[client.get_audio_metadata(str(i)) for i in range(10)])
+            return results, rate_limiter
+
+    results, rate_limiter = asyncio.run(run())
+    assert all(result == SPEECH_METADATA for result in results)
+    assert rate_limiter.rate < 100
+    assert not rate_limiter.slow_start
+    assert rate_limiter.rejection_rate() == pytest.approx(3 / 13)
+    assert rate_limiter.get_stats()["rejected"] == pytest.approx(3 / 13, abs=0.001)
+
+
+def test_rate_limiter_aimd():
+    rate_limiter = AdaptiveRateLimiter(rate=10, min_rate=1, increase=2)
+    sent_at = asyncio.run(rate_limiter.acquire())
+
+    # Rejections of requests sent before the last decrease don't lower the rate again
+    rate_limiter.record(429, sent_at)
+    assert rate_limiter.rate == 5
+    rate_limiter.record(429, sent_at)
+    rate_limiter.record(503, sent_at, retry_after=1)
+    assert rate_limiter.rate == 5
+    assert rate_limiter.paused_until > rate_limiter.last_decrease
+
+    # Later requests lower it down to min_rate
+    for _ in range(5):
+        rate_limiter.record(429, rate_limiter.last_decrease + 1e-9)
+    assert rate_limiter.rate == 1
+
+    # Additive increase of increase / rate per success, capped at twice the throughput
+    rate_limiter.started -= 60
+    rate = rate_limiter.rate
+    rate_limiter.record(200, sent_at)
+    assert rate_limiter.rate == rate
+    for _ in range(200):
+        rate_limiter.record(200, sent_at)
+    assert 1 < rate_limiter.rate <= 2 * rate_limiter.throughput()
+    assert rate_limiter.rejection_rate() == pytest.approx(8 / 209)
+
+    # Failed requests without a response are not counted
+    rate_limiter.record(None, sent_at)
+    assert rate_limiter.rejection_rate() == pytest.approx(8 / 209)
+
+    # Nor are temporary server errors, they neither raise the rate nor the throughput
+    rate, throughput = rate_limiter.rate, rate_limiter.throughput()
+    for status in [500, 502, 504, 408] * 50:
+        rate_limiter.record(status, sent_at)
+    assert rate_limiter.rate == rate
+    assert rate_limiter.throughput() == pytest.approx(throughput, rel=1e-3)
+    assert rate_limiter.rejection_rate() == pytest.approx(8 / 209)
+
+
+def test_rate_limiter_paces_requests():
+    async def run():
+        rate_limiter = AdaptiveRateLimiter(rate=50, burst=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(11):
+            await rate_limiter.acquire()
+        return loop.time() - start
+
+    # 11 tokens at 50 per second, the first one is in the bucket from the start
+    assert asyncio.run(run()) == pytest.approx(0.2, abs=0.05)
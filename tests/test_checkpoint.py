@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from src.checkpoint import completed_dokids, merge_checkpoints, read_checkpoints, run_checkpointed
+
+
+def process_debates(df_batch):
+    return df_batch.assign(nr_words=df_batch["text"].str.split().str.len())
+
+
+def test_merge_checkpoints_of_run(tmp_path):
+    df = pd.DataFrame(
+        {
+            "dokid": ["A", "A", "B", "C", "D", "D"],
+            "debatedate": ["2003-01-01", "2003-01-01", "2005-01-01", "2010-01-01", "2015-01-01", "2015-01-01"],
+            "text": ["herr talman", "tack", "jag yrkar bifall", "fru talman", "ja", "nej tack"],
+        }
+    )
+    checkpoint_dir = str(tmp_path)
+
+    # Earlier run with --max_date 2008-01-01, then a run of 2004-2016 that resumes its debates
+    df_early = df[df["debatedate"] < "2008-01-01"]
+    run_checkpointed(df_early, process_debates, checkpoint_dir, "stage", batch_size=2)
+    df_run = df[df["debatedate"] >= "2004-01-01"]
+    run_checkpointed(df_run, process_debates, checkpoint_dir, "stage", batch_size=2)
+    assert completed_dokids(checkpoint_dir, "stage") == {"A", "B", "C", "D"}
+
+    # Debate A of the earlier run is in the same part as B, but not in the merged results of this run
+    output_path = tmp_path / "merged.parquet"
+    df_merged = merge_checkpoints(checkpoint_dir, "stage", str(output_path), dokids=df_run["dokid"].unique())
+    assert sorted(df_merged["dokid"]) == ["B", "C", "D", "D"]
+    assert df_merged.sort_values(["dokid", "text"])["nr_words"].tolist() == [3, 2, 1, 2]
+    pd.testing.assert_frame_equal(pd.read_parquet(output_path), df_merged)
+
+    assert len(merge_checkpoints(checkpoint_dir, "stage")) == len(df)
+    df_texts = read_checkpoints(checkpoint_dir, "stage", columns=["text"], dokids=["D"])
+    assert df_texts.columns.tolist() == ["text"]
+    assert df_texts["text"].tolist() == ["ja", "nej tack"]
+    assert read_checkpoints(checkpoint_dir, "stage", dokids=["E"]).empty
+
+
+def test_manifest_cut_off_line(tmp_path):
+    checkpoint_dir = str(tmp_path)
+    df = pd.DataFrame({"dokid": ["A", "B", "C"], "text": ["ja", "nej", "kanske"]})
+    run_checkpointed(df[df["dokid"] == "A"], process_debates, checkpoint_dir, "stage")
+    run_checkpointed(df[df["dokid"] == "B"], process_debates, checkpoint_dir, "stage")
+
+    # A crash while appending the entry of B cuts its line off in the middle
+    manifest_path = tmp_path / "manifest.jsonl"
+    lines = manifest_path.read_text(encoding="utf-8").splitlines(keepends=True)
+    manifest_path.write_text(lines[0] + lines[1][: len(lines[1]) // 2], encoding="utf-8")
+    assert completed_dokids(checkpoint_dir, "stage") == {"A"}
+
+    # The rerun redoes B, and neither its entry nor the one of C is lost in the cut off line
+    run_checkpointed(df, process_debates, checkpoint_dir, "stage")
+    assert completed_dokids(checkpoint_dir, "stage") == {"A", "B", "C"}
+    assert sorted(merge_checkpoints(checkpoint_dir, "stage")["dokid"]) == ["A", "B", "C"]
+
+
+def test_merge_checkpoints_without_results(tmp_path):
+    checkpoint_dir = str(tmp_path)
+    df = pd.DataFrame({"dokid": ["A", "B"], "text": ["ja", "nej"]})
+
+    # No debates in the date range, or none of them returned results
+    run_checkpointed(df[:0], process_debates, checkpoint_dir, "stage")
+    run_checkpointed(df, lambda df_batch: None, checkpoint_dir, "empty")
+    for stage in ["stage", "empty"]:
+        with pytest.raises(ValueError, match=stage):
+            merge_checkpoints(checkpoint_dir, stage, dokids=["A"])
+    assert read_checkpoints(checkpoint_dir, "empty", columns=["text"]).columns.tolist() == ["text"]
+
+    # Debates without results of a stage that has results keep its columns
+    run_checkpointed(df[df["dokid"] == "A"], process_debates, checkpoint_dir, "stage")
+    output_path = tmp_path / "merged.parquet"
+    df_merged = merge_checkpoints(checkpoint_dir, "stage", str(output_path), dokids=["B"])
+    assert df_merged.empty
+    assert df_merged.columns.tolist() == ["dokid", "text", "nr_words"]
+    assert pd.read_parquet(output_path).columns.tolist() == ["dokid", "text", "nr_words"]
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from src.corpus import TokenizedCorpus
+
+
+def test_stages_share_saved_corpus(tmp_path):
+    folder = str(tmp_path / "corpus")
+    assert len(TokenizedCorpus.load(folder, missing_ok=True)) == 0
+    with pytest.raises(FileNotFoundError):
+        TokenizedCorpus.load(folder)
+
+    # First stage
+    corpus = TokenizedCorpus.load(folder, missing_ok=True)
+    assert corpus.add_texts(["herr talman jag yrkar bifall", None, float("nan")])[1:] == [None, None]
+    corpus.save(folder)
+
+    # Later stage extends the corpus of the first one
+    corpus = TokenizedCorpus.load(folder)
+    assert "herr talman jag yrkar bifall" in corpus
+    corpus.add_texts(["fru  talman jag yrkar avslag", "herr talman jag yrkar bifall"])
+    assert len(corpus) == 2
+    corpus.save(folder)
+
+    loaded = TokenizedCorpus.load(folder)
+    assert len(loaded) == 2
+    assert loaded.words == corpus.words
+    for text in ["herr talman jag yrkar bifall", "fru  talman jag yrkar avslag"]:
+        assert loaded.get_tokens(text) == text.split()
+        np.testing.assert_array_equal(loaded.get_token_ids(text), corpus.get_token_ids(text))
+        np.testing.assert_array_equal(loaded.get_word_spans(text), corpus.get_word_spans(text))
+    assert len(loaded) == 2
+
+
+def test_subset_keeps_only_given_texts():
+    corpus = TokenizedCorpus.from_texts(["herr talman jag yrkar bifall", "fru talman jag yrkar avslag"])
+    subset = corpus.subset(["fru talman  jag yrkar avslag", "fru talman jag yrkar avslag", None])
+
+    assert len(subset) == 2
+    assert "herr talman jag yrkar bifall" not in subset
+    assert sorted(subset.words) == ["avslag", "fru", "jag", "talman", "yrkar"]
+    for text in ["fru talman  jag yrkar avslag", "fru talman jag yrkar avslag"]:
+        assert subset.get_tokens(text) == text.split()
+        np.testing.assert_array_equal(subset.get_word_spans(text), corpus.get_word_spans(text))
+    assert len(subset) == 2
+    assert len(TokenizedCorpus().subset([None])) == 0
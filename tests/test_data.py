@@ -0,0 +1,211 @@
+import random
+import re
+import string
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+from num2words import num2words
+
+from src.data import (
+    AUDIO_METADATA_COLUMNS,
+    END_OF_SPEECH_PATTERNS,
+    LOWERCASE_FIXES,
+    TextCleaner,
+    TextNormalizer,
+    audio_metadata_to_arrow,
+    normalize_text,
+)
+
+
+def reference_normalize_text(df, column_in, column_out):
+    """
+    normalize_text() before the steps were fused into TextNormalizer.
+    """
+
+    df[column_out] = df[column_in].apply(
+        lambda x: None if x is None else x.translate(str.maketrans("", "", string.punctuation))
+    )
+    df[column_out] = df[column_out].str.lower()
+    df[column_out] = df[column_out].str.normalize("NFKC")
+    df[column_out] = df[column_out].str.replace(r"(?<=\w)-(?=\w)", " ", regex=True)
+    df[column_out] = df[column_out].str.replace(" +", " ", regex=True)
+    df[column_out] = df[column_out].str.replace(r"(?<=\d) (?=\d)", "", regex=True)
+    df[column_out] = df[column_out].apply(
+        lambda x: None if x is None else re.sub(r"\d+", lambda m: num2words(int(m.group(0)), lang="sv"), x)
+    )
+    return df
+
+
+TEXTS = [
+    # Numbers
+    "Det gäller proposition 2019/20:123 och 1 000 000 kronor.",
+    "Mellan 2 och 3 procent, alltså 2-3 procent, år 1995.",
+    "Paragraf § 12 i kapitel 3, 07:00 till 17.30.",
+    "Vi har 0 förslag och 42 motioner, 10 000 och 5 5 5.",
+    # Abbreviations
+    "Det gäller t.ex. skatter, bl.a. på bensin, s.k. miljöskatter m.m.",
+    "Enl. SFS 2010:800 o.s.v. och dvs. i prop. 2021/22:1.",
+    # Casing
+    "Herr TALMAN! Jag yrkar BIFALL till Reservation 3.",
+    "ÅÄÖ åäö Éric Müller ÆØ",
+    # Punctuation and unicode
+    "”Citat” – tankstreck — «guillemets» och ’apostrofer’…",
+    "Kaffe-\xa0och  te-paus;   ett (två) [tre] {fyra}?!",
+    "ﬁnansiering ½ ² m³ ｆｕｌｌｗｉｄｔｈ",
+    "EU-kommissionen och FN-stadgan, Nato-medlemskap.",
+    # Already normalized (wav2vec2 transcripts)
+    "herr talman jag yrkar bifall till reservationen",
+    "herr talman  jag yrkar   bifall",
+    "",
+    " ",
+]
+
+
+def test_normalizer_matches_step_by_step_pipeline():
+    expected = reference_normalize_text(pd.DataFrame({"text": TEXTS}), "text", "normalized")["normalized"]
+    result = normalize_text(pd.DataFrame({"text": TEXTS}), "text", "normalized")["normalized"]
+    assert result.tolist() == expected.tolist()
+
+
+def test_normalizer_missing_values():
+    df = pd.DataFrame({"text": ["Herr talman!", None, float("nan")]}, dtype=object)
+    normalized = normalize_text(df, "text", "normalized")["normalized"]
+    assert normalized[0] == "herr talman"
+    assert normalized.isna().tolist() == [False, True, True]
+
+
+def test_normalizer_parallel_chunks():
+    texts = TEXTS * 5
+    expected = TextNormalizer().normalize_texts(texts)
+    result = normalize_text(pd.DataFrame({"text": texts}), "text", "normalized", processes=2, chunk_size=7)
+    assert result["normalized"].tolist() == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Herr talman", "herr talman"),
+        ("herr talman", "herr talman"),
+        ("Övrigt: 3 st.", "övrigt tre st"),
+        ("TEXT", "text"),
+    ],
+)
+def test_normalize(text, expected):
+    assert TextNormalizer().normalize(text) == expected
+
+
+def test_lowercase_fixes():
+    # Special casing characters are lowercased with the fixed mapping, whatever pandas does
+    normalizer = TextNormalizer()
+    assert LOWERCASE_FIXES == {"İ": "i", "Σ": "σ"}
+    assert normalizer.normalize("İSTANBUL") == "istanbul"
+    assert normalizer.normalize("ΟΔΥΣΣΕΥΣ ΚΑΙ ΣΩΚΡΑΤΗΣ") == "οδυσσευσ και σωκρατησ"
+    assert normalizer.normalize("Ὀδυσσεύς") == "ὀδυσσεύς"
+
+
+def test_audio_metadata_types():
+    speech_metadata = {
+        "videodata": [
+            {
+                "dokid": "H0C120230101",
+                "debatedate": "1 januari 2023",
+                "debateseconds": 3600,
+                "streams": {"files": [{"audiofileurl": "https://example.com/a.mp3", "duration": 3600}]},
+                "speakers": [
+                    {"number": 1, "start": 12, "duration": 300, "party": "S"},
+                    {"number": "2", "start": 312.5, "duration": "60", "party": None},
+                ],
+            }
+        ]
+    }
+    # Videos without media files or speakers have all speaker fields missing
+    no_speakers = {"videodata": [{"dokid": "H0C220230101", "streams": None, "speakers": []}]}
+
+    expected_schema = pa.schema(
+        [(column, pa.type_for_alias(type_name)) for column, type_name in AUDIO_METADATA_COLUMNS.items()]
+    )
+    table = audio_metadata_to_arrow([speech_metadata])
+    assert table.schema == expected_schema
+    assert audio_metadata_to_arrow([no_speakers]).schema == expected_schema
+    assert audio_metadata_to_arrow([no_speakers], rel_dok_ids=["a"]).schema == expected_schema.append(
+        pa.field("rel_dok_id", pa.string())
+    )
+
+    assert table["number"].to_pylist() == [1, 2]
+    assert table["start"].to_pylist() == [12.0, 312.5]
+    assert table["duration"].to_pylist() == [300.0, 60.0]
+    assert table["party"].to_pylist() == ["S", None]
+
+
+def reference_preprocess_text(texts, headers):
+    """
+    preprocess_text() before TextCleaner: one str.replace() per pattern and header.
+    """
+
+    texts = texts.str.replace(r"(<p> STYLEREF.*?</p>)", "", regex=True)
+    texts = texts.str.replace(r"(<p>Gransknings- STYLEREF.*?</p>)", "", regex=True)
+    texts = texts.str.replace(r"(<p><em></em><em> STYLEREF.*?</p>)", "", regex=True)
+    for header in headers:
+        texts = texts.str.replace(f"<p>{header}</p>", "", regex=False)
+    texts = texts.str.replace(r"<.*?>", " ", regex=True)
+    texts = texts.str.replace(r"\(.*?\)", "", regex=True)
+    for pattern in END_OF_SPEECH_PATTERNS:
+        texts = texts.str.replace(f"({pattern}.*)", "", regex=True)
+    texts = texts.str.strip()
+    texts = texts.str.normalize("NFKC")
+    texts = texts.str.replace(r"(\s){2,}", " ", regex=True)
+    texts = texts.str.replace(r"&amp;", "&", regex=True)
+    return texts
+
+
+# Removing "<p>Bar</p>" creates "<p>Foo</p>", and "Ett <p>två</p> tre" contains a paragraph itself
+HEADERS = ["Bar", "Foo", "Svar på interpellation", "Ett <p>två</p> tre", "a.b (c)"]
+
+CLEANER_TEXTS = [
+    # Headers, also created by removing another header
+    "<p>Herr talman!</p><p>Svar på interpellation</p><p>Jag yrkar bifall.</p>",
+    "<p>Fo<p>Bar</p>o</p> kvar",
+    "<p>Ett <p>två</p> tre</p><p>a.b (c)</p><p>axb (c)</p>",
+    "<p> STYLEREF Kantrubrik \\* MERGEFORMAT Svar</p>Text<p>Gransknings- STYLEREF x</p>",
+    "<p><em></em><em> STYLEREF Rubrik</em></p>Text (applåder) och (skratt",
+    # End of speech patterns, also several and on several lines
+    "Tack. Interpellationsdebatten var härmed avslutad. Talmannen",
+    "Ja. Frågestunden var därmed avslutad\nNästa rad. Den EU-politiska partiledardebatten var härmed avslutad",
+    "Debatten med anledning av vårpropositionens avlämnande var härmed avslutad. I detta anförande instämde X",
+    "Den EU-politiska debatten var härmed avslutad och Överläggningen var |ärmed avslutad",
+    # Control and Unicode whitespace
+    "a \x1c b",
+    "a\x1c\x1db\x85\x85c\xa0\xa0d\u3000\u3000e\u2028\u2029f",
+    "a \t\n b\r\n\r\nc\x0b\x0bd\x0c\x0ce  f",
+    "\x1c\xa0 text med kant \u3000\x85",
+    "ﬁnansiering ½ ² m³ ｆｕｌｌｗｉｄｔｈ &amp;amp; &amp;",
+    "",
+    " \x1c ",
+]
+
+
+def random_speech(rng):
+    pieces = [
+        "herr", "talman", "jag", "<p>", "</p>", "<em>", "(", ")", "Bar", "Foo", "Fo", "o", "<p>Bar</p>",
+        "<p> STYLEREF", "Interpellationsdebatten var härmed avslutad", "I detta anförande instämde",
+        "Frågestunden var därmed avslutad", "&amp;", "ﬁ", "²", "Ｓ", " ", "  ", "\t", "\n", "\r", "\x0b",
+        "\x0c", "\x1c", "\x1f", "\x85", "\xa0", "\u2003", "\u3000", "\u2028",
+    ]
+    return "".join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+
+
+@pytest.mark.parametrize("dtype", ["str", object])
+def test_cleaner_matches_step_by_step_pipeline(dtype):
+    rng = random.Random(0)
+    texts = CLEANER_TEXTS + [random_speech(rng) for _ in range(500)]
+    expected = reference_preprocess_text(pd.Series(texts, dtype=dtype), HEADERS).tolist()
+
+    cleaner = TextCleaner(HEADERS)
+    unicode_whitespace = dtype is object
+    assert [cleaner.clean(text, unicode_whitespace) for text in texts] == expected
+    assert cleaner.clean_arrow(pa.array(texts), unicode_whitespace).to_pylist() == expected
+    for engine in ["python", "pyarrow"]:
+        cleaned = cleaner.clean_column(pd.Series(texts, dtype=dtype), engine=engine, chunk_size=100)
+        assert cleaned.tolist() == expected
+        assert cleaned.dtype == pd.Series(texts, dtype=dtype).dtype
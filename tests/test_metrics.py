@@ -0,0 +1,384 @@
+import itertools
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from nltk.tokenize import TreebankWordTokenizer
+
+from src.corpus import TokenizedCorpus
+from src.metrics import (
+    DebateNgramIndex,
+    MatchPool,
+    batch_bleu,
+    calculate_bleu,
+    contiguous_fuzzy_indices,
+    contiguous_fuzzy_match,
+    contiguous_fuzzy_match_windowed,
+    contiguous_ngram_indices,
+    contiguous_ngram_match,
+    contiguous_ngram_match_batch,
+    get_contiguous_match_indices,
+    get_fuzzy_match_word_indices,
+    get_fuzzy_match_word_indices_batch,
+    get_ngram_hashes,
+    get_weighted_ngram_score,
+    get_weighted_ngram_score_hashed,
+    get_whitespace_word_spans,
+    get_word_ids,
+    match_texts,
+)
+from src.minhash import MinHashSignatures
+from src.utils import SharedTexts, detach_shared_texts
+
+
+def random_text(rng, nr_words, vocab_size):
+    return " ".join(f"w{i}" for i in rng.integers(0, vocab_size, nr_words))
+
+
+def speech_in_debate(rng, nr_words=300, vocab_size=500, noise=0.1):
+    """
+    A speech and a debate transcript that contains a noisy copy of it between other words.
+    """
+
+    speech = rng.integers(0, vocab_size, nr_words)
+    transcript = [rng.integers(0, vocab_size) if rng.random() < noise else word for word in speech]
+    before = rng.integers(0, vocab_size, rng.integers(0, 500))
+    after = rng.integers(0, vocab_size, rng.integers(0, 500))
+    debate = np.concatenate([before, transcript, after]).astype(np.int64)
+    return " ".join(f"w{i}" for i in speech), " ".join(f"w{i}" for i in debate)
+
+
+def reference_match(anftext_normalized, anftext_inference, n=6, threshold=1, min_continuous_match=8, max_gap=30):
+    scores = get_weighted_ngram_score(anftext_normalized, anftext_inference, n)
+    return get_contiguous_match_indices(scores, threshold, min_continuous_match, max_gap)
+
+
+# Pairs (anftext_normalized, anftext_inference) where the original scorer is defined with n=6:
+# anftext_normalized needs at least n - 1 words and anftext_inference at least n + 1 words.
+FIXED_PAIRS = [
+    # Short texts
+    ("herr talman jag yrkar bifall", "fru talman jag yrkar avslag på motionen"),
+    ("det är en bra dag idag", "idag är det en bra dag för riksdagen"),
+    # No overlap at all
+    ("a b c d e f g", "h i j k l m n o p"),
+    # Repeated ngrams in one or both texts
+    ("ja ja ja ja ja ja ja ja", "nej ja ja nej ja ja ja nej ja ja ja ja nej"),
+    ("tack tack herr talman tack tack herr talman", "herr talman tack herr talman tack tack"),
+    # Same words in a different order. Order-insensitive hashes (sums, xor) would collide here.
+    ("a b c d e f", "f e d c b a b c d e f a"),
+    ("x y x y y x x y", "y x y x x y y x y x"),
+]
+
+
+@pytest.mark.parametrize("anftext_normalized, anftext_inference", FIXED_PAIRS)
+def test_hashed_scores_match_reference_fixed(anftext_normalized, anftext_inference):
+    expected = get_weighted_ngram_score(anftext_normalized, anftext_inference, 6)
+    result = get_weighted_ngram_score_hashed(anftext_normalized, anftext_inference, 6)
+    np.testing.assert_allclose(result, expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("n", [2, 4, 6])
+def test_hashed_scores_match_reference_random(seed, n):
+    rng = np.random.default_rng(seed)
+    # Small vocabularies give many repeated ngrams
+    anftext_normalized = random_text(rng, rng.integers(n, 80), 8)
+    anftext_inference = random_text(rng, rng.integers(n, 200), 8)
+    expected = get_weighted_ngram_score(anftext_normalized, anftext_inference, n)
+    result = get_weighted_ngram_score_hashed(anftext_normalized, anftext_inference, n)
+    np.testing.assert_allclose(result, expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_contiguous_ngram_match_regions_match_reference(seed):
+    rng = np.random.default_rng(seed)
+    speech, debate = speech_in_debate(rng)
+    expected = reference_match(speech, debate)
+    assert expected[0] is not None
+    assert contiguous_ngram_match(speech, debate) == expected
+    assert contiguous_ngram_match(speech, debate, threshold=1.3) == reference_match(speech, debate, threshold=1.3)
+
+
+@pytest.mark.parametrize("anftext_normalized, anftext_inference", FIXED_PAIRS)
+def test_contiguous_ngram_match_fixed(anftext_normalized, anftext_inference):
+    expected = reference_match(anftext_normalized, anftext_inference, min_continuous_match=2, max_gap=3)
+    assert contiguous_ngram_match(anftext_normalized, anftext_inference, min_continuous_match=2, max_gap=3) == expected
+
+
+def test_corpus_batch_and_index_match_reference():
+    rng = np.random.default_rng(0)
+    pairs = [speech_in_debate(rng) for _ in range(4)] + FIXED_PAIRS
+    corpus = TokenizedCorpus.from_texts([text for pair in pairs for text in pair])
+
+    expected = [reference_match(speech, debate) for speech, debate in pairs]
+    assert [contiguous_ngram_match(speech, debate, corpus=corpus) for speech, debate in pairs] == expected
+    assert contiguous_ngram_match_batch(*zip(*pairs)) == expected
+    assert contiguous_ngram_match_batch(*zip(*pairs), corpus=corpus) == expected
+    for (speech, debate), match in zip(pairs, expected):
+        assert DebateNgramIndex(debate).contiguous_ngram_match(speech) == match
+        assert DebateNgramIndex(debate, corpus=corpus).locate_speeches([speech, None]) == [match, (None, None)]
+
+
+@pytest.mark.parametrize(
+    "anftext_normalized, anftext_inference",
+    [
+        ("det är en bra dag", "det är en bra dag"),
+        ("herr talman", "herr talman jag"),
+        ("ja", "ja ja"),
+        ("tack så mycket herr talman", "talman"),
+    ],
+)
+def test_short_texts(anftext_normalized, anftext_inference):
+    # The original scorer fails on anftext_normalized shorter than n - 1 words and on
+    # anftext_inference shorter than n + 1 words (the convolution kernel is longer than the
+    # text). The hashed scorer treats words outside the texts as non-matches, so it gives
+    # the scores of the texts padded with (different) words that never match.
+    padding_normalized = " ".join(f"<pad_a{i}>" for i in range(8))
+    padding_inference = " ".join(f"<pad_i{i}>" for i in range(8))
+    expected = get_weighted_ngram_score(
+        f"{anftext_normalized} {padding_normalized}", f"{anftext_inference} {padding_inference}", 6
+    )
+    nr_words = len(anftext_inference.split())
+    result = get_weighted_ngram_score_hashed(anftext_normalized, anftext_inference, 6)
+    assert len(result) == nr_words
+    np.testing.assert_allclose(result, expected[:nr_words])
+    assert contiguous_ngram_match(anftext_normalized, anftext_inference) == (None, None)
+    assert contiguous_ngram_match(None, anftext_inference) == (None, None)
+
+
+def test_ngram_hashes_have_no_collisions():
+    # All 1- to 3-grams over a 40 word vocabulary (64000 3-grams) get distinct hashes
+    word_ids = get_word_ids(" ".join(f"w{i}" for i in range(40)))[0]
+    trigrams = np.array(list(itertools.product(word_ids, repeat=3)), dtype=np.uint64)
+    hashes = get_ngram_hashes(trigrams.ravel(), 3)[2][::3]
+    assert len(np.unique(hashes)) == len(trigrams)
+
+    # Large word ids (e.g. from a big corpus vocabulary) don't collide either
+    word_ids = np.array([1, 2**40, 2**40 + 1, 2**63 - 1, 2**63, 3, 2**40], dtype=np.uint64)
+    bigrams = np.array(list(itertools.permutations(word_ids, 2)), dtype=np.uint64)
+    hashes = get_ngram_hashes(bigrams.ravel(), 2)[1][::2]
+    assert len(np.unique(hashes)) == len(set(map(tuple, bigrams.tolist())))
+
+
+# (reference, hypothesis) pairs for the BLEU scorer
+BLEU_PAIRS = [
+    # Hypotheses shorter than 4 words
+    ("herr talman jag yrkar bifall", "herr talman jag"),
+    ("herr talman jag yrkar bifall", "talman jag"),
+    # hyp_len == 1, with and without a match
+    ("herr talman jag yrkar bifall", "talman"),
+    ("herr talman jag yrkar bifall", "fru"),
+    # No unigram match
+    ("a b c d e f g", "h i j k l m n o p"),
+    # Empty reference or hypothesis
+    ("", "herr talman jag yrkar bifall"),
+    ("herr talman jag yrkar bifall", ""),
+    ("", ""),
+    # Repeated ngrams, clipped by their count in the reference
+    ("ja ja nej ja ja", "ja ja ja ja ja ja ja ja"),
+    ("tack tack herr talman tack tack herr talman", "herr talman tack herr talman tack tack"),
+    # Multiple spaces
+    ("fru  talman jag yrkar   avslag", "fru talman jag yrkar avslag på motionen"),
+]
+
+
+def random_bleu_pairs(seed, nr_pairs=40):
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for _ in range(nr_pairs):
+        ref = random_text(rng, rng.integers(1, 60), 30)
+        words = ref.split()
+        # Noisy copy of the reference, so that there are matches of every ngram size
+        hyp = [str(rng.choice(words)) if rng.random() < 0.2 else word for word in words]
+        hyp = hyp[rng.integers(0, 3) :] + random_text(rng, rng.integers(0, 5), 30).split()
+        pairs.append((ref, " ".join(hyp)))
+    return pairs
+
+
+@pytest.mark.parametrize("use_corpus", [False, True])
+@pytest.mark.parametrize("pairs", [BLEU_PAIRS, random_bleu_pairs(0), random_bleu_pairs(1)])
+def test_batch_bleu_matches_nltk(pairs, use_corpus):
+    refs, hyps = [ref for ref, _ in pairs], [hyp for _, hyp in pairs]
+    corpus = TokenizedCorpus.from_texts(refs + hyps) if use_corpus else None
+    expected = [calculate_bleu(ref, hyp) for ref, hyp in pairs]
+
+    np.testing.assert_allclose(batch_bleu(refs, hyps, corpus=corpus), expected, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("use_corpus", [False, True])
+def test_batch_bleu_shards(use_corpus):
+    pairs = BLEU_PAIRS + random_bleu_pairs(2)
+    refs = [ref for ref, _ in pairs] + [None, "herr talman"]
+    hyps = [hyp for _, hyp in pairs] + ["herr talman", None]
+    corpus = TokenizedCorpus.from_texts(refs + hyps) if use_corpus else None
+
+    scores = batch_bleu(refs, hyps, corpus=corpus, shard_size=7, processes=2)
+    expected = [calculate_bleu(ref, hyp) for ref, hyp in pairs]
+    np.testing.assert_allclose(scores[:-2], expected, rtol=0, atol=1e-6)
+    assert np.isnan(scores[-2:]).all()
+
+
+def windowed_debate(seed=0):
+    """
+    A speech and a debate transcript with one word per second, containing a noisy copy of
+    the speech at 500 s and an exact copy at 1500 s.
+    """
+
+    rng = np.random.default_rng(seed)
+    speech = rng.integers(0, 100000, 100)
+    noisy = speech.copy()
+    noisy[rng.choice(100, 8, replace=False)] = rng.integers(0, 100000, 8)
+    debate = np.concatenate(
+        [rng.integers(0, 100000, 500), noisy, rng.integers(0, 100000, 900), speech, rng.integers(0, 100000, 400)]
+    )
+    word_times = np.arange(len(debate), dtype=np.float64)
+    return " ".join(f"w{i}" for i in speech), " ".join(f"w{i}" for i in debate), word_times
+
+
+def test_fuzzy_match_windowed():
+    speech, debate, word_times = windowed_debate()
+    full_match = contiguous_fuzzy_match(speech, debate, threshold=80)
+    assert full_match[:2] == (1500, 1599)
+
+    # Match inside the first window, the noisy copy where the metadata puts the speech
+    start_index, end_index, score = contiguous_fuzzy_match_windowed(speech, debate, word_times, 500, 100, threshold=80)
+    assert (start_index, end_index) == (500, 599)
+    assert 80 <= score < 100
+
+    # The window around 300 s doesn't contain a match, it's widened until it does
+    start_index, end_index, _ = contiguous_fuzzy_match_windowed(speech, debate, word_times, 300, 100, threshold=80)
+    assert (start_index, end_index) == (500, 599)
+
+    # Without a match within max_padding, the whole transcript is searched
+    match = contiguous_fuzzy_match_windowed(speech, debate, word_times, 300, 100, threshold=80, max_padding=120)
+    assert match == full_match
+
+    # Missing start/duration or word timestamps also fall back to the full search
+    for start, duration, times in [(np.nan, 100, word_times), (500, np.nan, word_times), (500, 100, None)]:
+        assert contiguous_fuzzy_match_windowed(speech, debate, times, start, duration, threshold=80) == full_match
+    assert contiguous_fuzzy_match_windowed(speech, debate, word_times[:-1], 500, 100, threshold=80) == full_match
+    assert contiguous_fuzzy_match_windowed(None, debate, word_times, 500, 100) == (None, None, None)
+
+
+def reference_word_indices(text, src_start, src_end, word_spans=None):
+    """
+    Character to word indices as computed before WordOffsets, with np.where over the spans.
+    """
+
+    if word_spans is None:
+        word_spans = np.array(list(TreebankWordTokenizer().span_tokenize(text)))
+    start_index = 0 if src_start == 0 else np.where(word_spans <= src_start)[0][-1]
+    end_index = len(word_spans) if src_end == len(text) else np.where(word_spans >= src_end)[0][0]
+    return start_index, end_index
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "herr talman jag yrkar bifall",
+        "Herr talman! Jag yrkar, i enlighet med motionen, bifall (till 2:a punkten).",
+        "fru  talman   jag yrkar    avslag",
+        "ja. nej? kanske... \"citat\" – och 3,5 procent",
+    ],
+)
+@pytest.mark.parametrize("whitespace", [False, True])
+def test_fuzzy_match_word_indices_match_reference(text, whitespace):
+    word_spans = get_whitespace_word_spans(text) if whitespace else None
+    # Every character offset, so also the word boundaries and the end of the text
+    alignments = []
+    expected = []
+    for src_start in range(len(text) + 1):
+        for src_end in range(src_start, len(text) + 1):
+            try:
+                expected.append(reference_word_indices(text, src_start, src_end, word_spans))
+            except IndexError:
+                continue
+            alignments.append(SimpleNamespace(src_start=src_start, src_end=src_end))
+
+    assert len(alignments) > 0
+    indices = [get_fuzzy_match_word_indices(text, alignment, word_spans) for alignment in alignments]
+    assert [tuple(map(int, index)) for index in indices] == [tuple(map(int, index)) for index in expected]
+    batch_indices = get_fuzzy_match_word_indices_batch(text, alignments, word_spans)
+    assert [tuple(map(int, index)) for index in batch_indices] == [tuple(map(int, index)) for index in expected]
+
+
+def test_shared_texts_pickle():
+    texts = ["herr talman", None, "", "åäö – ”citat”"]
+    shared_texts = SharedTexts(texts)
+    try:
+        state = pickle.dumps(shared_texts)
+        # Only the name of the block and the number of texts are pickled
+        assert len(state) < 200
+        attached = pickle.loads(state)
+        assert [attached[i] for i in range(len(attached))] == texts
+        # Unpickling again (the next task in a worker) reuses the attachment
+        attached_again = pickle.loads(state)
+        assert attached_again.shm is attached.shm
+        assert attached_again[3] == texts[3]
+
+        detach_shared_texts(keep=shared_texts.shm.name)
+        assert pickle.loads(state).shm is attached.shm
+        detach_shared_texts()
+        reattached = pickle.loads(state)
+        assert reattached.shm is not attached.shm
+        assert reattached[0] == texts[0]
+        reattached.close()
+    finally:
+        shared_texts.close()
+        shared_texts.unlink()
+
+
+def test_match_pool_reused_across_calls():
+    rng = np.random.default_rng(0)
+    pairs = [speech_in_debate(rng) for _ in range(6)]
+    df = pd.DataFrame(pairs, columns=["anftext_normalized", "anftext_inference"])
+    corpus = TokenizedCorpus.from_texts([text for pair in pairs for text in pair])
+    expected_ngram = contiguous_ngram_indices(df, "anftext_normalized", "anftext_inference", executor="thread")
+    expected_fuzzy = contiguous_fuzzy_indices(df, "anftext_normalized", "anftext_inference", executor="thread")
+
+    with MatchPool(processes=2, corpus=corpus) as pool:
+        for start, end in [(0, 2), (2, 5), (5, 6)]:
+            df_batch = df[start:end].reset_index(drop=True)
+            kwargs = {"executor": "shared_memory", "pool": pool}
+            ngram = contiguous_ngram_indices(df_batch, "anftext_normalized", "anftext_inference", **kwargs)
+            fuzzy = contiguous_fuzzy_indices(df_batch, "anftext_normalized", "anftext_inference", **kwargs)
+            assert ngram == expected_ngram[start:end]
+            assert fuzzy == expected_fuzzy[start:end]
+
+    assert contiguous_ngram_indices(df, "anftext_normalized", "anftext_inference", executor="shared_memory") == (
+        expected_ngram
+    )
+
+
+def test_match_texts_prefilter():
+    rng = np.random.default_rng(1)
+    pairs = [speech_in_debate(rng, vocab_size=2000) for _ in range(4)]
+    # Pairs without overlap, e.g. the wrong debate file
+    pairs += [(pairs[0][0], pairs[1][1]), (random_text(rng, 300, 2000), pairs[2][1])]
+    df = pd.DataFrame(pairs, columns=["anftext_normalized", "anftext_inference"], index=range(10, 16))
+
+    kwargs = {"metrics": ("ngram", "fuzzy"), "directions": ("forward",), "processes": 2}
+    expected = match_texts(df, "anftext_normalized", "anftext_inference", **kwargs)
+    result = match_texts(
+        df, "anftext_normalized", "anftext_inference", prefilter=MinHashSignatures(), min_similarity=0.2, **kwargs
+    )
+
+    assert result.index.tolist() == df.index.tolist()
+    assert result.dtypes.tolist() == expected.dtypes.tolist()
+    pd.testing.assert_frame_equal(result[:4], expected[:4])
+    assert result[4:].isna().all().all()
+    assert expected[:4].notna().all().all()
+
+
+def test_match_texts_alignment_dtypes():
+    rng = np.random.default_rng(2)
+    pairs = [speech_in_debate(rng) for _ in range(3)]
+    df = pd.DataFrame(pairs, columns=["anftext_normalized", "anftext_inference"])
+
+    result = match_texts(df, "anftext_normalized", "anftext_inference", metrics=("alignment",), processes=2)
+
+    assert result["align_band_exceeded"].dtype == "boolean"
+    assert result["align_score"].dtype == "Float64"
+    assert result.filter(regex="^(start|end)_align").dtypes.eq("Int64").all()
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from src.minhash import MinHashSignatures, get_prefilter_recall, get_shingle_hashes
+
+
+def overlapping_pair(rng, nr_shared, nr_in, nr_out):
+    """
+    Two texts of unique words sharing a run of nr_shared words, with nr_in and nr_out
+    other words around it.
+    """
+
+    words = [f"w{i}" for i in rng.permutation(nr_shared + nr_in + nr_out)]
+    shared, only_in, only_out = words[:nr_shared], words[nr_shared : nr_shared + nr_in], words[nr_shared + nr_in :]
+    text_in = " ".join(only_in[: nr_in // 2] + shared + only_in[nr_in // 2 :])
+    text_out = " ".join(only_out[: nr_out // 2] + shared + only_out[nr_out // 2 :])
+    return text_in, text_out
+
+
+def exact_similarities(text_in, text_out, shingle_size=3):
+    shingles_in = set(get_shingle_hashes(text_in, shingle_size).tolist())
+    shingles_out = set(get_shingle_hashes(text_out, shingle_size).tolist())
+    shared = len(shingles_in & shingles_out)
+    return shared / len(shingles_in | shingles_out), shared / len(shingles_in)
+
+
+def test_estimates_match_exact_similarities():
+    rng = np.random.default_rng(0)
+    # From no overlap to a speech fully contained in a much longer debate transcript
+    pairs = [
+        overlapping_pair(rng, nr_shared, nr_in, nr_out)
+        for nr_shared, nr_in, nr_out in [(0, 200, 200), (50, 150, 200), (150, 50, 100), (200, 0, 2000), (300, 0, 0)]
+    ]
+    texts_in, texts_out = [pair[0] for pair in pairs], [pair[1] for pair in pairs]
+    minhash = MinHashSignatures(num_perm=256)
+
+    jaccard, containment = np.array([exact_similarities(*pair) for pair in pairs]).T
+    np.testing.assert_allclose(minhash.estimate_jaccard(texts_in, texts_out), jaccard, atol=0.1)
+    np.testing.assert_allclose(minhash.estimate_containment(texts_in, texts_out), containment, atol=0.1)
+    # Containment is still high where the Jaccard similarity is too small to be useful
+    assert jaccard[3] < 0.1 and containment[3] == 1
+
+    keep = minhash.filter_pairs(texts_in, texts_out, min_similarity=0.5)
+    assert keep.tolist() == [False, False, True, True, True]
+    with pytest.raises(ValueError):
+        minhash.filter_pairs(texts_in, texts_out, measure="cosine")
+
+
+def test_empty_and_short_texts():
+    minhash = MinHashSignatures()
+    assert len(get_shingle_hashes("")) == 0
+    # Texts shorter than the shingle size get a single shingle of all their words
+    assert len(get_shingle_hashes("herr talman")) == 1
+
+    texts_in = ["", "herr talman", "herr talman", "herr talman jag yrkar", None, "herr talman"]
+    texts_out = ["herr talman", "", "herr talman", "fru talman jag yrkar", "herr talman", None]
+    jaccard = minhash.estimate_jaccard(texts_in, texts_out)
+    containment = minhash.estimate_containment(texts_in, texts_out)
+
+    np.testing.assert_array_equal(jaccard[:3], [0, 0, 1])
+    np.testing.assert_array_equal(containment[:3], [0, 0, 1])
+    # One of two shingles shared
+    assert jaccard[3] == pytest.approx(1 / 3, abs=0.15)
+    assert containment[3] == pytest.approx(1 / 2, abs=0.15)
+    assert np.isnan(jaccard[4:]).all() and np.isnan(containment[4:]).all()
+    assert minhash.filter_pairs(texts_in, texts_out, min_similarity=0).tolist() == [True] * 4 + [False] * 2
+
+
+def test_save_load(tmp_path):
+    rng = np.random.default_rng(1)
+    pairs = [overlapping_pair(rng, 40, 30, 300) for _ in range(5)]
+    texts_in, texts_out = [pair[0] for pair in pairs] + [""], [pair[1] for pair in pairs] + ["ja"]
+    minhash = MinHashSignatures(num_perm=64, shingle_size=2, seed=3)
+    jaccard = minhash.estimate_jaccard(texts_in, texts_out)
+
+    minhash.save(str(tmp_path))
+    loaded = MinHashSignatures.load(str(tmp_path))
+
+    assert (loaded.num_perm, loaded.shingle_size, loaded.seed) == (64, 2, 3)
+    np.testing.assert_array_equal(loaded.a, minhash.a)
+    np.testing.assert_array_equal(loaded.b, minhash.b)
+    assert loaded.signatures.keys() == minhash.signatures.keys()
+    for key in minhash.signatures:
+        np.testing.assert_array_equal(loaded.signatures[key], minhash.signatures[key])
+        np.testing.assert_array_equal(loaded.samples[key], minhash.samples[key])
+        assert loaded.nr_shingles[key] == minhash.nr_shingles[key]
+
+    # Loaded signatures give the same estimates without being computed again
+    assert all(text in loaded for text in texts_in)
+    np.testing.assert_array_equal(loaded.estimate_jaccard(texts_in, texts_out), jaccard)
+    np.testing.assert_array_equal(
+        loaded.estimate_containment(texts_in, texts_out), minhash.estimate_containment(texts_in, texts_out)
+    )
+
+
+def test_prefilter_recall():
+    keep = np.array([True, False, True, False, True])
+    matches = [(1, 5, 90.0), (None, None, None), None, (3, 8, 70.0), (None, None)]
+
+    assert get_prefilter_recall(keep, matches) == {
+        "pairs": 5,
+        "filtered": 2,
+        "matched": 2,
+        "matched_filtered": 1,
+        "recall": 0.5,
+    }
+    assert get_prefilter_recall(keep, [None] * 5)["recall"] is None
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from src.schema import get_filters, read_metadata, write_metadata
+
+
+def get_metadata():
+    # Neither sorted by year nor by dokid, as after a merge
+    return pd.DataFrame(
+        {
+            "dokid": ["H2", "H1", "H3", "H1", "H2", "H4"],
+            "anforande_nummer": [2, 5, 1, 4, 1, 3],
+            "debatedate": ["2020-03-01", "2019-05-01", "2019-01-10", "2019-05-01", "2020-03-01", "2021-12-31"],
+            "text": ["a", "b", "c", "d", "e", "f"],
+        }
+    )
+
+
+def test_write_read_keeps_row_order(tmp_path):
+    df = get_metadata()
+    path = str(tmp_path / "metadata.parquet")
+    write_metadata(df, path)
+
+    df_read = read_metadata(path, compact=False)
+    assert df_read.columns.tolist() == df.columns.tolist()
+    assert df_read["text"].tolist() == df["text"].tolist()
+    assert (df_read["debatedate"] == pd.to_datetime(df["debatedate"])).all()
+
+    assert read_metadata(path, columns=["text"])["text"].tolist() == df["text"].tolist()
+    assert read_metadata(path, columns=["text", "_row_nr"])["_row_nr"].tolist() == list(range(len(df)))
+
+    # Date filters work on dates that were given as strings
+    df_2019 = read_metadata(path, filters=get_filters("2019-01-01", "2020-01-01"), compact=False)
+    assert df_2019["text"].tolist() == ["b", "c", "d"]
+
+    # Reading and writing back again gives the same dataset
+    write_metadata(df_read, path)
+    pd.testing.assert_frame_equal(read_metadata(path, compact=False), df_read)
+
+
+def test_write_single_file(tmp_path):
+    df = get_metadata()
+    path = str(tmp_path / "metadata.parquet")
+    # Replaces a dataset written earlier
+    write_metadata(df, path)
+    write_metadata(read_metadata(path, compact=False), path, partitioned=False)
+
+    # Plain pd.read_parquet gets the rows of df without the year and row number columns
+    df_read = pd.read_parquet(path)
+    assert df_read.columns.tolist() == df.columns.tolist()
+    assert df_read["text"].tolist() == df["text"].tolist()
+    pd.testing.assert_frame_equal(read_metadata(path, compact=False), df_read)
+
+    df_2019 = read_metadata(path, filters=get_filters("2019-01-01", "2020-01-01"), compact=False)
+    assert df_2019["text"].tolist() == ["b", "c", "d"]
+
+
+def test_read_single_file(tmp_path):
+    # Files from before partitioning are read as they are
+    df = get_metadata().assign(year=2000)
+    path = str(tmp_path / "metadata.parquet")
+    df.to_parquet(path, index=False)
+    pd.testing.assert_frame_equal(read_metadata(path, compact=False), df)
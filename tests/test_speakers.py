@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.speakers import fill_with_speaker_mode, join_person_records
+
+COLUMNS = ["Parti", "Valkrets"]
+
+
+def reference_join(df, df_person, columns=COLUMNS):
+    """
+    Brute force interval lookup: the records of the speaker valid on the date of each speech,
+    latest non-missing value by From, else the first non-missing value of the person.
+    """
+
+    df_person = df_person.sort_values("From", na_position="first", kind="stable")
+    rows = []
+    for person_id, date in zip(df["intressent_id"], df["debatedate"]):
+        records = df_person[df_person["Id"] == person_id]
+        valid = records[
+            (records["From"].isna() | (records["From"] <= date)) & (records["Tom"].isna() | (date <= records["Tom"]))
+        ]
+        row = {}
+        for column in columns:
+            values = valid[column].dropna()
+            if len(values) == 0:
+                values = df_person[df_person["Id"] == person_id].sort_index()[column].dropna()[:1]
+            row[column] = values.iloc[-1] if len(values) > 0 else np.nan
+        rows.append(row)
+    return pd.concat([df.reset_index(drop=True), pd.DataFrame(rows, columns=columns)], axis=1)
+
+
+def random_person_records(rng, nr_persons=6):
+    records = []
+    for person_id in range(nr_persons):
+        for _ in range(rng.integers(1, 5)):
+            start = pd.Timestamp("2000-01-01") + pd.Timedelta(days=int(rng.integers(0, 7000)))
+            # Ongoing assignments have no end date
+            end = pd.NaT if rng.random() < 0.3 else start + pd.Timedelta(days=int(rng.integers(0, 3000)))
+            records.append(
+                {
+                    "Id": f"id{person_id}",
+                    "From": start,
+                    "Tom": end,
+                    "Parti": rng.choice(["S", "M", "V", None]),
+                    "Valkrets": rng.choice(["Stockholm", "Skåne", "Uppsala", None]),
+                }
+            )
+    return pd.DataFrame(records)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_join_person_records_matches_interval_lookup(seed):
+    rng = np.random.default_rng(seed)
+    df_person = random_person_records(rng)
+    nr_speeches = 300
+    df = pd.DataFrame(
+        {
+            # Also speakers without records and speeches without speaker id
+            "intressent_id": rng.choice([f"id{i}" for i in range(8)] + [None], nr_speeches),
+            # Also dates before and after all records
+            "debatedate": pd.Timestamp("1998-01-01") + pd.to_timedelta(rng.integers(0, 11000, nr_speeches), unit="D"),
+            "anforande_nummer": np.arange(nr_speeches),
+        }
+    )
+
+    result = join_person_records(df, df_person, columns=COLUMNS)
+    expected = reference_join(df, df_person)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_join_person_records_overlapping_and_ongoing():
+    df_person = pd.DataFrame(
+        {
+            "Id": ["a", "a", "a", "b"],
+            "From": pd.to_datetime(["2000-01-01", "2005-01-01", "2004-01-01", "2010-01-01"]),
+            "Tom": pd.to_datetime(["2010-12-31", None, "2006-01-01", "2012-01-01"]),
+            "Parti": ["S", "V", None, "M"],
+            "Valkrets": ["Skåne", None, "Uppsala", "Stockholm"],
+        }
+    )
+    df = pd.DataFrame(
+        {
+            "intressent_id": ["a", "a", "a", "a", "b", "c", None],
+            "debatedate": pd.to_datetime(
+                ["2001-06-01", "2005-06-01", "2008-06-01", "2020-06-01", "1990-01-01", "2008-01-01", "2008-01-01"]
+            ),
+        }
+    )
+
+    result = join_person_records(df, df_person, columns=COLUMNS)
+    # Overlapping records: latest non-missing value by From. Ongoing (Tom missing) records
+    # are valid until today, dates outside all records get the first value of the person.
+    assert result["Parti"].tolist()[:5] == ["S", "V", "V", "V", "M"]
+    assert result["Valkrets"].tolist()[:5] == ["Skåne", "Uppsala", "Skåne", "Skåne", "Stockholm"]
+    # Unknown or missing speakers get missing values
+    assert result[COLUMNS][5:].isna().all().all()
+
+
+def test_fill_with_speaker_mode_matches_apply():
+    rng = np.random.default_rng(0)
+    nr_speeches = 500
+    df = pd.DataFrame(
+        {
+            "speaker": rng.choice([f"speaker {i}" for i in range(20)] + [None], nr_speeches),
+            "party": rng.choice(["S", "M", "V", None, None], nr_speeches),
+            "gender": rng.choice(["male", "female", None], nr_speeches),
+            # Mostly missing, so that some speakers have no value at all
+            "birth_year": rng.choice([1950.0, 1960.0, 1970.0] + [np.nan] * 20, nr_speeches),
+        }
+    )
+    # Ties go to the smallest value, like mode()
+    df.loc[len(df)] = ["tie", "S", None, 1970.0]
+    df.loc[len(df)] = ["tie", "M", "male", 1950.0]
+    df.loc[len(df)] = ["tie", None, "female", None]
+
+    columns = ["party", "gender", "birth_year"]
+    result = fill_with_speaker_mode(df.copy(), columns)
+
+    has_speaker = df["speaker"].notna()
+    expected = (
+        df[has_speaker].groupby("speaker", group_keys=False)[columns].apply(lambda x: x.fillna(x.mode().iloc[0]))
+    )
+    pd.testing.assert_frame_equal(result.loc[expected.index, columns], expected)
+    # Speeches without speaker are left as they are
+    pd.testing.assert_frame_equal(result[~has_speaker], df[~has_speaker])
+    assert result.loc[df["speaker"] == "tie", "party"].tolist() == ["S", "M", "M"]
+    assert result.loc[df["speaker"] == "tie", "birth_year"].tolist() == [1970.0, 1950.0, 1950.0]